@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Synthetic catalog generator for benchmarking the Insight Engine
+Fills Category, SubCategory, Product, ProductAttribute, PriceHistory and
+AggregatedReview at a configurable scale using chunked bulk inserts, so
+10M-product catalogs can be generated without holding them in memory.
+
+Usage:
+    python benchmarks/generate_catalog.py --products 10000 --years 2 \\
+        --database-url sqlite:///benchmark.db
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+CATEGORIES = {
+    'Technology': ['AI Tools', 'Productivity', 'Creative'],
+    'Appliances': ['Kitchen', 'Laundry', 'Small Appliances', 'Luxury Appliances'],
+    'Music': ['Guitars', 'Keyboards', 'Turntables', 'Audio Gear'],
+    'Transport': ['Scooters', 'Electric Skateboards', 'E-Bikes', 'Electric Cars'],
+    'Gaming': ['Gaming PCs', 'Consoles', 'Peripherals', 'Mobile Gaming'],
+    'Tech Products': ['Pocket Tech', 'Desk Tech', 'Tech Toys', 'Cool Gadgets'],
+    'Fitness': ['Home Gym', 'Wearables', 'Supplements', 'Outdoor Gear'],
+}
+
+ATTRIBUTE_VALUES = {
+    'Pricing Model': ['Free', 'Freemium', 'Subscription', 'One-time', 'Enterprise'],
+    'Primary Use Case': ['Content Creation', 'Coding', 'Research', 'Design', 'Cooking', 'Cleaning'],
+    'Style Tags': ['Modern, Sleek', 'Classic', 'Industrial', 'Minimalist', 'Professional'],
+    'Design Style': ['Modern', 'Professional', 'Traditional', 'Transitional'],
+    'Energy Rating': ['Energy Star', 'Energy Star Most Efficient', 'Standard'],
+    'Warranty': ['1 Year', '2 Years', '5 Years', '10 Years'],
+    'Finish Options': ['Stainless Steel', 'Black Stainless', 'Panel Ready', 'White'],
+}
+
+RETAILERS = ['Amazon', 'Best Buy', 'AJ Madison', 'Home Depot', 'Lowes', 'Direct', 'Costco', 'Ferguson']
+NAME_WORDS = ['Pro', 'Max', 'Ultra', 'Studio', 'Series', 'Elite', 'Prime', 'Plus', 'Air', 'One']
+SNIPPET_WORDS = ['reliable', 'quiet', 'fast', 'intuitive', 'premium', 'durable', 'sleek', 'powerful',
+                 'overpriced', 'buggy', 'efficient', 'versatile', 'noisy', 'elegant', 'accurate']
+
+
+def _chunks(total, size):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+def _ensure_taxonomy(db, Category, SubCategory, subcategory_limit):
+    """Create categories/subcategories that don't exist yet and return subcategory ids"""
+    subcategory_ids = []
+    for order, (category_name, subcategory_names) in enumerate(CATEGORIES.items(), start=1):
+        category = Category.query.filter_by(name=category_name).first()
+        if category is None:
+            category = Category(name=category_name, description=f'{category_name} products',
+                                status='Live', display_order=order)
+            db.session.add(category)
+            db.session.flush()
+        for sub_order, subcategory_name in enumerate(subcategory_names, start=1):
+            subcategory = SubCategory.query.filter_by(name=subcategory_name).first()
+            if subcategory is None:
+                subcategory = SubCategory(name=subcategory_name, description=f'{subcategory_name} products',
+                                          category_id=category.id, status='Live', display_order=sub_order)
+                db.session.add(subcategory)
+                db.session.flush()
+            subcategory_ids.append(subcategory.id)
+    db.session.commit()
+    return subcategory_ids[:subcategory_limit] if subcategory_limit else subcategory_ids
+
+
+def generate_catalog(app, products=10000, years=2, points_per_year=12, retailers_per_product=2,
+                     attributes_per_product=5, review_ratio=0.8, brands=500, subcategories=None,
+                     seed=42, chunk_size=5000, echo=print):
+    """Append a synthetic catalog to the app's database and return row counts"""
+    from sqlalchemy import func, insert
+    from project import db
+    from project.models.models import (
+        Category, SubCategory, Product, ProductAttribute, PriceHistory, AggregatedReview
+    )
+
+    rnd = random.Random(seed)
+    brand_names = [f'Brand {i:04d}' for i in range(brands)]
+    attribute_keys = list(ATTRIBUTE_VALUES)
+    today = date.today()
+    start_date = today - timedelta(days=365 * years)
+    step_days = max(1, 365 // max(1, points_per_year))
+    counts = {'products': 0, 'product_attributes': 0, 'price_history': 0, 'aggregated_reviews': 0}
+
+    with app.app_context():
+        db.create_all()
+        subcategory_ids = _ensure_taxonomy(db, Category, SubCategory, subcategories)
+        next_id = (db.session.query(func.max(Product.id)).scalar() or 0) + 1
+        started = time.perf_counter()
+
+        for offset, size in _chunks(products, chunk_size):
+            now = datetime.utcnow()
+            product_rows, attribute_rows, price_rows, review_rows = [], [], [], []
+
+            for i in range(size):
+                product_id = next_id + offset + i
+                brand = rnd.choice(brand_names)
+                product_rows.append({
+                    'id': product_id,
+                    'name': f'{brand} {rnd.choice(NAME_WORDS)} {product_id}',
+                    'brand': brand,
+                    'short_description': f'Synthetic product {product_id}',
+                    'insight_snippet': ' '.join(rnd.choices(SNIPPET_WORDS, k=8)),
+                    'image_url': f'https://example.com/products/{product_id}.png',
+                    'subcategory_id': rnd.choice(subcategory_ids),
+                    'created_at': now,
+                    'updated_at': now,
+                })
+
+                base_price = round(rnd.lognormvariate(7, 1.2), 2)
+                attribute_rows.append({'product_id': product_id, 'key': 'MSRP', 'value': str(int(base_price)),
+                                       'created_at': now, 'updated_at': now})
+                for key in rnd.sample(attribute_keys, k=min(attributes_per_product - 1, len(attribute_keys))):
+                    attribute_rows.append({'product_id': product_id, 'key': key,
+                                           'value': rnd.choice(ATTRIBUTE_VALUES[key]),
+                                           'created_at': now, 'updated_at': now})
+
+                for retailer in rnd.sample(RETAILERS, k=min(retailers_per_product, len(RETAILERS))):
+                    price = base_price
+                    recorded = start_date
+                    while recorded <= today:
+                        # Random walk with occasional sales
+                        price = max(1.0, price * rnd.uniform(0.97, 1.03))
+                        sale = 0.8 if rnd.random() < 0.05 else 1.0
+                        price_rows.append({'product_id': product_id, 'retailer_name': retailer,
+                                           'price': round(price * sale, 2), 'date_recorded': recorded,
+                                           'created_at': now, 'updated_at': now})
+                        recorded += timedelta(days=step_days)
+
+                if rnd.random() < review_ratio:
+                    scores = [round(min(5.0, max(1.0, rnd.gauss(3.9, 0.6))), 1) for _ in range(7)]
+                    review_rows.append({
+                        'product_id': product_id,
+                        'overall_rating': scores[0],
+                        'ease_of_use_score': scores[1],
+                        'feature_score': scores[2],
+                        'value_for_money_score': scores[3],
+                        'design_rating': scores[4],
+                        'functionality_rating': scores[5],
+                        'reliability_rating': scores[6],
+                        'positive_sentiment_summary': 'Users praise the build quality.',
+                        'negative_sentiment_summary': 'Some users report minor issues.',
+                        'key_insights': 'Synthetic insight.',
+                        'common_complaints': 'Price',
+                        'standout_features': 'Design',
+                        'total_reviews_analyzed': rnd.randint(5, 5000),
+                        'last_updated': now,
+                        'created_at': now,
+                        'updated_at': now,
+                    })
+
+            db.session.execute(insert(Product), product_rows)
+            db.session.execute(insert(ProductAttribute), attribute_rows)
+            db.session.execute(insert(PriceHistory), price_rows)
+            if review_rows:
+                db.session.execute(insert(AggregatedReview), review_rows)
+            db.session.commit()
+
+            counts['products'] += len(product_rows)
+            counts['product_attributes'] += len(attribute_rows)
+            counts['price_history'] += len(price_rows)
+            counts['aggregated_reviews'] += len(review_rows)
+            elapsed = time.perf_counter() - started
+            echo(f"  {counts['products']:,}/{products:,} products ({counts['products'] / elapsed:,.0f}/s)")
+
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic product catalog')
+    parser.add_argument('--products', type=int, default=10000, help='Number of products to create')
+    parser.add_argument('--years', type=int, default=2, help='Years of price history per product')
+    parser.add_argument('--points-per-year', type=int, default=12, help='Price observations per retailer per year')
+    parser.add_argument('--retailers', type=int, default=2, help='Retailers per product')
+    parser.add_argument('--attributes', type=int, default=5, help='Attributes per product')
+    parser.add_argument('--review-ratio', type=float, default=0.8, help='Fraction of products with an aggregated review')
+    parser.add_argument('--brands', type=int, default=500, help='Number of distinct brands')
+    parser.add_argument('--subcategories', type=int, default=None, help='Limit products to the first N subcategories')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for reproducible catalogs')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Products per bulk insert batch')
+    parser.add_argument('--database-url', default=None, help='Target database (defaults to DATABASE_URL)')
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+
+    from project import create_app
+    app = create_app('production')
+
+    print(f"📊 Generating {args.products:,} products into {app.config['SQLALCHEMY_DATABASE_URI']}...")
+    started = time.perf_counter()
+    counts = generate_catalog(
+        app,
+        products=args.products,
+        years=args.years,
+        points_per_year=args.points_per_year,
+        retailers_per_product=args.retailers,
+        attributes_per_product=args.attributes,
+        review_ratio=args.review_ratio,
+        brands=args.brands,
+        subcategories=args.subcategories,
+        seed=args.seed,
+        chunk_size=args.chunk_size,
+    )
+    print(f"✅ Done in {time.perf_counter() - started:.1f}s: " +
+          ', '.join(f'{table}={count:,}' for table, count in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
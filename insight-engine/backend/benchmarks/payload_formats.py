@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Payload size and encode-time benchmark for the product API response formats
+Fetches real product list/detail payloads and compares plain JSON with the
+columnar JSON and MessagePack encodings, each raw and gzip/brotli compressed.
+
+Usage:
+    python benchmarks/generate_catalog.py --products 10000 --database-url sqlite:///benchmark.db
+    python benchmarks/payload_formats.py --database-url sqlite:///benchmark.db
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+PAYLOADS = [
+    ('products.list_100', '/api/products?per_page=100&format=json'),
+    ('products.list_20', '/api/products?format=json'),
+    ('products.detail', '/api/products/{product_id}?format=json'),
+]
+
+
+def _median_ms(fn, repeat):
+    """Run fn() `repeat` times; return (median milliseconds, last result)"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 3), result
+
+
+def measure(app, payload, repeat):
+    """Bytes and encode time for every format x compression combination of one payload"""
+    from project.api.compression import _brotli, compress
+    from project.api.formats import COLUMNAR_MIMETYPE, MSGPACK_MIMETYPE, encode_payload, msgpack_available
+
+    encoders = {'json': lambda: app.json.dumps(payload).encode('utf-8')}
+    encoders['columnar'] = lambda: encode_payload(payload, COLUMNAR_MIMETYPE)
+    if msgpack_available():
+        encoders['msgpack'] = lambda: encode_payload(payload, MSGPACK_MIMETYPE)
+
+    codings = ['gzip'] + (['br'] if _brotli() is not None else [])
+    gzip_level = app.config['COMPRESS_GZIP_LEVEL']
+    brotli_quality = app.config['COMPRESS_BROTLI_QUALITY']
+
+    results = {}
+    for name, encoder in encoders.items():
+        encode_ms, body = _median_ms(encoder, repeat)
+        row = {'bytes': len(body), 'encode_ms': encode_ms}
+        for coding in codings:
+            compress_ms, compressed = _median_ms(
+                lambda: compress(body, coding, gzip_level, brotli_quality), repeat
+            )
+            row[f'{coding}_bytes'] = len(compressed)
+            row[f'{coding}_ms'] = round(encode_ms + compress_ms, 3)
+        results[name] = row
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare product API payload formats')
+    parser.add_argument('--database-url', default=None, help='Database to read payloads from (defaults to DATABASE_URL)')
+    parser.add_argument('--repeat', type=int, default=20, help='Encodings per measurement (median is reported)')
+    parser.add_argument('--output', default=None, help='Write results JSON to this path')
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('QUERY_LOG_ENABLED', 'false')
+    # Every benchmark request comes from one client, far above any per-client limit
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+
+    from project import create_app, db
+    from project.models.models import Product
+    app = create_app('production')
+
+    with app.app_context():
+        product_id = db.session.query(Product.id).order_by(Product.id).limit(1).scalar()
+    if product_id is None:
+        print('❌ No products in the database; run benchmarks/generate_catalog.py first')
+        return 1
+
+    client = app.test_client()
+    results = {}
+    for name, template in PAYLOADS:
+        response = client.get(template.format(product_id=product_id), headers={'Accept-Encoding': 'identity'})
+        if response.status_code != 200:
+            print(f'  {name}: HTTP {response.status_code}, skipped')
+            continue
+        results[name] = measure(app, json.loads(response.data), args.repeat)
+
+    for name, formats in results.items():
+        baseline = formats['json']['bytes']
+        print(f'📦 {name}')
+        for fmt, row in formats.items():
+            compressed = '  '.join(
+                f"{coding}={row[f'{coding}_bytes']:>7}B/{row[f'{coding}_ms']:.2f}ms"
+                for coding in ('gzip', 'br') if f'{coding}_bytes' in row
+            )
+            print(f"  {fmt:<9} {row['bytes']:>8}B ({100 * row['bytes'] / baseline:5.1f}%) "
+                  f"encode={row['encode_ms']:.2f}ms  {compressed}")
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+        print(f"📝 Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Endpoint benchmark suite for the Insight Engine API
+Measures p50/p95/p99 latency and throughput for the read endpoints of every
+registered blueprint, writes the results as JSON and optionally compares them
+against a stored baseline.
+
+Usage:
+    python benchmarks/generate_catalog.py --products 10000 --database-url sqlite:///benchmark.db
+    python benchmarks/run_benchmarks.py --database-url sqlite:///benchmark.db \\
+        --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# (name, path template, JSON body). Templates may use {product_id}, {other_product_id},
+# {subcategory}, {page}, {prefix} and {job_id}; endpoints with a body are POSTed.
+# The legacy ai_tools/luxury_appliances blueprints are not registered and are
+# not benchmarked; their data is served by the products endpoints.
+QUERY_BODY = {
+    'categories': {'fields': ['id', 'name'], 'subcategories': {'fields': ['name', 'slug', 'product_count']}},
+    'products': {'root': 'products', 'args': {'per_page': 12}, 'fields': ['name', 'overall_rating'],
+                 'subcategory': {'category': {'fields': ['name']}}},
+}
+ENDPOINTS = [
+    # Products blueprint
+    ('products.list', '/api/products', None),
+    ('products.list_subcategory', '/api/products?subcategory={subcategory}&page={page}', None),
+    ('products.list_max_page', '/api/products?per_page=100&page={page}', None),
+    ('products.detail', '/api/products/{product_id}', None),
+    ('products.subcategories', '/api/products/subcategories', None),
+    ('products.categories', '/api/products/categories', None),
+    ('products.insights', '/api/products/insights?subcategory={subcategory}', None),
+    ('products.analytics', '/api/products/analytics?subcategory={subcategory}', None),
+    ('products.similar', '/api/products/{product_id}/similar', None),  # Needs `flask similarity build`
+    ('products.compare', '/api/products/compare?ids={product_id},{other_product_id}', None),
+    ('products.suggest', '/api/products/suggest?q={prefix}', None),
+    ('products.price_alerts', '/api/products/price-alerts', None),
+    # Query, change feed and jobs blueprints
+    ('query.batched', '/api/query', QUERY_BODY),
+    ('changes.feed', '/api/changes?since=0', None),
+    ('jobs.status', '/api/jobs/{job_id}', None),  # Only when the database holds finished jobs
+    ('jobs.events', '/api/jobs/{job_id}/events', None),
+]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def _is_routed(app, path, method):
+    adapter = app.url_map.bind('localhost')
+    try:
+        adapter.match(path.split('?')[0], method=method)
+        return True
+    except Exception:
+        return False
+
+
+def _sample_context(app, rnd):
+    """Collect ids and slugs used to fill endpoint templates"""
+    from sqlalchemy import func
+    from project import db
+    from project.api.products import subcategory_name_from_slug
+    from project.models.models import Job, Product, SubCategory
+
+    with app.app_context():
+        max_id = db.session.query(func.max(Product.id)).scalar() or 1
+        total = db.session.query(func.count(Product.id)).scalar() or 0
+        # Random ids that exist, so detail and compare requests do not measure 404s
+        candidates = sorted({rnd.randint(1, max_id) for _ in range(1000)})
+        existing = {product_id for (product_id,) in
+                    db.session.query(Product.id).filter(Product.id.in_(candidates))}
+        subcategory_names = [name for (name,) in
+                             db.session.query(SubCategory.name).filter(SubCategory.products.any())]
+        # Names the slug lookup cannot map back (e.g. 'Gaming PCs') would only measure 404s
+        slugs = [name.lower().replace(' ', '-') for name in subcategory_names
+                 if subcategory_name_from_slug(name.lower().replace(' ', '-')) == name]
+        names = [name for (name,) in db.session.query(Product.name).order_by(func.random()).limit(200)]
+        job_ids = [job_id for (job_id,) in
+                   db.session.query(Job.id).filter(Job.status.in_(Job.TERMINAL_STATUSES)).limit(1000)]
+    pages = max(1, total // 20)
+    return {
+        'product_ids': [product_id for product_id in candidates if product_id in existing] or [1],
+        'subcategories': slugs or ['ai-tools'],
+        'prefixes': [name[:3] for name in names if len(name) >= 3] or ['a'],
+        'job_ids': job_ids,
+        'pages': pages,
+        'total_products': total,
+    }
+
+
+def _render(template, context, rnd):
+    product_ids = context['product_ids']
+    # Two different products: compare rejects a repeated id
+    product_id, other_product_id = rnd.sample(product_ids, 2) if len(product_ids) > 1 else product_ids * 2
+    return template.format(
+        product_id=product_id,
+        other_product_id=other_product_id,
+        subcategory=rnd.choice(context['subcategories']),
+        page=rnd.randint(1, min(context['pages'], 50)),
+        prefix=rnd.choice(context['prefixes']),
+        job_id=rnd.choice(context['job_ids']) if context['job_ids'] else '{job_id}',
+    )
+
+
+def _run_endpoint(app, template, body, context, requests, warmup, concurrency, seed):
+    rnd = random.Random(seed)
+    paths = [_render(template, context, rnd) for _ in range(warmup + requests)]
+    client = app.test_client()
+    for path in paths[:warmup]:
+        client.open(path, method='POST' if body else 'GET', json=body).close()
+
+    def worker(chunk):
+        local_client = app.test_client()
+        timings, errors = [], 0
+        for path in chunk:
+            started = time.perf_counter()
+            response = local_client.open(path, method='POST' if body else 'GET', json=body)
+            response.get_data()
+            response.close()  # Releases streamed responses, e.g. a job events stream slot
+            timings.append(time.perf_counter() - started)
+            if not 200 <= response.status_code < 300:
+                errors += 1  # A 4xx or 503 is not the response being measured
+        return timings, errors
+
+    measured = paths[warmup:]
+    chunks = [measured[i::concurrency] for i in range(concurrency)]
+    started = time.perf_counter()
+    if concurrency == 1:
+        results = [worker(chunks[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(worker, chunks))
+    wall = time.perf_counter() - started
+
+    timings = sorted(t for chunk_timings, _ in results for t in chunk_timings)
+    errors = sum(e for _, e in results)
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+        'throughput_rps': round(len(timings) / wall, 1) if wall else None,
+    }
+
+
+def run_suite(app, requests=200, warmup=20, concurrency=1, only=None, seed=42, echo=print):
+    """
+    Benchmark the selected endpoints and return a results document
+
+    Raises ValueError before measuring anything when an endpoint is not
+    routed, so a renamed or unregistered route cannot silently drop out of
+    the results. Job endpoints are skipped while there are no finished jobs
+    to look up.
+    """
+    rnd = random.Random(seed)
+    context = _sample_context(app, rnd)
+    selected = [(name, template, body) for name, template, body in ENDPOINTS
+                if not only or any(name.startswith(prefix) for prefix in only)]
+    unrouted = [name for name, template, body in selected
+                if not _is_routed(app, _render(template, context, rnd), 'POST' if body else 'GET')]
+    if unrouted:
+        raise ValueError(f"Not routed in this app: {', '.join(unrouted)}")
+
+    results, skipped = {}, []
+    for name, template, body in selected:
+        if '{job_id}' in template and not context['job_ids']:
+            skipped.append(name)
+            continue
+        results[name] = _run_endpoint(app, template, body, context, requests, warmup, concurrency, seed)
+        r = results[name]
+        echo(f"  {name:<30} p50={r['p50_ms']:>8.2f}ms p99={r['p99_ms']:>8.2f}ms "
+             f"{r['throughput_rps']:>8.1f} req/s errors={r['errors']}")
+
+    if skipped:
+        echo(f"  skipped (no finished jobs in the database): {', '.join(skipped)}")
+
+    return {
+        'meta': {
+            'generated_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': app.config['SQLALCHEMY_DATABASE_URI'].split('://')[0],
+            'products': context['total_products'],
+            'requests_per_endpoint': requests,
+            'concurrency': concurrency,
+        },
+        'results': results,
+        'skipped': skipped,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """
+    Return a list of human-readable regressions against the baseline
+
+    An endpoint measured now but missing from the baseline is reported too,
+    as is any endpoint answering more non-2xx responses than it did.
+    """
+    regressions = []
+    for name, now in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            regressions.append(f"{name}: not in the baseline; record it with --update-baseline")
+            continue
+        if now['errors'] > base.get('errors', 0):
+            regressions.append(f"{name} errors: {base.get('errors', 0)} -> {now['errors']} non-2xx responses")
+        for metric in ('p50_ms', 'p99_ms'):
+            if base.get(metric) and now[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{name} {metric}: {base[metric]:.2f}ms -> {now[metric]:.2f}ms "
+                                   f"(+{(now[metric] / base[metric] - 1) * 100:.0f}%)")
+        if base.get('throughput_rps') and now['throughput_rps'] < base['throughput_rps'] / (1 + tolerance):
+            regressions.append(f"{name} throughput: {base['throughput_rps']:.1f} -> {now['throughput_rps']:.1f} req/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Insight Engine API endpoints')
+    parser.add_argument('--database-url', default=None, help='Database to benchmark (defaults to DATABASE_URL)')
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=20, help='Warm-up requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=1, help='Concurrent client threads')
+    parser.add_argument('--only', action='append', help='Only run endpoints with this name prefix (repeatable)')
+    parser.add_argument('--output', default=None, help='Write results JSON to this path')
+    parser.add_argument('--baseline', default=None, help=f'Compare against a baseline JSON (e.g. {DEFAULT_BASELINE})')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed regression ratio before failing')
+    parser.add_argument('--update-baseline', action='store_true', help='Overwrite the baseline with these results')
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    # Keep the request-path logging out of the measurement
+    os.environ.setdefault('QUERY_LOG_ENABLED', 'false')
+    # Every benchmark request comes from one client, far above any per-client limit
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+
+    from project import create_app
+    app = create_app('production')
+
+    print(f"⏱️  Benchmarking {app.config['SQLALCHEMY_DATABASE_URI']} "
+          f"({args.requests} requests/endpoint, concurrency={args.concurrency})")
+    try:
+        results = run_suite(app, requests=args.requests, warmup=args.warmup,
+                            concurrency=args.concurrency, only=args.only)
+    except ValueError as e:
+        print(f'❌ {e}')
+        return 2
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+        print(f"📝 Results written to {args.output}")
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, 'w') as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+        print(f"📌 Baseline updated at {args.baseline}")
+    elif args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('❌ Regressions against baseline:')
+            for line in regressions:
+                print(f'  {line}')
+            return 1
+        print('✅ No regressions against baseline')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Memory footprint and listing latency of the catalog snapshots
+Compares the bytes per product held by hydrated ORM objects (Product with
+its SubCategory, Category and AggregatedReview, as the listing serializes
+them) with the in-process snapshot's ProductRecords and with the Python
+heap of a mapped shared snapshot file (whose pages live once in the page
+cache, however many workers map it), and times GET /api/products on all
+three paths.
+
+Usage:
+    python benchmarks/generate_catalog.py --products 10000 --database-url sqlite:///benchmark.db
+    python benchmarks/snapshot_memory.py --database-url sqlite:///benchmark.db
+"""
+
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+LISTINGS = [
+    ('products.list', '/api/products'),
+    ('products.list_subcategory_page', '/api/products?subcategory={subcategory}&page=5'),
+    ('products.list_max_page', '/api/products?per_page=100&page=3'),
+]
+
+
+def traced_bytes(build):
+    """(bytes still allocated after build(), build seconds, result); the result is kept alive"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, elapsed, result
+
+
+def measure_memory(app, shared_path):
+    from sqlalchemy.orm import joinedload
+    from project import db
+    from project.models.models import Product, SubCategory
+    from project.services.shared_snapshot import MappedCatalogSnapshot, write_shared_snapshot
+    from project.services.snapshot import CatalogSnapshot
+
+    results = {}
+    with app.app_context():
+        def load_orm():
+            products = db.session.query(Product).options(
+                joinedload(Product.subcategory).joinedload(SubCategory.category),
+                joinedload(Product.aggregated_review)
+            ).all()
+            return products
+        orm_bytes, orm_seconds, products = traced_bytes(load_orm)
+        count = len(products)
+        del products
+        db.session.remove()
+
+        snapshot_bytes, snapshot_seconds, snapshot = traced_bytes(CatalogSnapshot.build)
+        file_bytes = write_shared_snapshot(snapshot, shared_path)
+        del snapshot
+        db.session.remove()
+
+    shared_bytes, shared_seconds, mapped = traced_bytes(lambda: MappedCatalogSnapshot(shared_path))
+    del mapped
+
+    for name, total, seconds in (('orm', orm_bytes, orm_seconds), ('snapshot', snapshot_bytes, snapshot_seconds),
+                                 ('shared', shared_bytes, shared_seconds)):
+        results[name] = {
+            'products': count,
+            'total_bytes': total,
+            'bytes_per_product': round(total / count) if count else 0,
+            'build_ms': round(seconds * 1000, 1),
+        }
+    results['shared']['file_bytes'] = file_bytes
+    return results
+
+
+def measure_latency(app, subcategory, requests, shared_path):
+    client = app.test_client()
+    results = {}
+    for name, template in LISTINGS:
+        path = template.format(subcategory=subcategory)
+        row = {}
+        for mode, enabled, snapshot_path in (('orm', False, ''), ('snapshot', True, ''), ('shared', True, shared_path)):
+            app.config['CATALOG_SNAPSHOT_ENABLED'] = enabled
+            app.config['CATALOG_SNAPSHOT_SHARED_PATH'] = snapshot_path
+            client.get(path)  # Warm up (and build the snapshot)
+            timings = []
+            for _ in range(requests):
+                started = time.perf_counter()
+                client.get(path, headers={'Accept-Encoding': 'identity'})
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            row[mode] = {'p50_ms': round(statistics.median(timings), 3),
+                         'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 3)}
+        results[name] = row
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare catalog snapshot and ORM listing memory and latency')
+    parser.add_argument('--database-url', default=None, help='Database to read (defaults to DATABASE_URL)')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per listing and mode')
+    parser.add_argument('--output', default=None, help='Write results JSON to this path')
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('QUERY_LOG_ENABLED', 'false')
+    # Every benchmark request comes from one client, far above any per-client limit
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    os.environ.setdefault('METRICS_ENABLED', 'false')
+
+    from project import create_app, db
+    from project.models.models import SubCategory
+    app = create_app('production')
+
+    with app.app_context():
+        name = db.session.query(SubCategory.name).order_by(SubCategory.id).limit(1).scalar()
+    if name is None:
+        print('❌ No catalog in the database; run benchmarks/generate_catalog.py first')
+        return 1
+
+    with tempfile.TemporaryDirectory() as directory:
+        shared_path = os.path.join(directory, 'catalog.snap')
+        results = {'memory': measure_memory(app, shared_path),
+                   'latency': measure_latency(app, name.lower().replace(' ', '-'), args.requests, shared_path)}
+
+    print('🧠 Resident listing data')
+    for mode, row in results['memory'].items():
+        print(f"  {mode:<9} {row['bytes_per_product']:>6} B/product  "
+              f"total={row['total_bytes'] / 1048576:7.1f} MiB  build={row['build_ms']:.0f}ms  ({row['products']} products)")
+    print(f"  shared file {results['memory']['shared']['file_bytes'] / 1048576:.1f} MiB, mapped once per node")
+    print('⏱️  GET /api/products')
+    for name, row in results['latency'].items():
+        print(f"  {name:<32} " + '   '.join(f"{mode} p50={timing['p50_ms']:.2f}ms p95={timing['p95_ms']:.2f}ms"
+                                             for mode, timing in row.items()))
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+        print(f"📝 Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
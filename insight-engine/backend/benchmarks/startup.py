@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark and import-time budget check
+Runs app creation in fresh interpreters, reports wall-clock startup and the
+slowest imports from `python -X importtime`, and fails when the median
+startup regresses beyond a tolerance against a baseline recorded on the same
+machine, or when heavy ingestion/NLP dependencies are imported at startup.
+The baseline is machine-specific, so it is kept out of version control.
+
+Usage:
+    python benchmarks/startup.py --update-baseline   # record this machine's startup
+    python benchmarks/startup.py --runs 5 --tolerance 0.25
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Machine-specific, so git-ignored: each machine records its own
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'startup_baseline.json')
+
+# Modules that must only be imported by the CLI commands/workers that need them
+FORBIDDEN_AT_STARTUP = ('nltk', 'textblob', 'praw', 'bs4', 'alembic', 'flask_migrate', 'numpy')
+
+STARTUP_SNIPPET = (
+    "import time; _t = time.perf_counter(); "
+    "from project import create_app; app = create_app('testing'); "
+    "print('STARTUP_MS', (time.perf_counter() - _t) * 1000)"
+)
+
+
+def parse_importtime(stderr):
+    """Return {module: (self_us, cumulative_us)} from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def measure_once(python=sys.executable, importtime=False):
+    """Create the app in a fresh interpreter and return (startup_ms, modules)"""
+    command = [python, '-X', 'importtime', '-c', STARTUP_SNIPPET] if importtime else [python, '-c', STARTUP_SNIPPET]
+    proc = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    startup_ms = next(float(line.split()[1]) for line in proc.stdout.splitlines() if line.startswith('STARTUP_MS'))
+    return startup_ms, parse_importtime(proc.stderr) if importtime else {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure app startup and enforce an import-time budget')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to measure')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Recorded startup median to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed regression ratio against the baseline median before failing')
+    parser.add_argument('--update-baseline', action='store_true', help='Record this median as the baseline')
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help='Also fail when the median exceeds this absolute time')
+    parser.add_argument('--top', type=int, default=15, help='Number of slowest imports to print')
+    args = parser.parse_args(argv)
+
+    # Warm the bytecode cache so the first run is not an outlier; importtime inflates
+    # wall-clock numbers, so the breakdown comes from a separate run
+    _, modules = measure_once(importtime=True)
+    startups = [measure_once()[0] for _ in range(args.runs)]
+
+    median = statistics.median(startups)
+    print(f"⏱️  create_app startup over {args.runs} runs: median={median:.1f}ms "
+          f"min={min(startups):.1f}ms max={max(startups):.1f}ms")
+
+    print("🐢 Slowest imports (cumulative, under -X importtime):")
+    top_level = {name: times for name, times in modules.items() if '.' not in name}
+    for name, (_, cumulative_us) in sorted(top_level.items(), key=lambda kv: -kv[1][1])[:args.top]:
+        print(f"  {cumulative_us / 1000:>8.1f}ms  {name}")
+
+    failures = []
+    loaded_forbidden = sorted(name for name in modules if name.split('.')[0] in FORBIDDEN_AT_STARTUP)
+    if loaded_forbidden:
+        roots = sorted({name.split('.')[0] for name in loaded_forbidden})
+        failures.append(f"heavy modules imported at startup: {', '.join(roots)}")
+    if args.budget_ms is not None and median > args.budget_ms:
+        failures.append(f"startup median {median:.1f}ms exceeds budget of {args.budget_ms:.0f}ms")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as fh:
+            json.dump({'median_ms': round(median, 1), 'runs': args.runs}, fh, indent=2, sort_keys=True)
+        print(f"📌 Baseline updated at {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as fh:
+            baseline_ms = json.load(fh)['median_ms']
+        limit = baseline_ms * (1 + args.tolerance)
+        if median > limit:
+            failures.append(f"startup median {median:.1f}ms regressed beyond {limit:.1f}ms "
+                            f"(baseline {baseline_ms:.1f}ms +{args.tolerance:.0%})")
+        else:
+            print(f"✅ Within {args.tolerance:.0%} of the {baseline_ms:.1f}ms baseline")
+    else:
+        print(f"⚠️  No baseline at {args.baseline}; run with --update-baseline to record one")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -18,13 +18,179 @@ class Config:
     # Pagination
     ITEMS_PER_PAGE = 20
     
+    # Insights Configuration
+    PRICE_BUCKET_EDGES = [int(edge) for edge in os.environ.get('PRICE_BUCKET_EDGES', '5000,10000,15000').split(',')]
+    INSIGHTS_SNIPPET_LIMIT = int(os.environ.get('INSIGHTS_SNIPPET_LIMIT', 10))
+    ANALYTICS_CACHE_SECONDS = int(os.environ.get('ANALYTICS_CACHE_SECONDS', 300))
+    
+    # Similar Products Configuration
+    SIMILARITY_INDEX_PATH = os.environ.get('SIMILARITY_INDEX_PATH', 'instance/similarity_index.npz')
+    SIMILARITY_MAX_K = int(os.environ.get('SIMILARITY_MAX_K', 20))
+    SIMILARITY_REFRESH_SECONDS = int(os.environ.get('SIMILARITY_REFRESH_SECONDS', 300))
+    SIMILARITY_TAG_KEYS = [key.strip() for key in os.environ.get('SIMILARITY_TAG_KEYS', 'Style Tags,Pricing Model').split(',') if key.strip()]
+    
+    # Price Alert Configuration
+    PRICE_ALERT_DROP_PCT = float(os.environ.get('PRICE_ALERT_DROP_PCT', 0.1))
+    PRICE_ALERT_ZSCORE = float(os.environ.get('PRICE_ALERT_ZSCORE', 3.0))
+    PRICE_ALERT_MIN_OBSERVATIONS = int(os.environ.get('PRICE_ALERT_MIN_OBSERVATIONS', 3))
+    PRICE_ALERT_HALF_LIFE = float(os.environ.get('PRICE_ALERT_HALF_LIFE', 14))
+    PRICE_ALERT_BATCH_SIZE = int(os.environ.get('PRICE_ALERT_BATCH_SIZE', 1000))
+    PRICE_ALERT_SETTLE_SECONDS = float(os.environ.get('PRICE_ALERT_SETTLE_SECONDS', 30))
+    
+    # Response Compression Configuration
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() == 'true'
+    COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+    
+    # Write API Configuration
+    WRITE_API_KEYS = [key.strip() for key in os.environ.get('WRITE_API_KEYS', '').split(',') if key.strip()]
+    BULK_MAX_PRODUCTS = int(os.environ.get('BULK_MAX_PRODUCTS', 1000))
+    UPSERT_CHUNK_SIZE = int(os.environ.get('UPSERT_CHUNK_SIZE', 500))
+    
+    # Catalog Snapshot Configuration
+    CATALOG_SNAPSHOT_ENABLED = os.environ.get('CATALOG_SNAPSHOT_ENABLED', 'false').lower() == 'true'
+    CATALOG_SNAPSHOT_REFRESH_SECONDS = float(os.environ.get('CATALOG_SNAPSHOT_REFRESH_SECONDS', 2))
+    CATALOG_SNAPSHOT_REBUILD_SECONDS = int(os.environ.get('CATALOG_SNAPSHOT_REBUILD_SECONDS', 3600))
+    CATALOG_SNAPSHOT_SHARED_PATH = os.environ.get('CATALOG_SNAPSHOT_SHARED_PATH', '')
+    
+    # Catalog Sharding Configuration
+    # Comma-separated name=database-url pairs. Append only: a shard's position fixes its product id range
+    CATALOG_SHARDS = [
+        (name.strip(), url.strip()) for name, url in
+        (pair.split('=', 1) for pair in os.environ.get('CATALOG_SHARDS', '').split(',') if pair.strip())
+    ]
+    SQLALCHEMY_BINDS = {f'shard_{name}': url for name, url in CATALOG_SHARDS}
+    # Comma-separated category-or-subcategory-slug=shard pairs; anything unrouted stays in DATABASE_URL
+    CATALOG_SHARD_ROUTES = {
+        slug.strip(): shard.strip() for slug, shard in
+        (pair.split('=', 1) for pair in os.environ.get('CATALOG_SHARD_ROUTES', '').split(',') if pair.strip())
+    }
+    # Product ids per shard; the default keeps 20 shards inside a 32-bit INTEGER id
+    SHARD_ID_SPAN = int(os.environ.get('SHARD_ID_SPAN', 100000000))
+    # Deepest row (page x per_page) an unfiltered listing may reach when merged across shards
+    SHARD_SCATTER_MAX_ROWS = int(os.environ.get('SHARD_SCATTER_MAX_ROWS', 10000))
+    
+    # Request Coalescing Configuration
+    COALESCE_ENABLED = os.environ.get('COALESCE_ENABLED', 'true').lower() == 'true'
+    COALESCE_WAIT_SECONDS = float(os.environ.get('COALESCE_WAIT_SECONDS', 10))
+    
+    # Rate Limiting Configuration
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    # memory (per API process) or database (the rate_limit_buckets table, shared by every process)
+    RATE_LIMIT_STORAGE = os.environ.get('RATE_LIMIT_STORAGE', 'memory')
+    # Comma-separated class=rate:burst pairs, in requests per second per client; unlisted classes are unlimited
+    RATE_LIMITS = {
+        name.strip(): tuple(float(part) for part in limit.split(':')) for name, limit in
+        (pair.split('=') for pair in os.environ.get('RATE_LIMITS', 'default=20:100,expensive=1:10,write=5:50,stream=2:20').split(',')
+         if pair.strip())
+    }
+    # Comma-separated endpoint-or-blueprint=class pairs, e.g. 'products.compare_products_view=expensive'
+    RATE_LIMIT_ROUTE_CLASSES = {
+        endpoint.strip(): name.strip() for endpoint, name in
+        (pair.split('=') for pair in os.environ.get('RATE_LIMIT_ROUTE_CLASSES', '').split(',') if pair.strip())
+    }
+    # Reverse proxies in front of the API that append to X-Forwarded-For; 0 limits by the socket address
+    RATE_LIMIT_PROXY_COUNT = int(os.environ.get('RATE_LIMIT_PROXY_COUNT', 0))
+    
+    # Load Shedding Configuration
+    LOAD_SHED_ENABLED = os.environ.get('LOAD_SHED_ENABLED', 'true').lower() == 'true'
+    SHED_MAX_CONCURRENCY = int(os.environ.get('SHED_MAX_CONCURRENCY', 32))
+    SHED_TARGET_MS = float(os.environ.get('SHED_TARGET_MS', 50))
+    SHED_INTERVAL_MS = float(os.environ.get('SHED_INTERVAL_MS', 500))
+    SHED_MAX_WAIT_MS = float(os.environ.get('SHED_MAX_WAIT_MS', 2000))
+    
+    # Faceted Browsing Configuration
+    FACET_PRICE_KEY = os.environ.get('FACET_PRICE_KEY', 'MSRP')
+    FACET_RATING_EDGES = [float(edge) for edge in os.environ.get('FACET_RATING_EDGES', '3,4,4.5').split(',')]
+    FACET_MAX_VALUES = int(os.environ.get('FACET_MAX_VALUES', 100))
+    FACET_VALUE_LIMIT = int(os.environ.get('FACET_VALUE_LIMIT', 20))
+    FACET_INDEX_REFRESH_SECONDS = float(os.environ.get('FACET_INDEX_REFRESH_SECONDS', 5))
+    
+    # Comparison Configuration
+    COMPARE_MAX_PRODUCTS = int(os.environ.get('COMPARE_MAX_PRODUCTS', 6))
+    
+    # Typeahead Configuration
+    SUGGEST_LIMIT = int(os.environ.get('SUGGEST_LIMIT', 8))
+    SUGGEST_REFRESH_SECONDS = float(os.environ.get('SUGGEST_REFRESH_SECONDS', 2))
+    SUGGEST_MAX_AGE_SECONDS = int(os.environ.get('SUGGEST_MAX_AGE_SECONDS', 60))
+    
+    # Popularity Configuration
+    POPULARITY_ENABLED = os.environ.get('POPULARITY_ENABLED', 'true').lower() == 'true'
+    POPULARITY_FLUSH_SECONDS = float(os.environ.get('POPULARITY_FLUSH_SECONDS', 10))
+    POPULARITY_MAX_PENDING = int(os.environ.get('POPULARITY_MAX_PENDING', 5000))
+    TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', 24))
+    # Comma-separated event=weight pairs
+    TRENDING_WEIGHTS = {
+        kind.strip(): float(weight) for kind, weight in
+        (pair.split('=') for pair in os.environ.get('TRENDING_WEIGHTS', 'views=1,clicks=3,impressions=0.05').split(',')
+         if pair.strip())
+    }
+    
+    # Change Feed Configuration
+    CHANGE_LOG_ENABLED = os.environ.get('CHANGE_LOG_ENABLED', 'true').lower() == 'true'
+    CHANGE_LOG_RETENTION_DAYS = int(os.environ.get('CHANGE_LOG_RETENTION_DAYS', 30))
+    # Longest a write transaction may take; readers wait this long for a missing lower sequence number
+    CHANGE_LOG_SETTLE_SECONDS = float(os.environ.get('CHANGE_LOG_SETTLE_SECONDS', 30))
+    CHANGES_PAGE_SIZE = int(os.environ.get('CHANGES_PAGE_SIZE', 500))
+    CHANGES_MAX_WAIT_SECONDS = int(os.environ.get('CHANGES_MAX_WAIT_SECONDS', 30))
+    CHANGES_POLL_SECONDS = float(os.environ.get('CHANGES_POLL_SECONDS', 1.0))
+    CHANGES_STREAM_SECONDS = int(os.environ.get('CHANGES_STREAM_SECONDS', 300))
+    
     # CORS Configuration
     CORS_ORIGINS = ['http://localhost:3000', 'http://127.0.0.1:3000']
     
-    # Reddit API Configuration (for future use)
+    # Reddit API Configuration
     REDDIT_CLIENT_ID = os.environ.get('REDDIT_CLIENT_ID')
     REDDIT_CLIENT_SECRET = os.environ.get('REDDIT_CLIENT_SECRET')
     REDDIT_USER_AGENT = os.environ.get('REDDIT_USER_AGENT', 'InsightEngine/1.0')
+    
+    # Background Job Configuration
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    # Also run queued jobs on threads inside each API process; set false once `flask worker` runs them
+    JOB_IN_PROCESS = os.environ.get('JOB_IN_PROCESS', 'true').lower() == 'true'
+    JOB_WORKER_POLL_SECONDS = float(os.environ.get('JOB_WORKER_POLL_SECONDS', 2.0))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    JOB_RETRY_BACKOFF_SECONDS = float(os.environ.get('JOB_RETRY_BACKOFF_SECONDS', 30))
+    JOB_RETRY_MAX_SECONDS = float(os.environ.get('JOB_RETRY_MAX_SECONDS', 3600))
+    # Comma-separated queue=limit pairs: jobs of a queue running at once across all workers
+    JOB_QUEUE_CONCURRENCY = {
+        queue.strip(): int(limit) for queue, limit in
+        (pair.split('=') for pair in os.environ.get('JOB_QUEUE_CONCURRENCY', 'reviews=2').split(',') if pair.strip())
+    }
+    JOB_PERSIST_SECONDS = float(os.environ.get('JOB_PERSIST_SECONDS', 1.0))
+    JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 900))
+    JOB_STREAM_SECONDS = int(os.environ.get('JOB_STREAM_SECONDS', 600))
+    # Job event streams one API process serves at once; each holds a request thread while open
+    JOB_STREAM_MAX_OPEN = int(os.environ.get('JOB_STREAM_MAX_OPEN', 16))
+    JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 1.0))
+    REVIEW_REFRESH_POST_LIMIT = int(os.environ.get('REVIEW_REFRESH_POST_LIMIT', 100))
+    # Comma-separated subreddits for every product; unset picks a default list per subcategory
+    REVIEW_REFRESH_SUBREDDITS = [name.strip() for name in os.environ.get('REVIEW_REFRESH_SUBREDDITS', '').split(',') if name.strip()]
+    
+    # Monitoring Configuration
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'false').lower() == 'true'
+    PROFILER_SLOW_REQUEST_MS = int(os.environ.get('PROFILER_SLOW_REQUEST_MS', 500))
+    PROFILER_SAMPLE_INTERVAL_MS = int(os.environ.get('PROFILER_SAMPLE_INTERVAL_MS', 5))
+    PROFILER_OUTPUT_DIR = os.environ.get('PROFILER_OUTPUT_DIR', 'logs/profiles')
+    QUERY_LOG_ENABLED = os.environ.get('QUERY_LOG_ENABLED', 'true').lower() == 'true'
+    SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 200))
+    SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true'
+    N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+    
+    # Logging Configuration
+    LOG_DIR = os.environ.get('LOG_DIR', 'logs')
+    LOG_FILE = os.environ.get('LOG_FILE', 'insight_engine.log')
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 50 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 10))
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    LOG_JSON = os.environ.get('LOG_JSON', 'true').lower() == 'true'
+    LOG_ACCESS_ENABLED = os.environ.get('LOG_ACCESS_ENABLED', 'true').lower() == 'true'
+    # Access records of requests slower than this are logged at WARNING and kept by sampling; 0 disables
+    LOG_SLOW_REQUEST_MS = int(os.environ.get('LOG_SLOW_REQUEST_MS', 1000))
+    # Comma-separated logger=rate pairs, e.g. 'project.access=0.1,project.monitoring.query_log=0.5'
+    LOG_SAMPLING = os.environ.get('LOG_SAMPLING', 'project.access=0.1')
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -0,0 +1,45 @@
+import os
+from datetime import date, timedelta
+
+import pytest
+
+# No background threads writing to the test database
+os.environ.setdefault('JOB_IN_PROCESS', 'false')
+os.environ.setdefault('POPULARITY_ENABLED', 'false')
+
+from project import create_app, db
+from project.models.models import (
+    Category, SubCategory, Product, ProductAttribute, PriceHistory, AggregatedReview
+)
+
+pytest_plugins = ['project.monitoring.pytest_plugin', 'pytester']
+
+
+@pytest.fixture(scope='session')
+def app():
+    """Testing app over an in-memory catalog of 2 categories, 6 subcategories and 36 products"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        for c, category_name in enumerate(('Technology', 'Appliances')):
+            category = Category(name=category_name, display_order=c)
+            for s in range(3):
+                subcategory = SubCategory(name=f'{category_name} {s}', display_order=s, category=category)
+                for p in range(6):
+                    product = Product(brand=f'Brand {p % 3}', name=f'{category_name} {s} product {p}',
+                                      subcategory=subcategory, short_description='A product')
+                    product.attributes.append(ProductAttribute(key='MSRP', value=str(1000 + 100 * p)))
+                    for day in range(3):
+                        product.price_history.append(PriceHistory(
+                            price=900 + 100 * p - 10 * day, retailer_name='Retailer',
+                            date_recorded=date(2024, 1, 1) + timedelta(days=day)
+                        ))
+                    product.aggregated_review = AggregatedReview(overall_rating=3 + p % 3, total_reviews_analyzed=10)
+            db.session.add(category)
+        db.session.commit()
+    yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -1,14 +1,13 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from flask_migrate import Migrate
-import logging
-from logging.handlers import RotatingFileHandler
-import os
+from project.cli import (
+    LazyMigrate, catalog_cli, changes_cli, jobs_cli, price_alerts_cli, shards_cli, similarity_cli, worker_command
+)
 
 # Initialize extensions
 db = SQLAlchemy()
-migrate = Migrate()
+migrate = LazyMigrate()  # Flask-Migrate/Alembic are only imported by `flask db` commands
 
 def create_app(config_name='default'):
     """
@@ -23,27 +22,61 @@ def create_app(config_name='default'):
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
+    app.cli.add_command(similarity_cli)
+    app.cli.add_command(price_alerts_cli)
+    app.cli.add_command(catalog_cli)
+    app.cli.add_command(changes_cli)
+    app.cli.add_command(shards_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(worker_command)
     
     # Configure CORS
     CORS(app, origins=app.config['CORS_ORIGINS'])
     
-    # Configure logging
+    # Configure logging (queued, structured, written off the request thread)
     if not app.debug and not app.testing:
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-        file_handler = RotatingFileHandler('logs/insight_engine.log', maxBytes=10240, backupCount=10)
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-        ))
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
-        app.logger.setLevel(logging.INFO)
+        from project.monitoring import init_logging
+        init_logging(app)
         app.logger.info('Insight Engine startup')
     
+    # Configure request metrics and the opt-in profiler
+    from project.monitoring import init_monitoring
+    init_monitoring(app)
+    
+    # Compress large responses (after monitoring, so metrics see wire bytes)
+    from project.api.compression import init_compression
+    init_compression(app)
+    
+    # Rate-limit clients and shed load (after monitoring, so rejections are counted)
+    from project.api.limits import init_rate_limits
+    init_rate_limits(app)
+    
+    # Check the write API can upsert into the configured databases
+    from project.services.upserts import init_upserts
+    init_upserts(app)
+    
+    # Record catalog mutations for the /api/changes feed
+    from project.services.changes import init_change_log
+    init_change_log(app)
+    
+    # Queue background jobs in the database, run by `flask worker` or in-process threads
+    from project.services.jobs import init_jobs
+    init_jobs(app)
+    
+    # Route catalog reads to per-category shards (a no-op without CATALOG_SHARDS)
+    from project.services.shards import init_shards
+    init_shards(app)
+    
     # Register blueprints
+    from project.api.changes import changes_bp
+    from project.api.jobs import jobs_bp
     from project.api.products import products_bp
+    from project.api.query import query_bp
     
     app.register_blueprint(products_bp, url_prefix='/api')
+    app.register_blueprint(query_bp, url_prefix='/api')
+    app.register_blueprint(changes_bp, url_prefix='/api')
+    app.register_blueprint(jobs_bp, url_prefix='/api')
     
     # Import models to ensure they're registered with SQLAlchemy
     from project.models.models import Category, SubCategory, Product, ProductAttribute, PriceHistory, AggregatedReview
@@ -1,3 +1,6 @@
+from .changes import changes_bp
+from .jobs import jobs_bp
 from .products import products_bp
+from .query import query_bp
 
-__all__ = ['products_bp'] 
\ No newline at end of file
+__all__ = ['changes_bp', 'jobs_bp', 'products_bp', 'query_bp']
@@ -1,6 +1,8 @@
 from flask import Blueprint, jsonify, request, current_app
+from sqlalchemy import func
 from sqlalchemy.orm import joinedload
 from project.models import AITool, AggregatedReview
+from project.services import count_by, grouped_counts
 from project import db
 import logging
 
@@ -167,47 +169,39 @@ def get_ai_tools_insights():
     Returns aggregated insights across all AI tools
     """
     try:
-        # Get all tools with reviews
-        tools = AITool.query.all()
+        # Counts and averages in a single round-trip
+        total, rated, average_rating = db.session.query(
+            func.count(func.distinct(AITool.id)),
+            func.count(func.distinct(AggregatedReview.ai_tool_id)),
+            func.avg(AggregatedReview.overall_rating)
+        ).outerjoin(
+            AggregatedReview,
+            (AITool.id == AggregatedReview.ai_tool_id) &
+            AggregatedReview.overall_rating.isnot(None)
+        ).one()
+        
+        # Use case and pricing model counts in a second round-trip
+        breakdowns = grouped_counts(
+            count_by('use_case', AITool.primary_use_case),
+            count_by('pricing_model', AITool.pricing_model)
+        )
+        
+        # Collect a bounded sample of insight snippets
+        common_insights = [
+            snippet for (snippet,) in db.session.query(AITool.insight_snippet)
+            .filter(AITool.insight_snippet.isnot(None))
+            .limit(current_app.config['INSIGHTS_SNIPPET_LIMIT'])
+        ]
         
         insights = {
-            'total_tools': len(tools),
-            'tools_with_reviews': 0,
-            'average_rating': 0,
-            'top_use_cases': {},
-            'pricing_breakdown': {},
-            'common_insights': []
+            'total_tools': total,
+            'tools_with_reviews': rated,
+            'average_rating': round(average_rating, 2) if average_rating else 0,
+            'top_use_cases': breakdowns.get('use_case', {}),
+            'pricing_breakdown': breakdowns.get('pricing_model', {}),
+            'common_insights': common_insights
         }
         
-        total_rating = 0
-        rated_tools = 0
-        
-        for tool in tools:
-            reviews = tool.reviews
-            if reviews and len(reviews) > 0:
-                review = reviews[0]  # Get first review
-                if review.overall_rating:
-                    insights['tools_with_reviews'] += 1
-                    total_rating += review.overall_rating
-                    rated_tools += 1
-            
-            # Count use cases
-            if tool.primary_use_case:
-                insights['top_use_cases'][tool.primary_use_case] = \
-                    insights['top_use_cases'].get(tool.primary_use_case, 0) + 1
-            
-            # Count pricing models
-            if tool.pricing_model:
-                insights['pricing_breakdown'][tool.pricing_model] = \
-                    insights['pricing_breakdown'].get(tool.pricing_model, 0) + 1
-            
-            # Collect insight snippets
-            if tool.insight_snippet:
-                insights['common_insights'].append(tool.insight_snippet)
-        
-        if rated_tools > 0:
-            insights['average_rating'] = round(total_rating / rated_tools, 2)
-        
         return jsonify({
             'success': True,
             'data': insights
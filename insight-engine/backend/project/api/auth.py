@@ -0,0 +1,48 @@
+import functools
+import hmac
+
+from flask import current_app, jsonify, request
+
+
+def _supplied_key():
+    """API key from `Authorization: Bearer <key>` or `X-API-Key`"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() == 'bearer' and token.strip():
+        return token.strip()
+    return request.headers.get('X-API-Key')
+
+
+def matching_api_key():
+    """The configured WRITE_API_KEYS entry the request supplied, or None"""
+    supplied = _supplied_key()
+    # Compare against every key so timing does not reveal which one matched
+    matched = None
+    for key in current_app.config['WRITE_API_KEYS']:
+        if bool(supplied) and hmac.compare_digest(supplied.encode('utf-8'), key.encode('utf-8')):
+            matched = key
+    return matched
+
+
+def require_api_key(view):
+    """
+    Reject requests without one of the configured WRITE_API_KEYS
+
+    Write endpoints are disabled (403) until at least one key is configured.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        keys = current_app.config['WRITE_API_KEYS']
+        if not keys:
+            return jsonify({
+                'error': 'Forbidden',
+                'message': 'Write API is disabled; set WRITE_API_KEYS to enable it'
+            }), 403
+
+        if matching_api_key() is None:
+            return jsonify({
+                'error': 'Unauthorized',
+                'message': 'A valid API key is required'
+            }), 401, {'WWW-Authenticate': 'Bearer'}
+
+        return view(*args, **kwargs)
+    return wrapper
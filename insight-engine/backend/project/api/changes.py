@@ -0,0 +1,103 @@
+import json
+import time
+
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
+from project import db
+from project.api.formats import respond
+from project.services import change_notifier, fetch_changes, settled_seq
+
+# Create the change feed blueprint
+changes_bp = Blueprint('changes', __name__)
+
+SSE_MIMETYPE = 'text/event-stream'
+
+
+def _wait_for_changes(since, limit, wait):
+    """Poll for events after `since` until some arrive or `wait` seconds pass"""
+    deadline = time.monotonic() + wait
+    poll_seconds = current_app.config['CHANGES_POLL_SECONDS']
+    while True:
+        changes = fetch_changes(since, limit)
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            return changes
+        # End the read transaction so the next poll sees rows committed meanwhile
+        db.session.rollback()
+        change_notifier.wait(min(poll_seconds, remaining))
+
+
+def _stream_changes(since, limit):
+    """Server-sent events: one `change` event per row, with its seq as the event id"""
+    config = current_app.config
+    deadline = time.monotonic() + config['CHANGES_STREAM_SECONDS']
+    heartbeat_at = time.monotonic() + 15
+    yield 'retry: 2000\n\n'
+    while time.monotonic() < deadline:
+        changes = fetch_changes(since, limit)
+        db.session.rollback()
+        for change in changes:
+            since = change.seq
+            yield f"id: {change.seq}\nevent: change\ndata: {json.dumps(change.to_dict())}\n\n"
+        if changes:
+            continue
+        if time.monotonic() >= heartbeat_at:
+            heartbeat_at = time.monotonic() + 15
+            yield ': keep-alive\n\n'
+        change_notifier.wait(config['CHANGES_POLL_SECONDS'])
+    # Clients reconnect with Last-Event-ID, resuming where this stream stopped
+
+
+@changes_bp.route('/changes', methods=['GET'])
+def get_changes():
+    """
+    Catalog change feed: products, attributes, prices and reviews, in sequence order
+
+    Events are served once every lower sequence number has committed (or
+    CHANGE_LOG_SETTLE_SECONDS have passed), so a cursor never skips one.
+
+    Query Parameters:
+    - since: Return events with a sequence number above this (default: 0);
+      SSE clients resume from the Last-Event-ID header instead
+    - limit: Maximum events per response (default and max: CHANGES_PAGE_SIZE)
+    - wait: Long-poll for up to this many seconds when there are no new events
+      (default: 0, max: CHANGES_MAX_WAIT_SECONDS)
+    - stream: 'true' (or Accept: text/event-stream) to stream events as server-sent events
+
+    Returns:
+    - JSON response with the events, the cursor for the next call and the latest sequence number
+    """
+    try:
+        config = current_app.config
+        since = request.headers.get('Last-Event-ID') or request.args.get('since', '0')
+        try:
+            since = int(since)
+            if since < 0:
+                raise ValueError
+        except ValueError:
+            return jsonify({
+                'error': 'Bad request',
+                'message': "'since' must be a non-negative sequence number"
+            }), 400
+        limit = max(1, min(request.args.get('limit', config['CHANGES_PAGE_SIZE'], type=int), config['CHANGES_PAGE_SIZE']))
+        wait = max(0.0, min(request.args.get('wait', 0, type=float), config['CHANGES_MAX_WAIT_SECONDS']))
+
+        streaming = request.args.get('stream', '').lower() == 'true' or \
+            request.accept_mimetypes.best_match([SSE_MIMETYPE, 'application/json']) == SSE_MIMETYPE
+        if streaming:
+            return Response(stream_with_context(_stream_changes(since, limit)), mimetype=SSE_MIMETYPE,
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+        changes = _wait_for_changes(since, limit, wait)
+        return respond({
+            'changes': [change.to_dict() for change in changes],
+            'next_since': changes[-1].seq if changes else since,
+            'has_more': len(changes) == limit,
+            'latest_seq': settled_seq()
+        }, 200)
+
+    except Exception as e:
+        current_app.logger.error(f"Error fetching changes: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': 'Failed to fetch changes'
+        }), 500
@@ -0,0 +1,112 @@
+import functools
+import threading
+
+from flask import current_app, g, request
+
+from project.monitoring import metrics
+
+
+class _Flight:
+    """One in-flight computation: the leader fills it in, followers wait on it"""
+
+    __slots__ = ('done', 'response', 'side_effects', 'encoded', 'encode_lock')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None  # (body, status, headers), or None when it cannot be shared
+        self.side_effects = []
+        self.encoded = {}  # Content-coding -> body encoded with it, for every request sharing the response
+        self.encode_lock = threading.Lock()
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _request_key():
+    """Everything a read endpoint's response depends on: route, arguments and negotiated format"""
+    return (
+        request.endpoint,
+        request.path,
+        tuple(sorted(request.args.items(multi=True))),
+        request.headers.get('Accept', ''),
+    )
+
+
+def after_shared(fn, *args):
+    """
+    Run `fn(*args)` now, and again for every request that shares this response
+
+    For per-request side effects of a coalesced view (e.g. counting an
+    impression), which the requests served from its response would
+    otherwise skip.
+    """
+    fn(*args)
+    flight = g.get('coalescing_flight')
+    if flight is not None:
+        flight.side_effects.append((fn, args))
+
+
+def encode_shared(encoding, data, encode):
+    """
+    `encode(data)`, computed once per content-coding for all requests sharing a coalesced response
+
+    Outside a shared response this simply encodes. Requests wanting an
+    encoding another one is producing wait for its result.
+    """
+    flight = g.get('shared_flight')
+    if flight is None:
+        return encode(data)
+    with flight.encode_lock:
+        if encoding not in flight.encoded:
+            flight.encoded[encoding] = encode(data)
+        return flight.encoded[encoding]
+
+
+def coalesce(view):
+    """
+    Single-flight a read endpoint: concurrent identical requests share one response
+
+    The first request for a key runs the view; requests arriving with the
+    same key while it runs wait for it (up to COALESCE_WAIT_SECONDS) and
+    are sent a copy of its body, status and headers instead of repeating
+    the queries and serialization; compression also runs once per encoding
+    (see `encode_shared`). Streamed responses are not shared, and
+    when the view raises, waiting requests run it themselves.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        config = current_app.config
+        if not config['COALESCE_ENABLED']:
+            return view(*args, **kwargs)
+
+        key = _request_key()
+        with _flights_lock:
+            flight = _flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _flights[key] = _Flight()
+
+        if not leader:
+            if flight.done.wait(config['COALESCE_WAIT_SECONDS']) and flight.response is not None:
+                metrics.inc('coalesced_requests_total', {'endpoint': request.endpoint})
+                for fn, fn_args in flight.side_effects:
+                    fn(*fn_args)
+                body, status, headers = flight.response
+                g.shared_flight = flight
+                return current_app.response_class(body, status=status, headers=headers)
+            return view(*args, **kwargs)
+
+        g.coalescing_flight = flight
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+            if not (response.direct_passthrough or response.is_streamed):
+                flight.response = (response.get_data(), response.status_code, list(response.headers.items()))
+                g.shared_flight = flight
+            return response
+        finally:
+            g.coalescing_flight = None
+            with _flights_lock:
+                del _flights[key]
+            flight.done.set()
+    return wrapper
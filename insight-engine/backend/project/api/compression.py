@@ -0,0 +1,65 @@
+import functools
+import gzip
+
+
+@functools.lru_cache(maxsize=None)
+def _brotli():
+    """The brotli module, or None when it is not installed"""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def choose_encoding(accept_encodings):
+    """Best content-coding we can produce for an Accept-Encoding header (br > gzip)"""
+    if _brotli() is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding, gzip_level=6, brotli_quality=4):
+    if encoding == 'br':
+        return _brotli().compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+def init_compression(app):
+    """
+    Transparently gzip/brotli-compress response bodies above COMPRESS_MIN_BYTES
+
+    Registered after the monitoring hooks so that, with Flask running
+    after_request functions in reverse order, request metrics record the
+    bytes actually sent on the wire.
+    """
+    if not app.config['COMPRESS_ENABLED']:
+        return
+
+    from flask import request
+    from project.api.coalescing import encode_shared
+
+    min_bytes = app.config['COMPRESS_MIN_BYTES']
+    gzip_level = app.config['COMPRESS_GZIP_LEVEL']
+    brotli_quality = app.config['COMPRESS_BROTLI_QUALITY']
+
+    @app.after_request
+    def _compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        data = response.get_data()
+        if encoding is None or len(data) < min_bytes:
+            return response
+
+        response.set_data(encode_shared(
+            encoding, data, lambda body: compress(body, encoding, gzip_level, brotli_quality)
+        ))
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,123 @@
+import functools
+import json
+
+from flask import Response, jsonify, request
+
+from project.monitoring import timed_serialization
+
+JSON_MIMETYPE = 'application/json'
+COLUMNAR_MIMETYPE = 'application/vnd.insight.columnar+json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+# ?format= shortcuts for clients that cannot set Accept (e.g. plain links)
+FORMAT_ALIASES = {
+    'json': JSON_MIMETYPE,
+    'columnar': COLUMNAR_MIMETYPE,
+    'msgpack': MSGPACK_MIMETYPE,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def msgpack_available():
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def negotiate_format():
+    """Pick the response mimetype from ?format= or the Accept header; JSON unless asked otherwise"""
+    offered = [JSON_MIMETYPE, COLUMNAR_MIMETYPE]
+    if msgpack_available():
+        offered += [MSGPACK_MIMETYPE, 'application/x-msgpack']
+
+    requested = FORMAT_ALIASES.get(request.args.get('format', '').lower())
+    if requested in offered:
+        return requested
+    match = request.accept_mimetypes.best_match(offered, default=JSON_MIMETYPE)
+    return MSGPACK_MIMETYPE if match == 'application/x-msgpack' else match
+
+
+def _dictionary_encode(values):
+    """Replace a column of repeated strings with {'$dict': [...], '$codes': [...]} when it pays off"""
+    if not all(value is None or isinstance(value, str) for value in values):
+        return values
+    table = {}
+    codes = [None if value is None else table.setdefault(value, len(table)) for value in values]
+    if len(table) * 2 > len(values):
+        return values
+    return {'$dict': list(table), '$codes': codes}
+
+
+def to_columnar(value):
+    """
+    Recursively turn lists of same-shaped dicts into column arrays
+
+    `[{'a': 1, 'b': 'x'}, {'a': 2, 'b': 'x'}]` becomes
+    `{'$rows': 2, '$columns': {'a': [1, 2], 'b': {'$dict': ['x'], '$codes': [0, 0]}}}`,
+    so keys are sent once per list and repeated strings (category names,
+    retailers, attribute keys) once per column.
+    """
+    if isinstance(value, dict):
+        return {key: to_columnar(item) for key, item in value.items()}
+    if isinstance(value, list):
+        if value and all(isinstance(item, dict) for item in value):
+            keys = list(value[0])
+            if all(list(item) == keys for item in value):
+                return {
+                    '$rows': len(value),
+                    '$columns': {
+                        key: _dictionary_encode([to_columnar(item[key]) for item in value])
+                        for key in keys
+                    },
+                }
+        return [to_columnar(item) for item in value]
+    return value
+
+
+def from_columnar(value):
+    """Inverse of to_columnar(), for clients and tests"""
+    if isinstance(value, dict):
+        if '$dict' in value and '$codes' in value:
+            table = value['$dict']
+            return [None if code is None else table[code] for code in value['$codes']]
+        if '$rows' in value and '$columns' in value:
+            columns = {key: from_columnar(column) for key, column in value['$columns'].items()}
+            return [
+                {key: column[i] for key, column in columns.items()}
+                for i in range(value['$rows'])
+            ]
+        return {key: from_columnar(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [from_columnar(item) for item in value]
+    return value
+
+
+def encode_payload(payload, mimetype):
+    """Serialize a response payload to bytes for the given mimetype"""
+    if mimetype == MSGPACK_MIMETYPE:
+        import msgpack
+        return msgpack.packb(payload, use_bin_type=True)
+    if mimetype == COLUMNAR_MIMETYPE:
+        payload = to_columnar(payload)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+def respond(payload, status=200):
+    """
+    jsonify() replacement with content negotiation
+
+    Plain JSON goes through Flask's JSON provider unchanged; the columnar and
+    MessagePack encodings are produced only when the client asks for them.
+    """
+    mimetype = negotiate_format()
+    if mimetype == JSON_MIMETYPE:
+        response = jsonify(payload)
+    else:
+        with timed_serialization():
+            body = encode_payload(payload, mimetype)
+        response = Response(body, status=status, mimetype=mimetype)
+    response.status_code = status
+    response.vary.add('Accept')
+    return response
@@ -0,0 +1,163 @@
+import json
+import threading
+import time
+
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
+from project import db
+from project.models.models import Job
+from project.services import job_events
+
+# Create the background jobs blueprint
+jobs_bp = Blueprint('jobs', __name__)
+
+HEARTBEAT_SECONDS = 15
+
+_open_streams = 0
+_open_streams_lock = threading.Lock()
+
+
+def _open_stream(limit):
+    """Take one of this process's `limit` stream slots; False when all are taken"""
+    global _open_streams
+    with _open_streams_lock:
+        if _open_streams >= limit:
+            return False
+        _open_streams += 1
+        return True
+
+
+def _close_stream():
+    global _open_streams
+    with _open_streams_lock:
+        _open_streams -= 1
+
+
+def _sse(event, data, event_id=None):
+    prefix = f'id: {event_id}\n' if event_id is not None else ''
+    return f'{prefix}event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def _stream_from_broker(job_id, after, deadline):
+    """Events of a job running in this process, read from the shared broker history"""
+    while time.monotonic() < deadline:
+        events, finished = job_events.read(job_id, after, timeout=HEARTBEAT_SECONDS)
+        for event_id, event, data in events:
+            after = event_id
+            yield _sse(event, data, event_id)
+            if event in Job.TERMINAL_STATUSES:
+                return
+        if finished and not events:
+            if job_events.last_event(job_id) in Job.TERMINAL_STATUSES:
+                return  # Resumed after the final event, which the client already has
+            # A retry was queued, and any worker may run it: follow the job row from here
+            yield from _stream_from_database(job_id, deadline)
+            return
+        if not events:
+            yield ': keep-alive\n\n'
+
+
+def _stream_from_database(job_id, deadline):
+    """Events of a job running elsewhere, polled from its row"""
+    config = current_app.config
+    last, idle = None, 0.0
+    while time.monotonic() < deadline:
+        job = db.session.get(Job, job_id)
+        snapshot = job.to_dict()
+        db.session.rollback()  # End the read transaction so the next poll sees new commits
+        if snapshot['status'] in Job.TERMINAL_STATUSES:
+            yield _sse(snapshot['status'], {key: snapshot[key] for key in ('status', 'stage', 'result', 'error')})
+            return
+        state = {key: snapshot[key] for key in ('status', 'stage', 'progress')}
+        if state != last:
+            last, idle = state, 0.0
+            yield _sse('progress', state)
+        elif idle >= HEARTBEAT_SECONDS:
+            idle = 0.0
+            yield ': keep-alive\n\n'
+        time.sleep(config['JOB_POLL_SECONDS'])
+        idle += config['JOB_POLL_SECONDS']
+
+
+@jobs_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Get the status of a background job
+
+    Parameters:
+    - job_id: Id returned when the job was started
+
+    Returns:
+    - JSON response with the job status, current stage, progress counters and result or error
+    """
+    try:
+        job = db.session.get(Job, job_id)
+        if not job:
+            return jsonify({
+                'error': 'Job not found',
+                'message': f'No job found with ID {job_id}'
+            }), 404
+
+        return jsonify({'job': job.to_dict()}), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error fetching job {job_id}: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': f'Failed to fetch job with ID {job_id}'
+        }), 500
+
+
+@jobs_bp.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    """
+    Stream a job's progress as server-sent events
+
+    Events: `progress` ({status, stage, progress}) for every update, then one
+    `succeeded` ({result}) or `failed` ({error}) after which the stream ends.
+    Jobs running in this process are replayed from the start (or after
+    Last-Event-ID); for jobs running elsewhere the job row is polled.
+    An open stream holds a request thread, so each process serves at most
+    JOB_STREAM_MAX_OPEN at once and answers 503 beyond that.
+
+    Parameters:
+    - job_id: Id returned when the job was started
+    """
+    try:
+        job = db.session.get(Job, job_id)
+        if not job:
+            return jsonify({
+                'error': 'Job not found',
+                'message': f'No job found with ID {job_id}'
+            }), 404
+        db.session.rollback()
+
+        limit = current_app.config['JOB_STREAM_MAX_OPEN']
+        if not _open_stream(limit):
+            return jsonify({
+                'error': 'Service unavailable',
+                'message': f'This server already streams {limit} jobs; retry shortly or poll GET /api/jobs/{job_id}'
+            }), 503, {'Retry-After': '5'}
+
+        deadline = time.monotonic() + current_app.config['JOB_STREAM_SECONDS']
+        if job_id in job_events:
+            after = request.headers.get('Last-Event-ID', '0')
+            after = int(after) if after.isdigit() else 0
+            events = _stream_from_broker(job_id, after, deadline)
+        else:
+            events = _stream_from_database(job_id, deadline)
+
+        def stream():
+            yield 'retry: 2000\n\n'
+            yield from events
+
+        response = Response(stream_with_context(stream()), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        response.call_on_close(_close_stream)  # Also when the client disconnects mid-stream
+        return response
+
+    except Exception as e:
+        current_app.logger.error(f"Error streaming job {job_id}: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': f'Failed to stream job with ID {job_id}'
+        }), 500
@@ -0,0 +1,289 @@
+import hashlib
+import math
+import threading
+import time
+from collections import deque
+
+from flask import current_app, g, jsonify, request
+from sqlalchemy import case, delete, literal
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+
+from project import db
+from project.api.auth import matching_api_key
+from project.models.models import RateLimitBucket
+from project.monitoring import metrics
+from project.services.upserts import UPSERT_DIALECTS, upsert_insert
+
+# Route class of each endpoint (or whole blueprint); anything else is 'default'.
+# RATE_LIMIT_ROUTE_CLASSES entries override these.
+ROUTE_CLASSES = {
+    'health_check': 'exempt',
+    'prometheus_metrics': 'exempt',
+    'changes': 'stream',
+    'jobs.stream_job_events': 'stream',
+    'products.bulk_upsert_products': 'write',
+    'products.refresh_product_reviews': 'write',
+    'products.get_products_insights': 'expensive',
+    'products.get_products_analytics': 'expensive',
+    'query': 'expensive',
+}
+# Load shedding turns classes away from the lowest priority up; classes
+# without a priority (exempt, stream) are never shed
+SHED_PRIORITIES = {'expensive': 0, 'default': 1, 'write': 2}
+SHED_MAX_LEVEL = max(SHED_PRIORITIES.values())
+# Every PRUNE_SECONDS, buckets unused for IDLE_BUCKET_SECONDS are dropped. A dropped
+# bucket starts again full, so the idle time must exceed the slowest refill (burst / rate)
+PRUNE_SECONDS = 60
+IDLE_BUCKET_SECONDS = 3600
+
+
+class MemoryBuckets:
+    """Token buckets in this process; each API process limits on its own"""
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+        self._pruned_at = time.monotonic()
+
+    def take(self, key, rate, burst, cost):
+        """Take `cost` tokens from `key`'s bucket; returns (allowed, tokens left)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if now - self._pruned_at >= PRUNE_SECONDS:
+                self._prune(now)
+        return allowed, tokens
+
+    def _prune(self, now):
+        self._buckets = {
+            key: (tokens, updated_at) for key, (tokens, updated_at) in self._buckets.items()
+            if now - updated_at < IDLE_BUCKET_SECONDS
+        }
+        self._pruned_at = now
+
+
+class DatabaseBuckets:
+    """
+    Token buckets in the `rate_limit_buckets` table, shared by every API process
+
+    Each take is one INSERT ... ON CONFLICT DO UPDATE ... RETURNING on its
+    own connection, so concurrent requests from one client cannot both spend
+    the same token. When the database fails the request is let through:
+    the limiter must not take the API down with it.
+    """
+
+    def __init__(self):
+        self._pruned_at = time.time()
+
+    def take(self, key, rate, burst, cost):
+        now = time.time()
+        table = RateLimitBucket.__table__
+        try:
+            elapsed = case((table.c.updated_at < now, literal(now) - table.c.updated_at), else_=0)
+            refilled = case(
+                (table.c.tokens + elapsed * rate > burst, burst),
+                else_=table.c.tokens + elapsed * rate,
+            )
+            statement = upsert_insert(table).values(key=key, tokens=burst - cost, updated_at=now, allowed=True)
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.key],
+                set_={
+                    'tokens': case((refilled >= cost, refilled - cost), else_=refilled),
+                    'updated_at': case((table.c.updated_at < now, now), else_=table.c.updated_at),
+                    'allowed': refilled >= cost,
+                },
+            ).returning(table.c.allowed, table.c.tokens)
+
+            with db.engine.begin() as connection:
+                allowed, tokens = connection.execute(statement).one()
+                if now - self._pruned_at >= PRUNE_SECONDS:
+                    self._pruned_at = now
+                    connection.execute(delete(table).where(table.c.updated_at < now - IDLE_BUCKET_SECONDS))
+        except SQLAlchemyError as e:
+            current_app.logger.error(f"Rate limit lookup failed, allowing request: {str(e)}")
+            return True, burst
+        return bool(allowed), tokens
+
+
+class LoadShedder:
+    """
+    Admission gate that sheds low-priority requests while requests queue
+
+    At most SHED_MAX_CONCURRENCY gated requests run at once; the rest wait
+    in FIFO order for a slot, and that wait is the queue latency. As in CoDel, the
+    smallest wait seen in each SHED_INTERVAL_MS window is what counts: above
+    SHED_TARGET_MS a queue is standing rather than absorbing a burst, so
+    the shed level goes up by one, turning away the lowest remaining
+    priority ('expensive' first, then 'default'); once a window's wait is
+    back under target it comes down by one. Any request still waiting
+    after SHED_MAX_WAIT_MS is rejected whatever its priority.
+    """
+
+    def __init__(self, max_concurrency, target, interval, max_wait):
+        self.max_concurrency = max_concurrency
+        self.running = 0
+        self._waiters = deque()  # Events of queued requests; a freed slot goes to the oldest
+        self.target = target
+        self.interval = interval
+        self.max_wait = max_wait
+        self.level = 0
+        self.window_min = None  # Smallest wait in the current window
+        self.last_min = 0.0     # ... and in the previous one, for /metrics
+        self._window_start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _roll_window(self, now):
+        if now - self._window_start < self.interval:
+            return
+        if self.window_min is not None and self.window_min > self.target:
+            self.level = min(self.level + 1, SHED_MAX_LEVEL)
+        elif self.level:
+            self.level -= 1  # Under target, or nothing admitted to measure
+        self.last_min = self.window_min or 0.0
+        self.window_min = None
+        self._window_start = now
+
+    def admit(self, priority):
+        """Wait for a slot; returns None once admitted, else why the request is shed"""
+        with self._lock:
+            self._roll_window(time.monotonic())
+            if priority < self.level:
+                return 'overload'
+            if self.running < self.max_concurrency and not self._waiters:
+                self.running += 1
+                self._observe(0.0)
+                return None
+            turn = threading.Event()
+            self._waiters.append(turn)
+
+        started = time.monotonic()
+        admitted = turn.wait(self.max_wait)
+        with self._lock:
+            if not admitted:
+                try:
+                    self._waiters.remove(turn)
+                except ValueError:
+                    admitted = True  # Handed a slot just as the wait timed out
+            self._observe(time.monotonic() - started)
+        return None if admitted else 'timeout'
+
+    def _observe(self, waited):
+        if self.window_min is None or waited < self.window_min:
+            self.window_min = waited
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().set()  # The slot passes straight to the next in line
+            else:
+                self.running -= 1
+
+
+def route_class(endpoint, classes):
+    """Route class of a Flask endpoint name (None for unmatched URLs) in an endpoint-or-blueprint map"""
+    if endpoint in classes:
+        return classes[endpoint]
+    blueprint = endpoint.rpartition('.')[0] if endpoint else ''
+    return classes.get(blueprint, 'default')
+
+
+def client_id(proxy_count):
+    """
+    Who a request's tokens are charged to
+
+    A configured API key identifies its holder wherever they connect from;
+    everyone else is limited per IP. Behind RATE_LIMIT_PROXY_COUNT trusted
+    proxies the IP is the X-Forwarded-For entry the outermost one appended,
+    since clients can put anything before it.
+    """
+    key = matching_api_key()
+    if key is not None:
+        return 'key:' + hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+    if proxy_count:
+        forwarded = [entry.strip() for entry in request.headers.get('X-Forwarded-For', '').split(',')]
+        if len(forwarded) >= proxy_count and forwarded[-proxy_count]:
+            return 'ip:' + forwarded[-proxy_count]
+    return 'ip:' + (request.remote_addr or 'unknown')
+
+
+def request_cost(burst):
+    """Tokens a request takes: one per default-sized page it asks for"""
+    per_page = request.args.get('per_page', type=int)
+    if not per_page or per_page <= 0:
+        return 1
+    return min(math.ceil(per_page / current_app.config['ITEMS_PER_PAGE']), burst)
+
+
+def init_rate_limits(app):
+    """
+    Rate-limit each client per route class and shed load under queueing
+
+    Registered after the monitoring hooks, so rejected requests still show
+    up in request metrics with their 429 or 503 status.
+    """
+    config = app.config
+    limits = config['RATE_LIMITS'] if config['RATE_LIMIT_ENABLED'] else {}
+    classes = {**ROUTE_CLASSES, **config['RATE_LIMIT_ROUTE_CLASSES']}
+    if config['RATE_LIMIT_STORAGE'] == 'database':
+        dialect = make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+        if dialect not in UPSERT_DIALECTS:
+            raise ValueError(f"RATE_LIMIT_STORAGE=database needs PostgreSQL or SQLite, not {dialect}; use memory")
+        buckets = DatabaseBuckets()
+    elif config['RATE_LIMIT_STORAGE'] == 'memory':
+        buckets = MemoryBuckets()
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT_STORAGE '{config['RATE_LIMIT_STORAGE']}'; use memory or database")
+
+    shedder = None
+    if config['LOAD_SHED_ENABLED']:
+        shedder = LoadShedder(config['SHED_MAX_CONCURRENCY'], config['SHED_TARGET_MS'] / 1000,
+                              config['SHED_INTERVAL_MS'] / 1000, config['SHED_MAX_WAIT_MS'] / 1000)
+        metrics.register_gauge('load_shed_level', lambda: shedder.level)
+        metrics.register_gauge('load_shed_queue_delay_seconds', lambda: shedder.last_min)
+
+    if not limits and shedder is None:
+        return
+    app.extensions['rate_limits'] = {'buckets': buckets, 'shedder': shedder}
+
+    @app.before_request
+    def _limit_request():
+        if request.method == 'OPTIONS':
+            return None  # CORS preflights carry no credentials and do no work
+        name = route_class(request.endpoint, classes)
+        if name == 'exempt':
+            return None
+
+        limit = limits.get(name)
+        if limit is not None:
+            rate, burst = limit
+            cost = request_cost(burst)
+            allowed, tokens = buckets.take(f'{name}:{client_id(config["RATE_LIMIT_PROXY_COUNT"])}', rate, burst, cost)
+            if not allowed:
+                metrics.inc('rate_limited_requests_total', {'class': name})
+                retry_after = max(1, math.ceil((cost - tokens) / rate))
+                return jsonify({
+                    'error': 'Too many requests',
+                    'message': f'Rate limit for {name} requests exceeded; retry in {retry_after}s'
+                }), 429, {'Retry-After': str(retry_after)}
+
+        if shedder is not None and name in SHED_PRIORITIES:
+            reason = shedder.admit(SHED_PRIORITIES[name])
+            if reason is not None:
+                metrics.inc('shed_requests_total', {'class': name, 'reason': reason})
+                return jsonify({
+                    'error': 'Service overloaded',
+                    'message': 'The server is busy; retry shortly'
+                }), 503, {'Retry-After': '1'}
+            g._shed_slot = True
+        return None
+
+    @app.teardown_request
+    def _release_shed_slot(exception=None):
+        if g.pop('_shed_slot', False):
+            shedder.release()
@@ -1,6 +1,8 @@
 from flask import Blueprint, jsonify, request, current_app
+from sqlalchemy import func
 from sqlalchemy.orm import joinedload
 from project.models import LuxuryAppliance, AggregatedReview
+from project.services import count_by, grouped_counts, parse_bucket_edges, price_bucket_case
 from project import db
 import logging
 
@@ -182,80 +184,55 @@ def get_luxury_appliances_insights():
     Returns aggregated insights across all luxury appliances
     """
     try:
-        # Get all appliances with reviews
-        appliances = LuxuryAppliance.query.all()
+        bucket_edges = parse_bucket_edges(
+            request.args.get('buckets'), current_app.config['PRICE_BUCKET_EDGES']
+        )
+        
+        # Counts and averages in a single round-trip
+        average_msrp = db.session.query(func.avg(LuxuryAppliance.msrp))\
+            .filter(LuxuryAppliance.msrp > 0)\
+            .scalar_subquery()
+        total, rated, average_rating, average_msrp = db.session.query(
+            func.count(func.distinct(LuxuryAppliance.id)),
+            func.count(func.distinct(AggregatedReview.luxury_appliance_id)),
+            func.avg(AggregatedReview.overall_rating),
+            average_msrp
+        ).outerjoin(
+            AggregatedReview,
+            (LuxuryAppliance.id == AggregatedReview.luxury_appliance_id) &
+            AggregatedReview.overall_rating.isnot(None)
+        ).one()
+        
+        # Brand, category, design style and price bucket counts in a second round-trip
+        breakdowns = grouped_counts(
+            count_by('brand', LuxuryAppliance.brand),
+            count_by('category', LuxuryAppliance.category),
+            count_by('design_style', LuxuryAppliance.design_style),
+            count_by('price_range', price_bucket_case(LuxuryAppliance.msrp, bucket_edges),
+                     LuxuryAppliance.msrp > 0)
+        )
+        
+        # Collect a bounded sample of insight snippets
+        common_insights = [
+            snippet for (snippet,) in db.session.query(LuxuryAppliance.insight_snippet)
+            .filter(LuxuryAppliance.insight_snippet.isnot(None))
+            .limit(current_app.config['INSIGHTS_SNIPPET_LIMIT'])
+        ]
         
         insights = {
-            'total_appliances': len(appliances),
-            'appliances_with_reviews': 0,
-            'average_rating': 0,
-            'brand_breakdown': {},
-            'category_breakdown': {},
-            'design_style_breakdown': {},
+            'total_appliances': total,
+            'appliances_with_reviews': rated,
+            'average_rating': round(average_rating, 2) if average_rating else 0,
+            'brand_breakdown': breakdowns.get('brand', {}),
+            'category_breakdown': breakdowns.get('category', {}),
+            'design_style_breakdown': breakdowns.get('design_style', {}),
             'price_range_analysis': {
-                'average_msrp': 0,
-                'price_ranges': {}
+                'average_msrp': round(average_msrp, 2) if average_msrp else 0,
+                'price_ranges': breakdowns.get('price_range', {})
             },
-            'common_insights': []
+            'common_insights': common_insights
         }
         
-        total_rating = 0
-        rated_appliances = 0
-        total_msrp = 0
-        priced_appliances = 0
-        
-        for appliance in appliances:
-            reviews = appliance.reviews
-            if reviews and len(reviews) > 0:
-                review = reviews[0]  # Get first review
-                if review.overall_rating:
-                    insights['appliances_with_reviews'] += 1
-                    total_rating += review.overall_rating
-                    rated_appliances += 1
-            
-            # Count brands
-            if appliance.brand:
-                insights['brand_breakdown'][appliance.brand] = \
-                    insights['brand_breakdown'].get(appliance.brand, 0) + 1
-            
-            # Count categories
-            if appliance.category:
-                insights['category_breakdown'][appliance.category] = \
-                    insights['category_breakdown'].get(appliance.category, 0) + 1
-            
-            # Count design styles
-            if appliance.design_style:
-                insights['design_style_breakdown'][appliance.design_style] = \
-                    insights['design_style_breakdown'].get(appliance.design_style, 0) + 1
-            
-            # Price analysis
-            if appliance.msrp:
-                total_msrp += appliance.msrp
-                priced_appliances += 1
-                
-                # Categorize price ranges
-                if appliance.msrp < 5000:
-                    price_range = 'Under $5,000'
-                elif appliance.msrp < 10000:
-                    price_range = '$5,000 - $10,000'
-                elif appliance.msrp < 15000:
-                    price_range = '$10,000 - $15,000'
-                else:
-                    price_range = 'Over $15,000'
-                
-                insights['price_range_analysis']['price_ranges'][price_range] = \
-                    insights['price_range_analysis']['price_ranges'].get(price_range, 0) + 1
-            
-            # Collect insight snippets
-            if appliance.insight_snippet:
-                insights['common_insights'].append(appliance.insight_snippet)
-        
-        if rated_appliances > 0:
-            insights['average_rating'] = round(total_rating / rated_appliances, 2)
-        
-        if priced_appliances > 0:
-            insights['price_range_analysis']['average_msrp'] = round(total_msrp / priced_appliances, 2)
-        
         return jsonify({
             'success': True,
             'data': insights
@@ -275,8 +252,6 @@ def get_luxury_appliance_brands():
     Returns list of all brands with their appliance counts
     """
     try:
-        from sqlalchemy import func
-        
         # Get brand statistics - fixed to work with our simplified model
         brand_stats = db.session.query(
             LuxuryAppliance.brand,
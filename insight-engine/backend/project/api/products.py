@@ -1,13 +1,49 @@
+from datetime import date
 from flask import Blueprint, jsonify, request, current_app
-from sqlalchemy import desc
+from sqlalchemy import desc, func
+from sqlalchemy.orm import contains_eager, selectinload
 from project import db
-from project.models.models import Product, SubCategory, Category, AggregatedReview
+from project.models.models import Product, SubCategory, Category, AggregatedReview, PriceAlert, ProductPopularity
+from project.api.auth import require_api_key
+from project.api.coalescing import after_shared, coalesce
+from project.api.formats import respond
+from project.monitoring import timed_serialization
+from project.services import (
+    CatalogUpserter, FacetPagination, ProductFieldset, ScatterPagination, UpsertError, catalog_sessions,
+    compare_products, enqueue_review_refresh, get_catalog_snapshot, get_facet_index, get_shard_router,
+    get_shared_snapshot, get_suggest_index, parse_bucket_edges, parse_facet_args, parse_product_ids, popularity,
+    shard_session, vertical_insights
+)
 
 # Create the products blueprint
 products_bp = Blueprint('products', __name__)
 
 
+def subcategory_name_from_slug(slug):
+    """Convert a kebab-case slug (e.g. 'luxury-appliances') to the stored subcategory name"""
+    subcategory_name = slug.replace('-', ' ').title()
+    if subcategory_name.lower() == 'ai tools':
+        subcategory_name = 'AI Tools'
+    return subcategory_name
+
+
+def sharded_catalog_error(message):
+    """400 for features that read the default database only, while CATALOG_SHARDS is set"""
+    return jsonify({
+        'error': 'Bad request',
+        'message': message
+    }), 400
+
+
+def subcategory_product_counts():
+    """{subcategory id: product count}, in one grouped query"""
+    return dict(
+        db.session.query(Product.subcategory_id, func.count(Product.id)).group_by(Product.subcategory_id).all()
+    )
+
+
 @products_bp.route('/products', methods=['GET'])
+@coalesce
 def get_products():
     """
     Get all products or filter by subcategory
@@ -16,6 +52,23 @@ def get_products():
     - subcategory: Filter by subcategory name (e.g., 'ai-tools', 'luxury-appliances')
     - page: Page number for pagination (default: 1)
     - per_page: Items per page (default: 20, max: 100)
+    - fields: Comma-separated summary fields to return (default: all summary fields)
+    - include: Related data to embed: attributes, aggregated_review, price_history or price_history[latest]
+    - format: 'json' (default), 'columnar' or 'msgpack'; also negotiated from the Accept header
+    - brand, rating, price, attr.<key>: Facet filters, repeatable (e.g. rating=4-4.5&attr.Design Style=Modern)
+    - facets: Comma-separated facets to count (default: all); with any facet filter, subcategory repeats too
+    - sort: 'rating' (default) or 'trending' (time-decayed views, clicks and impressions)
+    
+    Facet filtering returns a `facets` object of {value, label, count, selected}
+    lists, each counted with the other facets' filters applied.
+    
+    With CATALOG_SNAPSHOT_ENABLED, requests without `include` are answered from
+    the in-process catalog snapshot instead of the database, or from the shared
+    snapshot file at CATALOG_SNAPSHOT_SHARED_PATH (the database while it is missing).
+    
+    With CATALOG_SHARDS, a subcategory listing is read from the shard holding it
+    and an unfiltered one is merged from every shard; facets and sort=trending
+    are then unavailable.
     
     Returns:
     - JSON response with products list, pagination info, and metadata
@@ -25,39 +78,125 @@ def get_products():
         subcategory_param = request.args.get('subcategory')
         page = request.args.get('page', 1, type=int)
         per_page = min(request.args.get('per_page', 20, type=int), 100)
+        sort = request.args.get('sort', 'rating')
         
-        # Start with base query, joining necessary tables for sorting
-        query = db.session.query(Product).outerjoin(AggregatedReview)
+        try:
+            fieldset = ProductFieldset.parse(request.args.get('fields'), request.args.get('include'))
+        except ValueError as e:
+            return jsonify({
+                'error': 'Bad request',
+                'message': str(e)
+            }), 400
         
-        # Filter by subcategory if provided
-        if subcategory_param:
-            # Convert kebab-case to proper case for lookup
-            subcategory_name = subcategory_param.replace('-', ' ').title()
-            if subcategory_name.lower() == 'ai tools':
-                subcategory_name = 'AI Tools'
-            
-            query = query.join(SubCategory).filter(SubCategory.name == subcategory_name)
-        
-        # Sort by overall_rating (highest first), then by name
-        # Note: SQLite doesn't support NULLS LAST, so we use a different approach
-        query = query.order_by(
-            desc(AggregatedReview.overall_rating.is_(None)),
-            desc(AggregatedReview.overall_rating),
-            Product.name
-        )
+        subcategory_name = subcategory_name_from_slug(subcategory_param) if subcategory_param else None
         
-        # Paginate results
-        pagination = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        facet_selections = parse_facet_args(request.args)
+        if sort not in ('rating', 'trending') or (sort == 'trending' and facet_selections is not None):
+            return jsonify({
+                'error': 'Bad request',
+                'message': "sort must be 'rating' or 'trending' (facet filters support 'rating' only)"
+            }), 400
+        # The facet index and popularity counters cover the default database only
+        router = get_shard_router()
+        if router.enabled and (facet_selections is not None or sort == 'trending'):
+            return jsonify({
+                'error': 'Bad request',
+                'message': 'Facet filters and sort=trending are not available on a sharded catalog'
+            }), 400
+        
+        facets = None
+        if facet_selections is not None:
+            # Filters and facet counts come from the precomputed bitmap index
+            index = get_facet_index(current_app.config)
+            requested = [name.strip() for name in request.args.get('facets', '').split(',') if name.strip()]
+            try:
+                index.validate(facet_selections)
+                facets = index.counts(facet_selections, requested or None, current_app.config['FACET_VALUE_LIMIT'])
+            except ValueError as e:
+                return jsonify({
+                    'error': 'Bad request',
+                    'message': str(e)
+                }), 400
+        
+        snapshot = None
+        if (facet_selections is None and sort == 'rating' and not router.enabled
+                and current_app.config['CATALOG_SNAPSHOT_ENABLED'] and not fieldset.include):
+            # Summary-only listings are served from a snapshot, without a DB round-trip: the
+            # memory-mapped file shared by all workers when configured, else this process's copy
+            if current_app.config['CATALOG_SNAPSHOT_SHARED_PATH']:
+                snapshot = get_shared_snapshot(current_app.config)
+            else:
+                snapshot = get_catalog_snapshot(current_app.config)
+        
+        if facet_selections is not None:
+            # Only the requested page of the match is loaded, by id
+            query = db.session.query(Product).outerjoin(AggregatedReview).options(
+                *fieldset.load_options(review_joined=True)
+            )
+            pagination = FacetPagination(page=page, per_page=per_page, error_out=False, index=index,
+                                         mask=index.match(facet_selections), query=query)
+        elif snapshot is not None:
+            pagination = snapshot.paginate(subcategory_name, page, per_page)
+        else:
+            # One subcategory lives on one database; an unfiltered sharded listing spans them all
+            if not router.enabled:
+                sessions = [db.session]
+            elif subcategory_name:
+                sessions = [shard_session(router.bind_for_subcategory(subcategory_name))]
+            else:
+                sessions = list(catalog_sessions().values())
+            
+            queries = []
+            for session in sessions:
+                # Start with base query, joining necessary tables for sorting;
+                # load only the columns and relationships the fieldset serializes
+                query = session.query(Product).outerjoin(AggregatedReview).options(
+                    *fieldset.load_options(review_joined=True)
+                )
+                
+                # Filter by subcategory if provided
+                if subcategory_name:
+                    query = query.join(SubCategory).filter(SubCategory.name == subcategory_name)
+                
+                if sort == 'trending':
+                    # Most engagement lately first; products never seen fall back to the rating order
+                    query = query.outerjoin(ProductPopularity, ProductPopularity.product_id == Product.id).order_by(
+                        ProductPopularity.trending_score.is_(None),
+                        desc(ProductPopularity.trending_score)
+                    )
+                
+                # Sort by overall_rating (highest first), then by name
+                # Note: SQLite doesn't support NULLS LAST, so we use a different approach
+                query = query.order_by(
+                    desc(AggregatedReview.overall_rating.is_(None)),
+                    desc(AggregatedReview.overall_rating),
+                    Product.name,
+                    Product.id
+                )
+                queries.append(query)
+            
+            # Paginate results
+            if len(queries) > 1:
+                # Every shard reads page x per_page rows, so the depth is capped
+                if page * per_page > current_app.config['SHARD_SCATTER_MAX_ROWS']:
+                    return sharded_catalog_error(
+                        f"Pages past row {current_app.config['SHARD_SCATTER_MAX_ROWS']} of the listing across "
+                        f"shards are not available; filter by subcategory"
+                    )
+                pagination = ScatterPagination(page=page, per_page=per_page, error_out=False, queries=queries)
+            else:
+                pagination = queries[0].paginate(
+                    page=page,
+                    per_page=per_page,
+                    error_out=False
+                )
         
         # Convert products to dictionary format
-        products = []
-        for product in pagination.items:
-            product_dict = product.to_dict(include_details=False)
-            products.append(product_dict)
+        with timed_serialization():
+            products = []
+            for product in pagination.items:
+                product_dict = product.to_dict(**fieldset.to_dict_kwargs())
+                products.append(product_dict)
         
         # Prepare response
         response = {
@@ -75,10 +214,16 @@ def get_products():
             'filters': {
                 'subcategory': subcategory_param
             },
+            'sort': sort,
             'total_count': pagination.total
         }
+        if facets is not None:
+            response['filters'].update(facet_selections)
+            response['facets'] = facets
         
-        return jsonify(response), 200
+        after_shared(popularity.record, 'impressions', [product['id'] for product in products])
+        
+        return respond(response, 200)
         
     except Exception as e:
         current_app.logger.error(f"Error fetching products: {str(e)}")
@@ -88,7 +233,84 @@ def get_products():
         }), 500
 
 
+@products_bp.route('/products/compare', methods=['GET'])
+@coalesce
+def compare_products_view():
+    """
+    Compare products side by side as one aligned matrix
+    
+    Query Parameters:
+    - ids: Comma-separated product IDs, in column order (2 to COMPARE_MAX_PRODUCTS)
+    - format: 'json' (default), 'columnar' or 'msgpack'; also negotiated from the Accept header
+    
+    Returns:
+    - JSON response with the products, then attribute, rating and latest-price-per-retailer
+      rows holding one value per product; ids that do not exist are listed in `missing`
+    """
+    try:
+        try:
+            product_ids = parse_product_ids(request.args.get('ids'), current_app.config['COMPARE_MAX_PRODUCTS'])
+        except ValueError as e:
+            return jsonify({
+                'error': 'Bad request',
+                'message': str(e)
+            }), 400
+        # Comparisons are assembled from the default database only
+        router = get_shard_router()
+        if any(router.on_shard(product_id) for product_id in product_ids):
+            return sharded_catalog_error('Comparisons are not available for products on a catalog shard')
+        
+        with timed_serialization():
+            comparison = compare_products(product_ids)
+        if not comparison['products']:
+            return jsonify({
+                'error': 'Products not found',
+                'message': f"No products found with IDs {', '.join(map(str, product_ids))}"
+            }), 404
+        
+        return respond(comparison, 200)
+    
+    except Exception as e:
+        current_app.logger.error(f"Error comparing products: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': 'Failed to compare products'
+        }), 500
+
+
+@products_bp.route('/products/suggest', methods=['GET'])
+@coalesce
+def suggest_products():
+    """
+    Typeahead suggestions for a search box, from the in-memory prefix index
+    
+    Query Parameters:
+    - q: What the user has typed so far; matches the start of any word of a name
+    - limit: Suggestions per group (default: SUGGEST_LIMIT, max: 20)
+    
+    Returns:
+    - JSON response with matching products (best rated first), brands and subcategories
+    """
+    try:
+        query = request.args.get('q', '')
+        limit = max(1, min(request.args.get('limit', current_app.config['SUGGEST_LIMIT'], type=int), 20))
+        
+        suggestions = get_suggest_index(current_app.config).suggest(query, limit)
+        
+        response = jsonify(dict(suggestions, query=query))
+        response.headers['Cache-Control'] = f"public, max-age={current_app.config['SUGGEST_MAX_AGE_SECONDS']}"
+        return response, 200
+    
+    except Exception as e:
+        current_app.logger.error(f"Error fetching suggestions: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': 'Failed to fetch suggestions'
+        }), 500
+
+
 @products_bp.route('/products/<int:product_id>', methods=['GET'])
+@coalesce
 def get_product(product_id):
     """
     Get detailed information for a single product
@@ -96,12 +318,33 @@ def get_product(product_id):
     Parameters:
     - product_id: Integer ID of the product
     
+    Query Parameters:
+    - fields: Comma-separated summary fields to return (default: all summary fields)
+    - include: Related data to embed (default: attributes,aggregated_review,price_history);
+      price_history[latest] returns only the most recent prices, and an empty include= returns none
+    - format: 'json' (default), 'columnar' or 'msgpack'; also negotiated from the Accept header
+    
     Returns:
     - JSON response with full product details including attributes, price history, and reviews
     """
     try:
-        # Fetch product with all related data
-        product = db.session.query(Product).filter_by(id=product_id).first()
+        try:
+            fieldset = ProductFieldset.parse(
+                request.args.get('fields'), request.args.get('include'),
+                default_include=Product.DETAIL_INCLUDES
+            )
+        except ValueError as e:
+            return jsonify({
+                'error': 'Bad request',
+                'message': str(e)
+            }), 400
+        
+        # Fetch the product, from the shard its id range belongs to, with only the requested related data
+        try:
+            session = shard_session(get_shard_router().bind_for_id(product_id))
+        except LookupError:
+            session = None
+        product = session and session.query(Product).options(*fieldset.load_options()).filter_by(id=product_id).first()
         
         if not product:
             return jsonify({
@@ -110,11 +353,14 @@ def get_product(product_id):
             }), 404
         
         # Convert to dictionary with full details
-        product_data = product.to_dict(include_details=True)
+        with timed_serialization():
+            product_data = product.to_dict(**fieldset.to_dict_kwargs())
         
-        return jsonify({
+        after_shared(popularity.record, 'views', [product_id])
+        
+        return respond({
             'product': product_data
-        }), 200
+        }, 200)
         
     except Exception as e:
         current_app.logger.error(f"Error fetching product {product_id}: {str(e)}")
@@ -124,7 +370,233 @@ def get_product(product_id):
         }), 500
 
 
+@products_bp.route('/products/<int:product_id>/click', methods=['POST'])
+def record_product_click(product_id):
+    """
+    Count a click-through on a product (e.g. to a retailer), for trending scores
+    
+    Parameters:
+    - product_id: Integer ID of the product
+    
+    Returns:
+    - 204 once counted in memory; counters reach the database in batches
+    """
+    try:
+        try:
+            session = shard_session(get_shard_router().bind_for_id(product_id))
+        except LookupError:
+            session = None
+        if not session or session.query(Product.id).filter_by(id=product_id).first() is None:
+            return jsonify({
+                'error': 'Product not found',
+                'message': f'No product found with ID {product_id}'
+            }), 404
+        
+        popularity.record('clicks', [product_id])
+        return '', 204
+    
+    except Exception as e:
+        current_app.logger.error(f"Error recording click for product {product_id}: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': f'Failed to record click for product with ID {product_id}'
+        }), 500
+
+
+@products_bp.route('/products/<int:product_id>/similar', methods=['GET'])
+@coalesce
+def get_similar_products(product_id):
+    """
+    Get the products most similar to a product, from the precomputed similarity index
+    
+    Parameters:
+    - product_id: Integer ID of the product
+    
+    Query Parameters:
+    - k: Number of similar products (default: 10, max: SIMILARITY_MAX_K)
+    
+    Returns:
+    - JSON response with similar products ordered by cosine similarity
+    """
+    # Imported here so that NumPy is only loaded once the endpoint is used
+    from project.services import get_similarity_index
+    
+    try:
+        k = max(1, min(request.args.get('k', 10, type=int), current_app.config['SIMILARITY_MAX_K']))
+        # The similarity index is built from the default database only
+        if get_shard_router().on_shard(product_id):
+            return sharded_catalog_error('Similar products are not available for products on a catalog shard')
+        
+        index = get_similarity_index(current_app.config)
+        if index is None:
+            return jsonify({
+                'error': 'Similarity index unavailable',
+                'message': 'The similarity index has not been built yet; run `flask similarity build`'
+            }), 503
+        
+        neighbours = index.similar(product_id, k)
+        if neighbours is None:
+            return jsonify({
+                'error': 'Product not found',
+                'message': f'No product found with ID {product_id}'
+            }), 404
+        
+        # Hydrate only the neighbours, in one query
+        scores = dict(neighbours)
+        rows = db.session.query(
+            Product.id, Product.name, Product.brand, Product.image_url,
+            Product.subcategory_id, AggregatedReview.overall_rating
+        ).outerjoin(AggregatedReview).filter(Product.id.in_(list(scores))).all()
+        by_id = {row.id: row for row in rows}
+        
+        with timed_serialization():
+            similar = [
+                {
+                    'id': row.id,
+                    'name': row.name,
+                    'brand': row.brand,
+                    'image_url': row.image_url,
+                    'subcategory_id': row.subcategory_id,
+                    'overall_rating': row.overall_rating,
+                    'similarity': round(scores[row.id], 4)
+                }
+                for row in (by_id.get(neighbour_id) for neighbour_id, _ in neighbours)
+                if row is not None
+            ]
+        
+        return jsonify({
+            'product_id': product_id,
+            'k': k,
+            'similar': similar
+        }), 200
+    
+    except Exception as e:
+        current_app.logger.error(f"Error fetching similar products for {product_id}: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': f'Failed to fetch similar products for product with ID {product_id}'
+        }), 500
+
+
+@products_bp.route('/products/bulk', methods=['POST'])
+@require_api_key
+def bulk_upsert_products():
+    """
+    Create or update a batch of products with their attributes, prices and review aggregates
+    
+    Requires an API key (Authorization: Bearer <key> or X-API-Key header).
+    
+    Request Body (JSON):
+    {
+        "products": [
+            {
+                "brand": "Sub-Zero", "name": "PRO 48", "subcategory": "luxury-appliances",
+                "short_description": "...", "insight_snippet": "...", "image_url": "...",
+                "attributes": {"MSRP": "24999", "Style Tags": "Professional, Stainless"},
+                "prices": [{"retailer_name": "AJ Madison", "price": 23999.0, "date_recorded": "2024-05-01"}],
+                "review": {"overall_rating": 4.6, "total_reviews_analyzed": 212}
+            }
+        ]
+    }
+    
+    Products are matched on brand + name, prices on product + retailer + date and
+    attributes on product + key. Omitted fields keep their stored values, and rows
+    whose values did not change are not rewritten (updated_at is left alone).
+    The batch is applied in one transaction.
+    
+    Returns:
+    - JSON response with inserted/updated/unchanged counts per table
+    """
+    try:
+        body = request.get_json(silent=True)
+        items = body.get('products') if isinstance(body, dict) else body
+        if not isinstance(items, list) or not items:
+            return jsonify({
+                'error': 'Bad request',
+                'message': 'Request body must be {"products": [...]} with at least one product'
+            }), 400
+        
+        max_products = current_app.config['BULK_MAX_PRODUCTS']
+        if len(items) > max_products:
+            return jsonify({
+                'error': 'Payload too large',
+                'message': f'At most {max_products} products per request; split the batch'
+            }), 413
+        
+        try:
+            result = CatalogUpserter.from_config(current_app.config).apply(
+                items, routed_subcategories=get_shard_router().subcategory_shards()
+            )
+        except UpsertError as e:
+            return jsonify({
+                'error': 'Bad request',
+                'message': str(e)
+            }), 400
+        
+        return jsonify({'result': result}), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Error upserting products: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': 'Failed to upsert products'
+        }), 500
+
+
+@products_bp.route('/products/<int:product_id>/reviews/refresh', methods=['POST'])
+def refresh_product_reviews(product_id):
+    """
+    Start a background refresh of a product's review aggregate from Reddit
+    
+    Returns immediately; follow progress (posts fetched, reviews scored, aggregate
+    updated) at /api/jobs/<job_id>/events. A refresh already in progress for the
+    product is returned instead of starting another, as is the job first started
+    with the same Idempotency-Key header. Failed attempts are retried with backoff.
+    
+    Parameters:
+    - product_id: Integer ID of the product
+    
+    Returns:
+    - 202 JSON response with the job and its status/events URLs
+    """
+    try:
+        # Refresh jobs write review aggregates to the default database only
+        if get_shard_router().on_shard(product_id):
+            return sharded_catalog_error('Review refreshes are not available for products on a catalog shard')
+        if db.session.get(Product, product_id) is None:
+            return jsonify({
+                'error': 'Product not found',
+                'message': f'No product found with ID {product_id}'
+            }), 404
+        
+        idempotency_key = request.headers.get('Idempotency-Key') or None
+        if idempotency_key is not None and len(idempotency_key) > 200:
+            return jsonify({
+                'error': 'Bad request',
+                'message': 'Idempotency-Key must be at most 200 characters'
+            }), 400
+        
+        job, created = enqueue_review_refresh(product_id, idempotency_key)
+        
+        return jsonify({
+            'job': job.to_dict(),
+            'created': created,
+            'links': {
+                'status': f'/api/jobs/{job.id}',
+                'events': f'/api/jobs/{job.id}/events'
+            }
+        }), 202, {'Location': f'/api/jobs/{job.id}'}
+        
+    except Exception as e:
+        current_app.logger.error(f"Error starting review refresh for product {product_id}: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': f'Failed to start review refresh for product with ID {product_id}'
+        }), 500
+
+
 @products_bp.route('/products/subcategories', methods=['GET'])
+@coalesce
 def get_subcategories():
     """
     Get all available subcategories with their categories
@@ -133,20 +605,24 @@ def get_subcategories():
     - JSON response with list of subcategories and their parent categories
     """
     try:
-        subcategories = db.session.query(SubCategory).join(Category).all()
-        
-        subcategories_data = []
-        for subcategory in subcategories:
-            subcategories_data.append({
-                'id': subcategory.id,
-                'name': subcategory.name,
-                'slug': subcategory.name.lower().replace(' ', '-'),
-                'category': {
-                    'id': subcategory.category.id,
-                    'name': subcategory.category.name
-                },
-                'product_count': len(subcategory.products)
-            })
+        subcategories = db.session.query(SubCategory).join(Category).options(
+            contains_eager(SubCategory.category)
+        ).all()
+        product_counts = subcategory_product_counts()
+        
+        with timed_serialization():
+            subcategories_data = []
+            for subcategory in subcategories:
+                subcategories_data.append({
+                    'id': subcategory.id,
+                    'name': subcategory.name,
+                    'slug': subcategory.name.lower().replace(' ', '-'),
+                    'category': {
+                        'id': subcategory.category.id,
+                        'name': subcategory.category.name
+                    },
+                    'product_count': product_counts.get(subcategory.id, 0)
+                })
         
         return jsonify({
             'subcategories': subcategories_data
@@ -161,6 +637,7 @@ def get_subcategories():
 
 
 @products_bp.route('/products/categories', methods=['GET'])
+@coalesce
 def get_categories():
     """
     Get all available categories with their subcategories
@@ -169,22 +646,28 @@ def get_categories():
     - JSON response with list of categories and their subcategories
     """
     try:
-        categories = db.session.query(Category).order_by(Category.display_order, Category.name).all()
+        categories = db.session.query(Category).options(
+            selectinload(Category.subcategories)
+        ).order_by(Category.display_order, Category.name).all()
+        product_counts = subcategory_product_counts()
         
-        categories_data = []
-        for category in categories:
-            # Get subcategories ordered by display_order
-            subcategories_data = []
-            ordered_subcategories = sorted(category.subcategories, key=lambda x: (x.display_order, x.name))
+        with timed_serialization():
+            categories_data = []
+            for category in categories:
+                # Get subcategories ordered by display_order
+                subcategories_data = []
+                ordered_subcategories = sorted(category.subcategories, key=lambda x: (x.display_order, x.name))
             
-            for subcategory in ordered_subcategories:
-                subcategories_data.append(subcategory.to_dict(include_products_count=True))
+                for subcategory in ordered_subcategories:
+                    subcategory_dict = subcategory.to_dict(include_products_count=False)
+                    subcategory_dict['product_count'] = product_counts.get(subcategory.id, 0)
+                    subcategories_data.append(subcategory_dict)
             
-            category_dict = category.to_dict(include_subcategories=False)
-            category_dict['subcategories'] = subcategories_data
-            category_dict['total_products'] = sum(len(sc.products) for sc in category.subcategories)
+                category_dict = category.to_dict(include_subcategories=False)
+                category_dict['subcategories'] = subcategories_data
+                category_dict['total_products'] = sum(product_counts.get(sc.id, 0) for sc in category.subcategories)
             
-            categories_data.append(category_dict)
+                categories_data.append(category_dict)
         
         return jsonify({
             'categories': categories_data
@@ -198,6 +681,213 @@ def get_categories():
         }), 500
 
 
+@products_bp.route('/products/insights', methods=['GET'])
+@coalesce
+def get_products_insights():
+    """
+    Get aggregated statistics for a subcategory, computed with SQL aggregates
+    
+    Query Parameters:
+    - subcategory: Subcategory slug (e.g., 'luxury-appliances'); all products when omitted
+    - price_key: ProductAttribute key holding the numeric price (default: 'MSRP')
+    - buckets: Comma-separated price bucket edges (default: PRICE_BUCKET_EDGES)
+    - breakdown: Comma-separated ProductAttribute keys to count values for (e.g., 'Pricing Model,Style Tags')
+    
+    Returns:
+    - JSON response with counts, average rating/price, price ranges and breakdowns
+    """
+    try:
+        subcategory_param = request.args.get('subcategory')
+        price_key = request.args.get('price_key', 'MSRP')
+        breakdown_keys = [key.strip() for key in request.args.get('breakdown', '').split(',') if key.strip()]
+        # Aggregates over the default database would silently leave shard products out
+        if get_shard_router().enabled:
+            return sharded_catalog_error('Insights are not available on a sharded catalog')
+        
+        try:
+            bucket_edges = parse_bucket_edges(request.args.get('buckets'), current_app.config['PRICE_BUCKET_EDGES'])
+        except ValueError:
+            return jsonify({
+                'error': 'Bad request',
+                'message': 'buckets must be a comma-separated list of numbers'
+            }), 400
+        
+        subcategory_id = None
+        if subcategory_param:
+            subcategory = db.session.query(SubCategory).filter_by(
+                name=subcategory_name_from_slug(subcategory_param)
+            ).first()
+            if not subcategory:
+                return jsonify({
+                    'error': 'Subcategory not found',
+                    'message': f'No subcategory found for {subcategory_param}'
+                }), 404
+            subcategory_id = subcategory.id
+        
+        insights = vertical_insights(
+            subcategory_id=subcategory_id,
+            price_key=price_key,
+            bucket_edges=bucket_edges,
+            breakdown_keys=breakdown_keys,
+            snippet_limit=current_app.config['INSIGHTS_SNIPPET_LIMIT']
+        )
+        insights['subcategory'] = subcategory_param
+        
+        return jsonify({
+            'insights': insights
+        }), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Error fetching product insights: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': 'Failed to fetch product insights'
+        }), 500
+
+
+@products_bp.route('/products/analytics', methods=['GET'])
+@coalesce
+def get_products_analytics():
+    """
+    Get rating and price distribution analytics per subcategory
+    
+    Query Parameters:
+    - subcategory: Restrict to one subcategory slug (default: all subcategories)
+    - top: Number of best-value products per subcategory (default: 10, max: 50)
+    - product_id: Also return this product's z-scores relative to its subcategory
+    
+    Returns:
+    - JSON response with percentiles, means, rating/price correlations and best-value rankings
+    """
+    # Imported here so that NumPy is only loaded once the endpoint is used
+    from project.services import cached_analytics, product_zscores
+    
+    try:
+        subcategory_param = request.args.get('subcategory')
+        top = max(0, min(request.args.get('top', 10, type=int), 50))
+        product_id = request.args.get('product_id', type=int)
+        # Aggregates over the default database would silently leave shard products out
+        if get_shard_router().enabled:
+            return sharded_catalog_error('Analytics are not available on a sharded catalog')
+        
+        subcategory_id = None
+        if subcategory_param:
+            subcategory = db.session.query(SubCategory).filter_by(
+                name=subcategory_name_from_slug(subcategory_param)
+            ).first()
+            if not subcategory:
+                return jsonify({
+                    'error': 'Subcategory not found',
+                    'message': f'No subcategory found for {subcategory_param}'
+                }), 404
+            subcategory_id = subcategory.id
+        
+        analytics = cached_analytics(
+            subcategory_id=subcategory_id,
+            top=top,
+            ttl=current_app.config['ANALYTICS_CACHE_SECONDS']
+        )
+        
+        response = {'analytics': analytics}
+        if product_id is not None:
+            response['product_zscores'] = product_zscores(product_id, ttl=current_app.config['ANALYTICS_CACHE_SECONDS'])
+        
+        return jsonify(response), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Error computing product analytics: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': 'Failed to compute product analytics'
+        }), 500
+
+
+@products_bp.route('/products/price-alerts', methods=['GET'])
+@coalesce
+def get_price_alerts():
+    """
+    Get price drops and anomalies flagged by the price alert detector, newest first
+    
+    Query Parameters:
+    - kind: Filter by alert kind ('drop' or 'spike')
+    - subcategory: Filter by subcategory slug
+    - product_id: Filter by product
+    - since: Only alerts for prices recorded on or after this date (YYYY-MM-DD)
+    - page: Page number for pagination (default: 1)
+    - per_page: Items per page (default: 20, max: 100)
+    
+    Returns:
+    - JSON response with alerts (including product name and brand) and pagination info
+    """
+    try:
+        kind = request.args.get('kind')
+        subcategory_param = request.args.get('subcategory')
+        product_id = request.args.get('product_id', type=int)
+        since_param = request.args.get('since')
+        page = request.args.get('page', 1, type=int)
+        per_page = min(request.args.get('per_page', 20, type=int), 100)
+        # Alerts are only detected on the default database's price history
+        if get_shard_router().enabled:
+            return sharded_catalog_error('Price alerts are not available on a sharded catalog')
+        
+        query = db.session.query(PriceAlert, Product.name, Product.brand).join(Product)
+        
+        if kind:
+            query = query.filter(PriceAlert.kind == kind)
+        if subcategory_param:
+            query = query.join(SubCategory).filter(SubCategory.name == subcategory_name_from_slug(subcategory_param))
+        if product_id is not None:
+            query = query.filter(PriceAlert.product_id == product_id)
+        if since_param:
+            try:
+                since = date.fromisoformat(since_param)
+            except ValueError:
+                return jsonify({
+                    'error': 'Bad request',
+                    'message': 'since must be a date in YYYY-MM-DD format'
+                }), 400
+            query = query.filter(PriceAlert.date_recorded >= since)
+        
+        pagination = query.order_by(PriceAlert.date_recorded.desc(), PriceAlert.id.desc()).paginate(
+            page=page,
+            per_page=per_page,
+            error_out=False
+        )
+        
+        with timed_serialization():
+            alerts = []
+            for alert, name, brand in pagination.items:
+                alert_dict = alert.to_dict()
+                alert_dict['product_name'] = name
+                alert_dict['product_brand'] = brand
+                alerts.append(alert_dict)
+        
+        return jsonify({
+            'alerts': alerts,
+            'pagination': {
+                'page': pagination.page,
+                'per_page': pagination.per_page,
+                'total': pagination.total,
+                'pages': pagination.pages,
+                'has_prev': pagination.has_prev,
+                'has_next': pagination.has_next
+            },
+            'filters': {
+                'kind': kind,
+                'subcategory': subcategory_param,
+                'product_id': product_id,
+                'since': since_param
+            }
+        }), 200
+    
+    except Exception as e:
+        current_app.logger.error(f"Error fetching price alerts: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': 'Failed to fetch price alerts'
+        }), 500
+
+
 # Error handlers for the blueprint
 @products_bp.errorhandler(404)
 def not_found(error):
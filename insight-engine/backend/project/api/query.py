@@ -0,0 +1,47 @@
+from flask import Blueprint, jsonify, request, current_app
+from project.api.formats import respond
+from project.services.batch_query import QueryError, execute_query
+
+# Create the batched query blueprint
+query_bp = Blueprint('query', __name__)
+
+
+@query_bp.route('/query', methods=['POST'])
+def run_query():
+    """
+    Resolve several resources in one round-trip from a declared selection tree
+    
+    Request Body (JSON), one entry per alias:
+    {
+        "categories": {"fields": ["id", "name"], "subcategories": {"fields": ["name", "slug", "product_count"]}},
+        "aiTools": {"root": "products", "args": {"subcategory": "ai-tools", "per_page": 12},
+                    "fields": ["name", "overall_rating"], "subcategory": {"category": {"fields": ["name"]}}},
+        "product": {"args": {"id": 5}, "attributes": {}, "price_history": {"args": {"latest": true}}}
+    }
+    
+    Roots: categories, subcategories, products (args: subcategory, page, per_page), product (args: id).
+    Relations are batched per level through a per-request dataloader, so each
+    level of the tree costs one IN query regardless of how many rows it has
+    (one per database holding them, with CATALOG_SHARDS).
+    
+    Returns:
+    - JSON response {"data": {alias: result}}
+    """
+    try:
+        document = request.get_json(silent=True)
+        try:
+            data = execute_query(document)
+        except QueryError as e:
+            return jsonify({
+                'error': 'Bad request',
+                'message': str(e)
+            }), 400
+        
+        return respond({'data': data}, 200)
+        
+    except Exception as e:
+        current_app.logger.error(f"Error executing batched query: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': 'Failed to execute query'
+        }), 500
@@ -0,0 +1,277 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+
+
+class LazyMigrateGroup(click.Group):
+    """
+    Stand-in for Flask-Migrate's `flask db` command group
+
+    Flask-Migrate imports Alembic (and Mako/Pygments) at module load, which
+    roughly doubles app startup. This group only imports it once a `flask db`
+    subcommand is actually resolved.
+    """
+
+    def __init__(self, app, db, migrate_kwargs, name='db'):
+        super().__init__(name=name, help='Perform database migrations.')
+        self._app = app
+        self._db = db
+        self._migrate_kwargs = migrate_kwargs
+        self._group = None
+
+    def _load(self):
+        if self._group is None:
+            from flask_migrate import Migrate
+            from flask_migrate.cli import db as db_cli_group
+            Migrate(self._app, self._db, **self._migrate_kwargs)
+            self._group = db_cli_group
+        return self._group
+
+    def list_commands(self, ctx):
+        return self._load().list_commands(ctx)
+
+    def get_command(self, ctx, cmd_name):
+        return self._load().get_command(ctx, cmd_name)
+
+
+class LazyMigrate:
+    """Drop-in for `flask_migrate.Migrate` that defers the import to the CLI"""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    def init_app(self, app, db, **kwargs):
+        options = dict(self.kwargs, **kwargs)
+        command = options.pop('command', 'db')
+        app.cli.add_command(LazyMigrateGroup(app, db, options, name=command))
+
+
+similarity_cli = AppGroup('similarity', help='Build the similar-products index.')
+
+
+@similarity_cli.command('build')
+@click.option('--output', default=None, help='Where to write the index (default: SIMILARITY_INDEX_PATH).')
+@click.option('--full/--incremental', default=False,
+              help='Rebuild every subcategory instead of only those changed since the existing index.')
+@click.option('--follow', is_flag=True, help='Keep rebuilding changed subcategories.')
+@click.option('--interval', default=300, show_default=True, help='Seconds between rebuilds with --follow.')
+def build_similarity_index(output, full, follow, interval):
+    """Precompute nearest neighbours offline and save them for the API to load"""
+    import os
+    import time
+    from project import db
+    from project.services.similarity import SimilarityIndex
+
+    config = current_app.config
+    path = output or config['SIMILARITY_INDEX_PATH']
+    if not full and os.path.exists(path):
+        index = SimilarityIndex.load(path)
+    else:
+        index = SimilarityIndex(max_k=config['SIMILARITY_MAX_K'], tag_keys=config['SIMILARITY_TAG_KEYS'])
+    while True:
+        try:
+            indexed = set(index.blocks)
+            rebuilt = index.refresh(full=full)
+            if rebuilt or set(index.blocks) != indexed or not os.path.exists(path):
+                index.save(path)
+            click.echo(f'Indexed {len(index)} products ({len(rebuilt)} subcategories rebuilt) -> {path}')
+        except Exception as e:
+            if not follow:
+                raise
+            current_app.logger.error(f"Similarity index build failed, retrying in {interval}s: {str(e)}")
+        db.session.rollback()  # End the read transaction so the next build sees new commits
+        if not follow:
+            break
+        full = False
+        time.sleep(interval)
+
+
+price_alerts_cli = AppGroup('price-alerts', help='Detect price drops and anomalies.')
+
+
+@price_alerts_cli.command('detect')
+@click.option('--backfill', is_flag=True,
+              help='Build rolling statistics without recording alerts (use once on existing history).')
+@click.option('--follow', is_flag=True, help='Keep polling for new price rows.')
+@click.option('--interval', default=60, show_default=True, help='Seconds between polls with --follow.')
+def detect_price_alerts(backfill, follow, interval):
+    """Process price rows inserted or repriced since the last run"""
+    import time
+    from project import db
+    from project.services.price_alerts import PriceAlertDetector
+
+    detector = PriceAlertDetector.from_config(current_app.config)
+    while True:
+        try:
+            rows, alerts = detector.run(emit_alerts=not backfill)
+            click.echo(f'Processed {rows} price rows, created {alerts} alerts')
+        except Exception as e:
+            if not follow:
+                raise
+            current_app.logger.error(f"Price alert detection failed, retrying in {interval}s: {str(e)}")
+        db.session.rollback()  # Drop a failed transaction and end the read so the next poll sees new commits
+        if not follow:
+            break
+        time.sleep(interval)
+
+
+catalog_cli = AppGroup('catalog', help='Write catalog data without reseeding.')
+
+
+@catalog_cli.command('upsert')
+@click.argument('source', type=click.File('r'))
+@click.option('--batch-size', default=None, type=int, help='Products per transaction (default: BULK_MAX_PRODUCTS).')
+def upsert_catalog(source, batch_size):
+    """Upsert products from a JSON file ({"products": [...]} or a list) or JSON Lines ('-' for stdin)"""
+    import json
+    from project.services.upserts import CatalogUpserter, UpsertError, unsupported_dialects
+
+    dialects = unsupported_dialects(current_app.config)
+    if dialects:
+        raise click.ClickException(f"Upserts need PostgreSQL or SQLite, not {', '.join(dialects)}")
+    text = source.read()
+    try:
+        document = json.loads(text)
+        items = document.get('products') if isinstance(document, dict) else document
+    except json.JSONDecodeError:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if not isinstance(items, list):
+        raise click.ClickException('Expected {"products": [...]}, a JSON list or JSON Lines')
+
+    config = current_app.config
+    batch_size = batch_size or config['BULK_MAX_PRODUCTS']
+    upserter = CatalogUpserter.from_config(config)
+    totals = {}
+    for start in range(0, len(items), batch_size):
+        try:
+            result = upserter.apply(items[start:start + batch_size])
+        except UpsertError as e:
+            raise click.ClickException(f'Batch starting at item {start}: {e}')
+        for table, counts in result.items():
+            for outcome, value in counts.items():
+                totals.setdefault(table, {}).setdefault(outcome, 0)
+                totals[table][outcome] += value
+    for table, counts in totals.items():
+        click.echo(f"{table}: {counts['inserted']} inserted, {counts['updated']} updated, "
+                   f"{counts['unchanged']} unchanged")
+
+
+@catalog_cli.command('add-constraints')
+def add_catalog_constraints():
+    """Add the natural-key unique indexes that upserts need to a database created before them"""
+    from project.services.upserts import UpsertError, add_natural_keys
+
+    try:
+        added = add_natural_keys()
+    except UpsertError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Added {', '.join(added)}" if added else 'Natural keys already in place')
+
+
+@catalog_cli.command('snapshot')
+@click.option('--output', default=None, help='Snapshot file (default: CATALOG_SNAPSHOT_SHARED_PATH).')
+@click.option('--follow', is_flag=True, help='Keep applying the change log and publish each new version.')
+@click.option('--interval', default=None, type=float,
+              help='Seconds between change log checks with --follow (default: CATALOG_SNAPSHOT_REFRESH_SECONDS).')
+def build_catalog_snapshot(output, follow, interval):
+    """Write the memory-mapped listing snapshot that API workers share"""
+    import time
+    from project import db
+    from project.services.shared_snapshot import write_shared_snapshot
+    from project.services.snapshot import CatalogSnapshot
+
+    config = current_app.config
+    path = output or config['CATALOG_SNAPSHOT_SHARED_PATH']
+    if not path:
+        raise click.ClickException('Pass --output or set CATALOG_SNAPSHOT_SHARED_PATH')
+    interval = interval or config['CATALOG_SNAPSHOT_REFRESH_SECONDS']
+
+    snapshot, published, rebuilt_at = None, None, 0.0
+    while True:
+        try:
+            now = time.monotonic()
+            if snapshot is None or not config['CHANGE_LOG_ENABLED'] \
+                    or now - rebuilt_at >= config['CATALOG_SNAPSHOT_REBUILD_SECONDS']:
+                snapshot, rebuilt_at = CatalogSnapshot.build(), now
+            else:
+                snapshot = snapshot.apply_changes()
+            if snapshot is not published:
+                size = write_shared_snapshot(snapshot, path)
+                published = snapshot
+                click.echo(f'Wrote version {snapshot.seq}: {len(snapshot)} products, {size} bytes -> {path}')
+        except Exception as e:
+            if not follow:
+                raise
+            current_app.logger.error(f"Catalog snapshot update failed, retrying in {interval}s: {str(e)}")
+        db.session.rollback()  # End the read transaction so the next check sees new commits
+        if not follow:
+            break
+        time.sleep(interval)
+
+
+changes_cli = AppGroup('changes', help='Maintain the catalog change log.')
+
+
+@changes_cli.command('prune')
+@click.option('--days', default=None, type=int, help='Keep this many days of events (default: CHANGE_LOG_RETENTION_DAYS).')
+def prune_change_log(days):
+    """Delete change events older than the retention window"""
+    from project.services.changes import prune_changes
+
+    days = days if days is not None else current_app.config['CHANGE_LOG_RETENTION_DAYS']
+    click.echo(f'Pruned {prune_changes(days)} change events older than {days} days')
+
+
+shards_cli = AppGroup('shards', help='Set up per-category catalog shards.')
+
+
+@shards_cli.command('init')
+@click.argument('names', nargs=-1)
+def init_catalog_shards(names):
+    """Create tables, start the id range and copy the taxonomy on each named shard (default: all)"""
+    from project.services.shards import get_shard_router, prepare_shard
+
+    names = names or get_shard_router().shards
+    if not names:
+        raise click.ClickException('No shards configured; set CATALOG_SHARDS')
+    for name in names:
+        try:
+            start = prepare_shard(name)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo(f'Shard {name}: ready, product ids from {start}')
+
+
+@click.command('worker')
+@click.option('--threads', default=None, type=int, help='Jobs run at once per process (default: JOB_WORKERS).')
+@click.option('--processes', default=1, show_default=True, help='Worker processes, forked from this one.')
+@click.option('--queue', 'queues', multiple=True, help='Only run jobs from this queue; repeatable (default: all).')
+@click.option('--metrics-port', default=None, type=int,
+              help='Serve Prometheus metrics on this port (the next ones for further processes).')
+@with_appcontext
+def worker_command(threads, processes, queues, metrics_port):
+    """Run queued background jobs until interrupted, finishing the running ones first"""
+    from project.services.jobs import run_workers
+
+    run_workers(current_app._get_current_object(), threads, processes, queues, metrics_port)
+
+
+jobs_cli = AppGroup('jobs', help='Queue background jobs.')
+
+
+@jobs_cli.command('enqueue')
+@click.argument('kind')
+@click.option('--product-id', default=None, type=int, help='Product the job is about.')
+@click.option('--payload', default=None, help='JSON arguments for the job handler.')
+@click.option('--queue', default=None, help='Queue to put the job on (default: the kind\'s own queue).')
+@click.option('--key', default=None, help='Idempotency key; a job already enqueued with it is reused.')
+def enqueue_background_job(kind, product_id, payload, queue, key):
+    """Queue a job of KIND (e.g. price_alerts_detect, review_refresh) for the workers"""
+    import json
+    from project.services.jobs import enqueue_job
+
+    try:
+        job, created = enqueue_job(kind, product_id, json.loads(payload) if payload else None, queue, key)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{'Queued' if created else 'Already queued'} job {job.id} ({job.kind}) on {job.queue}: {job.status}")
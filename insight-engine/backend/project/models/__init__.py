@@ -1,3 +1,11 @@
-from .models import Category, SubCategory, Product, ProductAttribute, PriceHistory, AggregatedReview
+from .models import (
+    Category, SubCategory, Product, ProductAttribute, PriceHistory, AggregatedReview,
+    PriceStat, PriceAlert, JobCheckpoint, Job, ChangeEvent, ProductPopularity,
+    TrendingEpoch, RateLimitBucket
+)
 
-__all__ = ['Category', 'SubCategory', 'Product', 'ProductAttribute', 'PriceHistory', 'AggregatedReview'] 
\ No newline at end of file
+__all__ = [
+    'Category', 'SubCategory', 'Product', 'ProductAttribute', 'PriceHistory', 'AggregatedReview',
+    'PriceStat', 'PriceAlert', 'JobCheckpoint', 'Job', 'ChangeEvent', 'ProductPopularity',
+    'TrendingEpoch', 'RateLimitBucket'
+]
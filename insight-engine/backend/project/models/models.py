@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from project import db
 
@@ -82,6 +83,10 @@ class SubCategory(db.Model):
 class Product(db.Model):
     """Product model - central unified table for all products"""
     __tablename__ = 'products'
+    __table_args__ = (
+        db.UniqueConstraint('brand', 'name', name='uq_products_brand_name'),  # Natural key for upserts
+        {'sqlite_autoincrement': True},  # Ids stay inside a shard's range (see services/shards.py)
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
@@ -99,38 +104,62 @@ class Product(db.Model):
     attributes = db.relationship('ProductAttribute', backref='product', lazy=True, cascade='all, delete-orphan')
     price_history = db.relationship('PriceHistory', backref='product', lazy=True, cascade='all, delete-orphan')
     aggregated_review = db.relationship('AggregatedReview', backref='product', uselist=False, cascade='all, delete-orphan')
+    price_stats = db.relationship('PriceStat', backref='product', lazy=True, cascade='all, delete-orphan')
+    price_alerts = db.relationship('PriceAlert', backref='product', lazy=True, cascade='all, delete-orphan')
     
-    def to_dict(self, include_details=False):
-        """Convert model to dictionary"""
-        base_dict = {
-            'id': self.id,
-            'name': self.name,
-            'brand': self.brand,
-            'short_description': self.short_description,
-            'insight_snippet': self.insight_snippet,
-            'image_url': self.image_url,
-            'subcategory_id': self.subcategory_id,
-            'subcategory_name': self.subcategory.name if self.subcategory else None,
-            'category_name': self.subcategory.category.name if self.subcategory and self.subcategory.category else None,
-            'overall_rating': self.aggregated_review.overall_rating if self.aggregated_review else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
+    # Keys returned by to_dict() unless a sparse fieldset is requested
+    SUMMARY_FIELDS = (
+        'id', 'name', 'brand', 'short_description', 'insight_snippet', 'image_url', 'subcategory_id',
+        'subcategory_name', 'category_name', 'overall_rating', 'created_at', 'updated_at'
+    )
+    # Related data added by include_details=True, or individually via include
+    DETAIL_INCLUDES = ('attributes', 'price_history', 'aggregated_review')
+    
+    def to_dict(self, include_details=False, fields=None, include=None):
+        """
+        Convert model to dictionary
+        
+        `fields` restricts the summary keys and `include` picks related data
+        (defaults: SUMMARY_FIELDS, plus all DETAIL_INCLUDES when include_details).
+        Only the requested attributes are touched, so nothing beyond what the
+        query loaded is fetched.
+        """
+        fields = self.SUMMARY_FIELDS if fields is None else fields
+        if include is None:
+            include = self.DETAIL_INCLUDES if include_details else ()
+        
+        base_dict = {field: self._summary_value(field) for field in fields}
         
         # Include detailed information if requested
-        if include_details:
-            base_dict.update({
-                'attributes': [attr.to_dict() for attr in self.attributes],
-                'price_history': [price.to_dict() for price in self.price_history],
-                'aggregated_review': self.aggregated_review.to_dict() if self.aggregated_review else None
-            })
+        if 'attributes' in include:
+            base_dict['attributes'] = [attr.to_dict() for attr in self.attributes]
+        if 'price_history' in include:
+            base_dict['price_history'] = [price.to_dict() for price in self.price_history]
+        if 'aggregated_review' in include:
+            base_dict['aggregated_review'] = self.aggregated_review.to_dict() if self.aggregated_review else None
         
         return base_dict
+    
+    def _summary_value(self, field):
+        """Value of one summary field, following relationships only when the field needs them"""
+        if field == 'subcategory_name':
+            return self.subcategory.name if self.subcategory else None
+        if field == 'category_name':
+            return self.subcategory.category.name if self.subcategory and self.subcategory.category else None
+        if field == 'overall_rating':
+            return self.aggregated_review.overall_rating if self.aggregated_review else None
+        value = getattr(self, field)
+        if field in ('created_at', 'updated_at'):
+            return value.isoformat() if value else None
+        return value
 
 
 class ProductAttribute(db.Model):
     """ProductAttribute model - flexible key-value specs for products"""
     __tablename__ = 'product_attributes'
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'key', name='uq_product_attributes_product_key'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     key = db.Column(db.String(100), nullable=False)  # e.g., 'Pricing Model', 'Style Tags', 'MSRP'
@@ -156,6 +185,10 @@ class ProductAttribute(db.Model):
 class PriceHistory(db.Model):
     """PriceHistory model - track price changes over time"""
     __tablename__ = 'price_history'
+    __table_args__ = (
+        db.Index('ix_price_history_product_date', 'product_id', 'date_recorded'),
+        db.UniqueConstraint('product_id', 'retailer_name', 'date_recorded', name='uq_price_history_product_retailer_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     price = db.Column(db.Float, nullable=False)
@@ -215,6 +248,12 @@ class AggregatedReview(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Numeric rating columns compared, averaged and z-scored by the analytics services
+    RATING_DIMENSIONS = (
+        'overall_rating', 'ease_of_use_score', 'feature_score', 'value_for_money_score',
+        'design_rating', 'functionality_rating', 'reliability_rating'
+    )
+    
     def to_dict(self):
         """Convert model to dictionary"""
         return {
@@ -236,4 +275,207 @@ class AggregatedReview(db.Model):
             'last_updated': self.last_updated.isoformat() if self.last_updated else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        }
+
+
+class PriceStat(db.Model):
+    """PriceStat model - rolling price statistics per product and retailer, updated incrementally"""
+    __tablename__ = 'price_stats'
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'retailer_name', name='uq_price_stats_product_retailer'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    retailer_name = db.Column(db.String(100), nullable=False)
+    observations = db.Column(db.Integer, nullable=False, default=0)
+    mean_price = db.Column(db.Float, nullable=False)      # Exponentially weighted mean
+    variance = db.Column(db.Float, nullable=False, default=0.0)  # Exponentially weighted variance
+    last_price = db.Column(db.Float, nullable=False)
+    min_price = db.Column(db.Float, nullable=False)
+    last_date = db.Column(db.Date)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'id': self.id,
+            'product_id': self.product_id,
+            'retailer_name': self.retailer_name,
+            'observations': self.observations,
+            'mean_price': self.mean_price,
+            'std_price': self.variance ** 0.5 if self.variance else 0.0,
+            'last_price': self.last_price,
+            'min_price': self.min_price,
+            'last_date': self.last_date.isoformat() if self.last_date else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class PriceAlert(db.Model):
+    """PriceAlert model - a significant price drop or anomaly flagged by the price detector"""
+    __tablename__ = 'price_alerts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
+    price_history_id = db.Column(db.Integer, db.ForeignKey('price_history.id'))
+    retailer_name = db.Column(db.String(100), nullable=False)
+    kind = db.Column(db.String(20), nullable=False, index=True)  # drop, spike
+    price = db.Column(db.Float, nullable=False)
+    previous_price = db.Column(db.Float)
+    baseline_price = db.Column(db.Float)  # Rolling mean before this observation
+    change_pct = db.Column(db.Float)      # Relative to previous_price; negative for drops
+    zscore = db.Column(db.Float)
+    date_recorded = db.Column(db.Date)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'id': self.id,
+            'product_id': self.product_id,
+            'price_history_id': self.price_history_id,
+            'retailer_name': self.retailer_name,
+            'kind': self.kind,
+            'price': self.price,
+            'previous_price': self.previous_price,
+            'baseline_price': self.baseline_price,
+            'change_pct': self.change_pct,
+            'zscore': self.zscore,
+            'date_recorded': self.date_recorded.isoformat() if self.date_recorded else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class JobCheckpoint(db.Model):
+    """JobCheckpoint model - high-water mark of rows already processed by an incremental job"""
+    __tablename__ = 'job_checkpoints'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Timestamps
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Job(db.Model):
+    """Job model - a background task (e.g. a review refresh), its place in the queue and its latest progress"""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_claim', 'status', 'queue', 'run_after'),  # Workers look for due queued jobs
+    )
+    
+    id = db.Column(db.String(32), primary_key=True)  # Random hex id, handed to clients
+    kind = db.Column(db.String(50), nullable=False, index=True)  # e.g. 'review_refresh'
+    product_id = db.Column(db.Integer, index=True)  # No foreign key: job history outlives products
+    queue = db.Column(db.String(50), nullable=False, default='default')  # Concurrency limits apply per queue
+    payload = db.Column(db.Text)  # JSON arguments for the handler
+    idempotency_key = db.Column(db.String(200), unique=True)  # Enqueueing the same key again returns this job
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    stage = db.Column(db.String(50))  # Current step, e.g. 'fetching_posts'
+    progress = db.Column(db.Text)  # JSON counters of the current run
+    result = db.Column(db.Text)    # JSON summary once succeeded
+    error = db.Column(db.Text)     # Latest failure, kept while a retry is pending
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # Runs started so far
+    max_attempts = db.Column(db.Integer, nullable=False, default=1)
+    worker = db.Column(db.String(100))  # Worker running (or that last ran) the job
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Not claimed before this (retry backoff)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    TERMINAL_STATUSES = ('succeeded', 'failed')
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'product_id': self.product_id,
+            'queue': self.queue,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': json.loads(self.progress) if self.progress else {},
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class ChangeEvent(db.Model):
+    """ChangeEvent model - append-only log of catalog mutations, served by /api/changes"""
+    __tablename__ = 'change_log'
+    __table_args__ = {'sqlite_autoincrement': True}  # Never reuse a sequence number, even after pruning
+    
+    seq = db.Column(db.Integer, primary_key=True)  # Consumer cursor
+    entity = db.Column(db.String(50), nullable=False)  # Table name, e.g. 'products', 'price_history'
+    entity_id = db.Column(db.Integer, nullable=False)
+    product_id = db.Column(db.Integer, index=True)  # No foreign key: events outlive deleted products
+    op = db.Column(db.String(10), nullable=False)  # insert, update, delete
+    fields = db.Column(db.Text)  # Comma-separated columns written by an update
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'seq': self.seq,
+            'entity': self.entity,
+            'entity_id': self.entity_id,
+            'product_id': self.product_id,
+            'op': self.op,
+            'fields': self.fields.split(',') if self.fields else [],
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class ProductPopularity(db.Model):
+    """ProductPopularity model - engagement counters and trending score, written in batches"""
+    __tablename__ = 'product_popularity'
+    
+    product_id = db.Column(db.Integer, primary_key=True)  # No foreign key: flushed in bulk, outside the ORM
+    views = db.Column(db.Integer, nullable=False, default=0)        # GET /api/products/<id>
+    clicks = db.Column(db.Integer, nullable=False, default=0)       # POST /api/products/<id>/click
+    impressions = db.Column(db.Integer, nullable=False, default=0)  # Appearances in a listing page
+    # Time-decayed engagement, scaled to the TrendingEpoch: every score
+    # decays by the same factor, so ordering by this column is ordering by trend
+    trending_score = db.Column(db.Float, nullable=False, default=0.0, index=True)
+    
+    # Timestamps
+    last_seen_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class TrendingEpoch(db.Model):
+    """TrendingEpoch model - the Unix time stored trending scores are scaled to (a single row)"""
+    __tablename__ = 'trending_epoch'
+    
+    id = db.Column(db.Integer, primary_key=True)  # Always 1
+    epoch = db.Column(db.BigInteger, nullable=False)
+    
+    # Timestamps
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class RateLimitBucket(db.Model):
+    """RateLimitBucket model - one client's token bucket for a route class, shared by every API process"""
+    __tablename__ = 'rate_limit_buckets'
+    
+    key = db.Column(db.String(200), primary_key=True)  # '<route class>:<client>'
+    tokens = db.Column(db.Float, nullable=False)  # Tokens left as of updated_at
+    updated_at = db.Column(db.Float, nullable=False, index=True)  # Unix time, compared across processes
+    allowed = db.Column(db.Boolean, nullable=False, default=True)  # Outcome of the latest take, read back via RETURNING
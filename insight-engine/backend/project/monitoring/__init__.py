@@ -0,0 +1,20 @@
+from .metrics import metrics, init_metrics, record_cache_lookup, timed_serialization, current_request_metrics
+from .profiler import SamplingProfiler, init_profiler
+from .structured_logging import JsonFormatter, SamplingFilter, init_logging
+from .query_log import QueryRecorder, init_query_log, normalize_statement, record_queries
+
+
+def init_monitoring(app):
+    """Wire metrics, query logging and the optional sampling profiler into the app"""
+    if app.config.get('METRICS_ENABLED', True):
+        init_metrics(app)
+    if app.config.get('QUERY_LOG_ENABLED', True):
+        init_query_log(app)
+    init_profiler(app)
+
+
+__all__ = [
+    'metrics', 'init_metrics', 'init_monitoring', 'init_profiler', 'record_cache_lookup',
+    'timed_serialization', 'current_request_metrics', 'SamplingProfiler', 'QueryRecorder',
+    'init_query_log', 'normalize_statement', 'record_queries', 'JsonFormatter', 'SamplingFilter', 'init_logging'
+]
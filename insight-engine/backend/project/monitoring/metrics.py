@@ -0,0 +1,245 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Latency buckets (seconds) shared by all request histograms
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestMetrics:
+    """Counters accumulated for a single in-flight request (stored on flask.g)"""
+    __slots__ = ('started_at', 'db_queries', 'db_time', 'serialization_time', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class Histogram:
+    """Cumulative bucket histogram in the Prometheus style"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+
+
+class MetricsRegistry:
+    """Thread-safe per-endpoint metrics store rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop every recorded sample"""
+        with self._lock:
+            self._requests = {}        # (endpoint, method, status) -> count
+            self._latency = {}         # endpoint -> Histogram
+            self._counters = {}        # (metric, label items) -> number
+            self._cache = {}           # (cache, result) -> count
+            self._gauges = {}          # metric -> callable returning a number
+
+    def observe_request(self, endpoint, method, status, duration, stats, response_bytes):
+        """Fold a finished request into the aggregate counters"""
+        with self._lock:
+            key = (endpoint, method, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+            histogram = self._latency.get(endpoint)
+            if histogram is None:
+                histogram = self._latency[endpoint] = Histogram()
+            histogram.observe(duration)
+
+            for metric, value in (
+                ('db_queries_total', stats.db_queries),
+                ('db_time_seconds_total', stats.db_time),
+                ('serialization_seconds_total', stats.serialization_time),
+                ('response_bytes_total', response_bytes),
+                ('cache_hits_total', stats.cache_hits),
+                ('cache_misses_total', stats.cache_misses),
+            ):
+                key = (metric, (('endpoint', endpoint),))
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def inc_cache(self, cache_name, hit):
+        """Count a lookup against a named in-process cache"""
+        with self._lock:
+            key = (cache_name, 'hit' if hit else 'miss')
+            self._cache[key] = self._cache.get(key, 0) + 1
+
+    def inc(self, metric, labels=None, value=1):
+        """Increment a free-form counter (e.g. from a background subsystem)"""
+        key = (metric, tuple(sorted((k, str(v)) for k, v in (labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def register_gauge(self, metric, callback):
+        """Register a callable sampled each time /metrics is scraped"""
+        with self._lock:
+            self._gauges[metric] = callback
+
+    def render(self):
+        """Render all metrics using the Prometheus text exposition format"""
+        with self._lock:
+            requests = dict(self._requests)
+            latency = {k: (list(h.counts), h.sum, h.count, h.buckets) for k, h in self._latency.items()}
+            counters = dict(self._counters)
+            cache = dict(self._cache)
+            gauges = dict(self._gauges)
+
+        lines = [
+            '# HELP insight_requests_total Total HTTP requests by endpoint, method and status',
+            '# TYPE insight_requests_total counter',
+        ]
+        for (endpoint, method, status), count in sorted(requests.items()):
+            lines.append(
+                f'insight_requests_total{{endpoint="{_escape(endpoint)}",method="{method}",status="{status}"}} {count}'
+            )
+
+        lines.append('# HELP insight_request_duration_seconds Request latency by endpoint')
+        lines.append('# TYPE insight_request_duration_seconds histogram')
+        for endpoint, (counts, total, count, buckets) in sorted(latency.items()):
+            label = f'endpoint="{_escape(endpoint)}"'
+            for upper, bucket_count in zip(buckets, counts):
+                lines.append(f'insight_request_duration_seconds_bucket{{{label},le="{upper}"}} {bucket_count}')
+            lines.append(f'insight_request_duration_seconds_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'insight_request_duration_seconds_sum{{{label}}} {total:.6f}')
+            lines.append(f'insight_request_duration_seconds_count{{{label}}} {count}')
+
+        seen = set()
+        for (metric, labels), value in sorted(counters.items()):
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f'# TYPE insight_{metric} counter')
+            label_str = ','.join(f'{k}="{_escape(str(v))}"' for k, v in labels)
+            lines.append(f'insight_{metric}{{{label_str}}} {_format_value(value)}')
+
+        if cache:
+            lines.append('# HELP insight_cache_lookups_total In-process cache lookups by cache and result')
+            lines.append('# TYPE insight_cache_lookups_total counter')
+            for (cache_name, result), count in sorted(cache.items()):
+                lines.append(f'insight_cache_lookups_total{{cache="{_escape(cache_name)}",result="{result}"}} {count}')
+
+        for metric, callback in sorted(gauges.items()):
+            try:
+                value = callback()
+            except Exception:
+                continue
+            lines.append(f'# TYPE insight_{metric} gauge')
+            lines.append(f'insight_{metric} {_format_value(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return f'{value:.6f}'
+    return str(value)
+
+
+# Process-wide registry
+metrics = MetricsRegistry()
+
+
+def current_request_metrics():
+    """Return the RequestMetrics for the active request, or None outside a request"""
+    if not has_request_context():
+        return None
+    return g.get('_request_metrics')
+
+
+@contextmanager
+def timed_serialization():
+    """Attribute the enclosed block to serialization time for the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = current_request_metrics()
+        if stats is not None:
+            stats.serialization_time += time.perf_counter() - started
+
+
+def record_cache_lookup(cache_name, hit):
+    """Record a cache hit or miss globally and against the current request"""
+    metrics.inc_cache(cache_name, hit)
+    stats = current_request_metrics()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['_query_start'].pop()
+    stats = current_request_metrics()
+    if stats is not None:
+        stats.db_queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_cursor_error(context):
+    # A failed statement gets no after_cursor_execute; drop its start time
+    starts = context.connection.info.get('_query_start') if context.connection is not None else None
+    if starts and context.execution_context is not None:
+        starts.pop()
+
+
+def init_metrics(app):
+    """Attach per-request metric collection and the /metrics endpoint to the app"""
+
+    @app.before_request
+    def _start_request_metrics():
+        g._request_metrics = RequestMetrics()
+
+    @app.after_request
+    def _finish_request_metrics(response):
+        stats = g.pop('_request_metrics', None)
+        if stats is None:
+            return response
+
+        endpoint = request.endpoint or 'unmatched'
+        duration = time.perf_counter() - stats.started_at
+        if response.direct_passthrough or response.is_streamed:
+            response_bytes = response.content_length or 0
+        else:
+            response_bytes = response.calculate_content_length() or 0
+
+        metrics.observe_request(
+            endpoint, request.method, response.status_code, duration, stats, response_bytes
+        )
+        return response
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
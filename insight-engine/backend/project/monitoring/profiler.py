@@ -0,0 +1,125 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+
+class SamplingProfiler:
+    """
+    Low-overhead wall-clock sampler for in-flight requests
+
+    A single daemon thread snapshots the stacks of every thread currently
+    serving a request. When a request finishes above the slow threshold its
+    samples are written in collapsed-stack format ("frame;frame;frame count"),
+    which flamegraph.pl, speedscope and inferno consume directly.
+    """
+
+    def __init__(self, interval=0.005, slow_threshold=0.5, output_dir='logs/profiles', max_stack_depth=64):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.output_dir = output_dir
+        self.max_stack_depth = max_stack_depth
+        self._active = {}  # thread ident -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start the background sampling thread (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='insight-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def begin(self):
+        """Begin collecting samples for the calling thread"""
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+
+    def end(self):
+        """Stop collecting for the calling thread and return its samples"""
+        with self._lock:
+            return self._active.pop(threading.get_ident(), Counter())
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                idents = list(self._active)
+            if not idents:
+                continue
+            frames = sys._current_frames()
+            for ident in idents:
+                if ident == own_ident or ident not in frames:
+                    continue
+                stack = self._collapse(frames[ident])
+                with self._lock:
+                    samples = self._active.get(ident)
+                    if samples is not None:
+                        samples[stack] += 1
+            del frames
+
+    def _collapse(self, frame):
+        parts = []
+        while frame is not None and len(parts) < self.max_stack_depth:
+            code = frame.f_code
+            parts.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+        parts.reverse()
+        return ';'.join(parts)
+
+    def dump(self, label, duration, samples):
+        """Write collapsed stacks for a slow request and return the file path"""
+        if not samples:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_label = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in label)
+        filename = f'{int(time.time() * 1000)}-{safe_label}-{int(duration * 1000)}ms.folded'
+        path = os.path.join(self.output_dir, filename)
+        with open(path, 'w') as fh:
+            for stack, count in samples.most_common():
+                fh.write(f'{stack} {count}\n')
+        return path
+
+
+def init_profiler(app):
+    """Enable the opt-in sampling profiler when PROFILER_ENABLED is set"""
+    if not app.config.get('PROFILER_ENABLED'):
+        return None
+
+    profiler = SamplingProfiler(
+        interval=app.config['PROFILER_SAMPLE_INTERVAL_MS'] / 1000.0,
+        slow_threshold=app.config['PROFILER_SLOW_REQUEST_MS'] / 1000.0,
+        output_dir=app.config['PROFILER_OUTPUT_DIR'],
+    )
+    profiler.start()
+    app.extensions['profiler'] = profiler
+
+    @app.before_request
+    def _start_profiling():
+        g._profile_started = time.perf_counter()
+        profiler.begin()
+
+    @app.teardown_request
+    def _finish_profiling(exc):
+        started = g.pop('_profile_started', None)
+        samples = profiler.end()
+        if started is None:
+            return
+        duration = time.perf_counter() - started
+        if duration >= profiler.slow_threshold:
+            label = request.endpoint or 'unmatched'
+            path = profiler.dump(label, duration, samples)
+            if path:
+                app.logger.warning(f'Slow request {request.method} {request.path} took {duration * 1000:.0f}ms, profile written to {path}')
+
+    return profiler
@@ -0,0 +1,69 @@
+"""
+pytest plugin that fails tests introducing new N+1 query patterns
+
+Enable with ``pytest -p project.monitoring.pytest_plugin``. Every statement
+executed while a test body runs is recorded; any statement shape executed at
+least ``--nplusone-threshold`` times fails the test unless it is listed in the
+baseline file for that test or the test is marked ``@pytest.mark.nplusone_allowed``.
+Run once with ``--nplusone-update-baseline`` to accept the current patterns.
+"""
+import json
+import os
+
+import pytest
+
+from .query_log import record_queries
+
+_state = {'baseline': {}, 'observed': {}}
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('nplusone', 'N+1 query detection')
+    group.addoption('--nplusone-threshold', type=int, default=5,
+                    help='Executions of one statement shape within a test that count as an N+1 (default: 5)')
+    group.addoption('--nplusone-baseline', default='.nplusone-baseline.json',
+                    help='JSON file of known N+1 shapes per test id')
+    group.addoption('--nplusone-update-baseline', action='store_true', default=False,
+                    help='Record current N+1 shapes into the baseline instead of failing')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'nplusone_allowed: do not fail this test on repeated query shapes')
+    path = config.getoption('--nplusone-baseline')
+    if path and os.path.exists(path):
+        with open(path) as fh:
+            _state['baseline'] = json.load(fh)
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    with record_queries() as recorder:
+        result = yield
+
+    threshold = item.config.getoption('--nplusone-threshold')
+    repeated = recorder.repeated_shapes(threshold)
+    if not repeated:
+        return result
+
+    if item.get_closest_marker('nplusone_allowed'):
+        return result
+    _state['observed'][item.nodeid] = sorted(repeated)
+    if item.config.getoption('--nplusone-update-baseline'):
+        return result
+
+    known = set(_state['baseline'].get(item.nodeid, []))
+    new_shapes = {shape: count for shape, count in repeated.items() if shape not in known}
+    if new_shapes:
+        details = '\n'.join(f'  {count}x {shape}' for shape, count in sorted(new_shapes.items(), key=lambda kv: -kv[1]))
+        pytest.fail(f'New N+1 query pattern(s) detected:\n{details}', pytrace=False)
+    return result
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    if not config.getoption('--nplusone-update-baseline'):
+        return
+    baseline = dict(_state['baseline'])
+    baseline.update(_state['observed'])
+    with open(config.getoption('--nplusone-baseline'), 'w') as fh:
+        json.dump(baseline, fh, indent=2, sort_keys=True)
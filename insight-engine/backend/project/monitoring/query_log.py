@@ -0,0 +1,181 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Statements shapes are compared after collapsing literals and expanded IN lists
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:\?|%s|:\w+|\$\d+)\s*,?)+\)', re.IGNORECASE)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'%s|:\w+|\$\d+|\?')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+_local = threading.local()
+
+
+def normalize_statement(statement):
+    """Reduce a SQL statement to its shape so repeated executions can be grouped"""
+    shape = _STRING_RE.sub('?', statement)
+    shape = _PLACEHOLDER_RE.sub('?', shape)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _IN_LIST_RE.sub('IN (?)', shape)
+    return _WHITESPACE_RE.sub(' ', shape).strip()
+
+
+class QueryRecord:
+    """A single executed statement"""
+    __slots__ = ('statement', 'parameters', 'duration')
+
+    def __init__(self, statement, parameters, duration):
+        self.statement = statement
+        self.parameters = parameters
+        self.duration = duration
+
+
+class QueryRecorder:
+    """Collects every statement executed on the current thread while active"""
+
+    def __init__(self):
+        self.queries = []
+
+    def add(self, record):
+        self.queries.append(record)
+
+    def shape_counts(self):
+        """Return a Counter of normalized statement shapes"""
+        return Counter(normalize_statement(q.statement) for q in self.queries)
+
+    def repeated_shapes(self, threshold):
+        """Return {shape: count} for shapes executed at least `threshold` times"""
+        return {shape: count for shape, count in self.shape_counts().items() if count >= threshold}
+
+    @property
+    def total_time(self):
+        return sum(q.duration for q in self.queries)
+
+
+def _active_recorders():
+    stack = getattr(_local, 'recorders', None)
+    if stack is None:
+        stack = _local.recorders = []
+    return stack
+
+
+@contextmanager
+def record_queries():
+    """Record every statement executed on this thread inside the block"""
+    recorder = QueryRecorder()
+    stack = _active_recorders()
+    stack.append(recorder)
+    try:
+        yield recorder
+    finally:
+        stack.remove(recorder)
+
+
+# Slow query settings, set from app config by init_query_log
+_slow_query_settings = {'threshold': None, 'explain': False}
+
+
+def explain_statement(conn, statement, parameters):
+    """Return the dialect's query plan for a statement as a list of text rows"""
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif dialect in ('postgresql', 'mysql', 'mariadb'):
+        prefix = 'EXPLAIN '
+    else:
+        return []
+
+    # Use a raw DBAPI cursor so the EXPLAIN itself does not re-enter these listeners
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [' '.join(str(col) for col in row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_query_log_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['_query_log_start'].pop()
+
+    recorders = getattr(_local, 'recorders', None)
+    if recorders:
+        record = QueryRecord(statement, parameters, duration)
+        for recorder in recorders:
+            recorder.add(record)
+
+    threshold = _slow_query_settings['threshold']
+    if threshold is not None and duration >= threshold:
+        plan = []
+        if _slow_query_settings['explain'] and not executemany and statement.lstrip().upper().startswith('SELECT'):
+            try:
+                plan = explain_statement(conn, statement, parameters)
+            except Exception as e:
+                plan = [f'EXPLAIN failed: {e}']
+        metrics.inc('slow_queries_total')
+        logger.warning(
+            f"Slow query ({duration * 1000:.1f}ms): {statement} | params={_format_parameters(parameters, executemany)}"
+            + (f" | plan={' / '.join(plan)}" if plan else '')
+        )
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_cursor_error(context):
+    # A failed statement gets no after_cursor_execute; drop its start time
+    starts = context.connection.info.get('_query_log_start') if context.connection is not None else None
+    if starts and context.execution_context is not None:
+        starts.pop()
+
+
+def _format_parameters(parameters, executemany, limit=500):
+    """Render statement parameters for logging without dumping whole batches"""
+    if executemany and parameters:
+        text = f'{len(parameters)} rows, first={parameters[0]!r}'
+    else:
+        text = repr(parameters)
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def init_query_log(app):
+    """Record statements per request, flag probable N+1s and log slow queries"""
+    slow_ms = app.config.get('SLOW_QUERY_MS')
+    _slow_query_settings['threshold'] = slow_ms / 1000.0 if slow_ms else None
+    _slow_query_settings['explain'] = app.config.get('SLOW_QUERY_EXPLAIN', True)
+    threshold = app.config.get('N_PLUS_ONE_THRESHOLD', 5)
+
+    @app.before_request
+    def _start_query_recording():
+        recorder = QueryRecorder()
+        _active_recorders().append(recorder)
+        g._query_recorder = recorder
+
+    @app.teardown_request
+    def _finish_query_recording(exc):
+        recorder = g.pop('_query_recorder', None)
+        if recorder is None:
+            return
+        stack = _active_recorders()
+        if recorder in stack:
+            stack.remove(recorder)
+
+        endpoint = request.endpoint or 'unmatched'
+        for shape, count in recorder.repeated_shapes(threshold).items():
+            metrics.inc('n_plus_one_total', {'endpoint': endpoint})
+            logger.warning(f"Probable N+1 in {endpoint}: {count} executions of {shape}")
@@ -0,0 +1,193 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+from .metrics import metrics
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and is emitted as a field
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with request id, route and method while still on the request thread"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.route = request.url_rule.rule if request.url_rule else None
+            record.method = request.method
+            record.path = request.path
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of records from high-volume loggers
+
+    `rates` maps logger name prefixes to the fraction of records kept; the
+    longest matching prefix wins. Records at or above `always_keep_level`,
+    and records logged with `extra={'_always_keep': True}`, are never dropped.
+    """
+
+    def __init__(self, rates=None, always_keep_level=logging.ERROR):
+        super().__init__()
+        self.rates = sorted((rates or {}).items(), key=lambda item: -len(item[0]))
+        self.always_keep_level = always_keep_level
+
+    def filter(self, record):
+        if record.levelno >= self.always_keep_level or getattr(record, '_always_keep', False):
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + '.'):
+                if random.random() < rate:
+                    return True
+                metrics.inc('log_records_sampled_out_total', {'logger': prefix})
+                return False
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Render records as single-line JSON objects"""
+
+    def format(self, record):
+        payload = {
+            'timestamp': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_') and value is not None:
+                payload[key] = value
+        if record.exc_info:
+            payload['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload['exception'] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+_traceback_formatter = logging.Formatter()
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full"""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc('log_records_dropped_total')
+
+    def prepare(self, record):
+        # Render the message and traceback on the calling thread, keep structured fields for the formatter
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_sampling(spec):
+    """Parse 'logger=rate,logger=rate' into a dict of sampling rates"""
+    rates = {}
+    for item in (spec or '').split(','):
+        if '=' not in item:
+            continue
+        name, rate = item.split('=', 1)
+        rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+def init_logging(app):
+    """
+    Route app and module loggers through a bounded queue to a background writer
+
+    The request thread only formats the message and enqueues the record; file
+    I/O happens on the QueueListener thread.
+    """
+    log_dir = app.config['LOG_DIR']
+    os.makedirs(log_dir, exist_ok=True)
+
+    file_handler = RotatingFileHandler(
+        os.path.join(log_dir, app.config['LOG_FILE']),
+        maxBytes=app.config['LOG_MAX_BYTES'],
+        backupCount=app.config['LOG_BACKUP_COUNT'],
+    )
+    if app.config['LOG_JSON']:
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+        ))
+
+    log_queue = queue.Queue(maxsize=app.config['LOG_QUEUE_SIZE'])
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sampling(app.config['LOG_SAMPLING'])))
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.setLevel(logging.INFO)
+
+    # Flask's default stderr handler writes on the request thread; move it behind the queue
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(default_handler.formatter)
+
+    listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    metrics.register_gauge('log_queue_depth', log_queue.qsize)
+
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(queue_handler)
+    app.logger.setLevel(logging.INFO)
+    app.extensions['log_listener'] = listener
+
+    access_logger = logging.getLogger(f'{app.logger.name}.access')
+    slow_request_ms = app.config['LOG_SLOW_REQUEST_MS']
+
+    @app.before_request
+    def _assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g._log_started = time.perf_counter()
+
+    @app.after_request
+    def _log_request(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        started = g.get('_log_started')
+        if started is not None and app.config['LOG_ACCESS_ENABLED']:
+            latency_ms = round((time.perf_counter() - started) * 1000, 2)
+            # Server errors and slow requests are logged above INFO and never sampled out
+            if response.status_code >= 500:
+                level = logging.ERROR
+            elif slow_request_ms and latency_ms >= slow_request_ms:
+                level = logging.WARNING
+            else:
+                level = logging.INFO
+            access_logger.log(
+                level,
+                f'{request.method} {request.path} {response.status_code}',
+                extra={
+                    'status': response.status_code,
+                    'latency_ms': latency_ms,
+                    '_always_keep': level > logging.INFO,
+                },
+            )
+        return response
+
+    return listener
@@ -0,0 +1,48 @@
+import importlib
+
+from .changes import change_notifier, fetch_changes, init_change_log, latest_seq, settled_seq
+from .comparison import compare_products, parse_product_ids
+from .facets import FacetIndex, FacetPagination, get_facet_index, parse_facet_args
+from .fieldsets import ProductFieldset
+from .insights import (
+    DEFAULT_PRICE_BUCKET_EDGES, count_by, grouped_counts, parse_bucket_edges,
+    price_bucket_case, price_bucket_labels, vertical_insights
+)
+from .jobs import Worker, enqueue_job, init_jobs, job_events, run_workers
+from .popularity import popularity, trending_epoch
+from .price_alerts import PriceAlertDetector
+from .reviews import enqueue_review_refresh
+from .shards import (
+    ScatterPagination, ShardRouter, catalog_sessions, get_shard_router, prepare_shard, shard_session
+)
+from .shared_snapshot import MappedCatalogSnapshot, get_shared_snapshot, write_shared_snapshot
+from .snapshot import CatalogSnapshot, get_catalog_snapshot
+from .suggest import SuggestIndex, get_suggest_index
+from .upserts import CatalogUpserter, UpsertError, upsert_insert
+
+__all__ = [
+    'RATING_DIMENSIONS', 'cached_analytics', 'compute_analytics', 'product_zscores',
+    'change_notifier', 'fetch_changes', 'init_change_log', 'latest_seq', 'settled_seq', 'compare_products', 'parse_product_ids',
+    'FacetIndex', 'FacetPagination', 'get_facet_index', 'parse_facet_args',
+    'ProductFieldset', 'DEFAULT_PRICE_BUCKET_EDGES', 'count_by', 'grouped_counts', 'parse_bucket_edges',
+    'price_bucket_case', 'price_bucket_labels', 'vertical_insights', 'Worker', 'enqueue_job', 'init_jobs', 'job_events', 'run_workers',
+    'popularity', 'trending_epoch', 'PriceAlertDetector', 'enqueue_review_refresh',
+    'ScatterPagination', 'ShardRouter', 'catalog_sessions', 'get_shard_router', 'prepare_shard', 'shard_session',
+    'MappedCatalogSnapshot', 'get_shared_snapshot', 'write_shared_snapshot',
+    'CatalogSnapshot', 'get_catalog_snapshot',
+    'SimilarityIndex', 'build_feature_matrix', 'get_similarity_index', 'nearest_neighbours',
+    'SuggestIndex', 'get_suggest_index', 'CatalogUpserter', 'UpsertError', 'upsert_insert'
+]
+
+# NumPy-backed modules, imported on first use so that starting the app does not load NumPy
+_LAZY_EXPORTS = {
+    'RATING_DIMENSIONS': 'analytics', 'cached_analytics': 'analytics', 'compute_analytics': 'analytics',
+    'product_zscores': 'analytics', 'SimilarityIndex': 'similarity', 'build_feature_matrix': 'similarity',
+    'get_similarity_index': 'similarity', 'nearest_neighbours': 'similarity',
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f'.{_LAZY_EXPORTS[name]}', __name__), name)
@@ -0,0 +1,271 @@
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import and_, func, select
+
+from project import db
+from project.models.models import Product, SubCategory, PriceHistory, AggregatedReview
+from project.monitoring import record_cache_lookup
+
+RATING_DIMENSIONS = AggregatedReview.RATING_DIMENSIONS
+PERCENTILES = (10, 25, 50, 75, 90)
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def latest_price_subquery(subcategory_id=None):
+    """Lowest price per product among the rows recorded on its most recent date, optionally for one subcategory"""
+    latest = (
+        select(PriceHistory.product_id, func.max(PriceHistory.date_recorded).label('latest'))
+        .group_by(PriceHistory.product_id)
+    )
+    prices = select(PriceHistory.product_id, func.min(PriceHistory.price).label('price'))
+    if subcategory_id:
+        # Only group the subcategory's price rows, not the whole table
+        in_subcategory = PriceHistory.product_id.in_(select(Product.id).where(Product.subcategory_id == subcategory_id))
+        latest = latest.where(in_subcategory)
+        prices = prices.where(in_subcategory)
+    latest = latest.subquery()
+    return (
+        prices
+        .join(latest, and_(PriceHistory.product_id == latest.c.product_id,
+                           PriceHistory.date_recorded == latest.c.latest))
+        .group_by(PriceHistory.product_id)
+        .subquery()
+    )
+
+
+def load_catalog_arrays(subcategory_id=None, partition_size=50000):
+    """
+    Bulk-load rating dimensions and latest prices into NumPy arrays
+
+    Rows are streamed in partitions and converted straight to float arrays, so
+    no ORM objects are created. Missing ratings/prices become NaN.
+    """
+    latest_price = latest_price_subquery(subcategory_id)
+    stmt = (
+        select(
+            Product.id,
+            Product.subcategory_id,
+            *[getattr(AggregatedReview, name) for name in RATING_DIMENSIONS],
+            latest_price.c.price
+        )
+        .outerjoin(AggregatedReview, AggregatedReview.product_id == Product.id)
+        .outerjoin(latest_price, latest_price.c.product_id == Product.id)
+    )
+    if subcategory_id:
+        stmt = stmt.where(Product.subcategory_id == subcategory_id)
+
+    width = len(RATING_DIMENSIONS) + 3
+    chunks = [
+        np.array(partition, dtype=float).reshape(-1, width)
+        for partition in db.session.execute(stmt.execution_options(yield_per=partition_size)).partitions()
+    ]
+    data = np.concatenate(chunks) if chunks else np.empty((0, width))
+
+    return {
+        'product_id': data[:, 0].astype(np.int64),
+        'subcategory_id': data[:, 1].astype(np.int64),
+        'ratings': data[:, 2:2 + len(RATING_DIMENSIONS)],
+        'price': data[:, -1],
+    }
+
+
+def grouped_mean_std(values, inverse, n_groups):
+    """NaN-aware per-group mean and population std for each column of a 2-D array"""
+    mask = ~np.isnan(values)
+    filled = np.where(mask, values, 0.0)
+    counts = np.stack([np.bincount(inverse, weights=mask[:, j], minlength=n_groups)
+                       for j in range(values.shape[1])], axis=1)
+    sums = np.stack([np.bincount(inverse, weights=filled[:, j], minlength=n_groups)
+                     for j in range(values.shape[1])], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+        deviations = np.where(mask, values - means[inverse], 0.0)
+        squares = np.stack([np.bincount(inverse, weights=deviations[:, j] ** 2, minlength=n_groups)
+                            for j in range(values.shape[1])], axis=1)
+        stds = np.sqrt(squares / counts)
+    return means, stds, counts
+
+
+def zscores(values, inverse, means, stds):
+    """Standardize each row against its group's mean/std (NaN where undefined)"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = (values - means[inverse]) / stds[inverse]
+    z[~np.isfinite(z) & ~np.isnan(values)] = 0.0
+    return z
+
+
+def grouped_pearson(x, y, inverse, n_groups):
+    """Per-group Pearson correlation between each column of `x` and the vector `y`"""
+    result = np.full((n_groups, x.shape[1]), np.nan)
+    for j in range(x.shape[1]):
+        valid = ~np.isnan(x[:, j]) & ~np.isnan(y)
+        groups = inverse[valid]
+        xs, ys = x[valid, j], y[valid]
+        n = np.bincount(groups, minlength=n_groups)
+        sx = np.bincount(groups, weights=xs, minlength=n_groups)
+        sy = np.bincount(groups, weights=ys, minlength=n_groups)
+        sxx = np.bincount(groups, weights=xs * xs, minlength=n_groups)
+        syy = np.bincount(groups, weights=ys * ys, minlength=n_groups)
+        sxy = np.bincount(groups, weights=xs * ys, minlength=n_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = sxy / n - (sx / n) * (sy / n)
+            var_x = sxx / n - (sx / n) ** 2
+            var_y = syy / n - (sy / n) ** 2
+            r = cov / np.sqrt(var_x * var_y)
+        r[n < 3] = np.nan
+        result[:, j] = np.clip(r, -1.0, 1.0)
+    return result
+
+
+def _number(value, digits=4):
+    """Convert a NumPy scalar to a JSON-friendly float (NaN becomes None)"""
+    value = float(value)
+    return None if value != value else round(value, digits)
+
+
+def compute_analytics(subcategory_id=None, top=10):
+    """
+    Per-subcategory rating/price distributions, correlations and best-value rankings
+
+    Everything after the bulk load is vectorized over the full product set;
+    Python only loops over subcategories and rating dimensions.
+    """
+    arrays = load_catalog_arrays(subcategory_id)
+    ratings, price = arrays['ratings'], arrays['price']
+    group_ids, inverse = np.unique(arrays['subcategory_id'], return_inverse=True)
+    n_groups = len(group_ids)
+
+    # Prices are log-normal, so standardize and correlate on log scale
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_price = np.where(price > 0, np.log(price), np.nan)
+    features = np.column_stack([ratings, log_price])
+    means, stds, counts = grouped_mean_std(features, inverse, n_groups)
+    z = zscores(features, inverse, means, stds)
+    correlations = grouped_pearson(ratings, log_price, inverse, n_groups)
+
+    # Best value: rated well relative to peers, priced low relative to peers
+    value_score = z[:, 0] - z[:, -1]
+    order = np.lexsort((-np.nan_to_num(value_score, nan=-np.inf), inverse))
+    sorted_groups = inverse[order]
+    boundaries = np.searchsorted(sorted_groups, np.arange(n_groups))
+
+    best_rows = []
+    for g in range(n_groups):
+        start = boundaries[g]
+        end = boundaries[g + 1] if g + 1 < n_groups else len(order)
+        candidates = order[start:end]
+        candidates = candidates[~np.isnan(value_score[candidates])][:top]
+        best_rows.append(candidates)
+
+    top_ids = {int(arrays['product_id'][i]) for rows in best_rows for i in rows}
+    products = {}
+    if top_ids:
+        products = {
+            row.id: row for row in db.session.execute(
+                select(Product.id, Product.name, Product.brand).where(Product.id.in_(top_ids))
+            )
+        }
+    names = dict(db.session.execute(
+        select(SubCategory.id, SubCategory.name).where(SubCategory.id.in_([int(g) for g in group_ids]))
+    ).all()) if n_groups else {}
+
+    # Percentiles per group: sort once, then slice contiguous blocks
+    group_order = np.argsort(inverse, kind='stable')
+    group_bounds = np.searchsorted(inverse[group_order], np.arange(n_groups + 1))
+
+    subcategories = []
+    dimensions = RATING_DIMENSIONS + ('price',)
+    for g, group_id in enumerate(group_ids):
+        block = features[group_order[group_bounds[g]:group_bounds[g + 1]]].copy()
+        block[:, -1] = price[group_order[group_bounds[g]:group_bounds[g + 1]]]
+        with np.errstate(invalid='ignore'):
+            pct = np.full((len(PERCENTILES), len(dimensions)), np.nan)
+            present = ~np.all(np.isnan(block), axis=0)
+            if present.any():
+                pct[:, present] = np.nanpercentile(block[:, present], PERCENTILES, axis=0)
+        subcategories.append({
+            'subcategory_id': int(group_id),
+            'subcategory_name': names.get(int(group_id)),
+            'product_count': int(group_bounds[g + 1] - group_bounds[g]),
+            'rated_count': int(counts[g, 0]),
+            'priced_count': int(counts[g, -1]),
+            'mean': {dim: _number(means[g, j]) for j, dim in enumerate(RATING_DIMENSIONS)},
+            'std': {dim: _number(stds[g, j]) for j, dim in enumerate(RATING_DIMENSIONS)},
+            'percentiles': {
+                dim: {f'p{p}': _number(pct[i, j], 2) for i, p in enumerate(PERCENTILES)}
+                for j, dim in enumerate(dimensions)
+            },
+            'price_correlations': {dim: _number(correlations[g, j]) for j, dim in enumerate(RATING_DIMENSIONS)},
+            'best_value': [
+                {
+                    'product_id': int(arrays['product_id'][i]),
+                    'name': products[int(arrays['product_id'][i])].name,
+                    'brand': products[int(arrays['product_id'][i])].brand,
+                    'overall_rating': _number(ratings[i, 0], 2),
+                    'price': _number(price[i], 2),
+                    'rating_zscore': _number(z[i, 0]),
+                    'price_zscore': _number(z[i, -1]),
+                    'value_score': _number(value_score[i]),
+                }
+                for i in best_rows[g]
+            ],
+        })
+
+    return {
+        'dimensions': list(RATING_DIMENSIONS),
+        'percentiles': list(PERCENTILES),
+        'price_scale': 'log',
+        'subcategories': subcategories,
+    }
+
+
+def subcategory_zscores(subcategory_id):
+    """(product ids, z-score rows) of a subcategory's ratings and log prices against its own products"""
+    arrays = load_catalog_arrays(subcategory_id)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_price = np.where(arrays['price'] > 0, np.log(arrays['price']), np.nan)
+    features = np.column_stack([arrays['ratings'], log_price])
+    inverse = np.zeros(len(features), dtype=np.int64)
+    means, stds, _ = grouped_mean_std(features, inverse, 1)
+    return arrays['product_id'], zscores(features, inverse, means, stds)
+
+
+def product_zscores(product_id, ttl=300):
+    """Z-scores of one product's ratings and price relative to its subcategory (cached per subcategory)"""
+    subcategory_id = db.session.query(Product.subcategory_id).filter_by(id=product_id).scalar()
+    if subcategory_id is None:
+        return None
+    for refresh in (False, True):
+        product_ids, z = _cached('analytics_zscores', ('zscores', subcategory_id), ttl,
+                                 lambda: subcategory_zscores(subcategory_id), refresh=refresh)
+        rows = np.nonzero(product_ids == product_id)[0]
+        if len(rows):
+            break  # Otherwise the product was added after the vectors were cached
+    else:
+        return None
+    return {dim: _number(z[int(rows[0]), j]) for j, dim in enumerate(RATING_DIMENSIONS + ('price',))}
+
+
+def _cached(cache_name, key, ttl, compute, refresh=False):
+    """compute() memoized under `key` for `ttl` seconds; `refresh` recomputes regardless"""
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+    if entry and entry[0] > now and not refresh:
+        record_cache_lookup(cache_name, True)
+        return entry[1]
+    record_cache_lookup(cache_name, False)
+    result = compute()
+    with _cache_lock:
+        _cache[key] = (now + ttl, result)
+    return result
+
+
+def cached_analytics(subcategory_id=None, top=10, ttl=300):
+    """compute_analytics() memoized per (subcategory, top) for `ttl` seconds"""
+    return _cached('analytics', ('analytics', subcategory_id, top), ttl,
+                   lambda: compute_analytics(subcategory_id, top))
@@ -0,0 +1,515 @@
+import heapq
+from datetime import date, datetime
+from itertools import islice
+
+from flask import current_app
+from sqlalchemy import desc, func, select
+
+from project import db
+from project.models.models import Category, SubCategory, Product, ProductAttribute, PriceHistory, AggregatedReview
+from project.services.fieldsets import is_latest_price
+from project.services.shards import BIND_PREFIX, get_shard_router, shard_session
+
+MAX_DEPTH = 5
+MAX_ROOTS = 10
+MAX_LIMIT = 100
+IN_CHUNK_SIZE = 500
+
+
+class QueryError(ValueError):
+    """Invalid query document; the message is safe to return to the client"""
+
+
+class Relation:
+    """How a node type reaches related rows: parent[local] == child[remote]"""
+
+    def __init__(self, target, local, remote, many=False, default_limit=None, allow_latest=False):
+        self.target = target
+        self.local = local
+        self.remote = remote
+        self.many = many
+        self.default_limit = default_limit
+        self.allow_latest = allow_latest
+
+
+class Computed:
+    """A derived field: `resolve(rows, ctx)` returns one value per row using the `needs` columns"""
+
+    def __init__(self, needs, resolve):
+        self.needs = needs
+        self.resolve = resolve
+
+
+class NodeType:
+    """A queryable model: plain columns, computed fields, relations and list ordering"""
+
+    def __init__(self, model, columns, computed=None, relations=None, order_by=(), default_fields=None):
+        self.model = model
+        self.columns = columns
+        self.computed = computed or {}
+        self.relations = relations or {}
+        self.order_by = order_by
+        self.default_fields = default_fields or columns
+
+
+class DataLoader:
+    """
+    Per-request batching cache
+
+    load_many() returns {key: value} for the requested keys, calling
+    `batch_fn` once (per IN_CHUNK_SIZE keys) with only the keys not seen yet.
+    """
+
+    def __init__(self, batch_fn, default=None):
+        self.batch_fn = batch_fn
+        self.default = default
+        self.cache = {}
+
+    def load_many(self, keys):
+        keys = {key for key in keys if key is not None}
+        missing = sorted(key for key in keys if key not in self.cache)
+        for start in range(0, len(missing), IN_CHUNK_SIZE):
+            chunk = missing[start:start + IN_CHUNK_SIZE]
+            found = self.batch_fn(chunk)
+            for key in chunk:
+                self.cache[key] = found.get(key, self.default() if callable(self.default) else self.default)
+        return {key: self.cache[key] for key in keys}
+
+
+class QueryContext:
+    """State for one query document: the dataloaders it has created and the catalog databases it reads"""
+
+    def __init__(self):
+        self.loaders = {}
+        self.router = get_shard_router()
+        self._subcategory_shards = None
+
+    def loader(self, key, batch_fn, default=None):
+        if key not in self.loaders:
+            self.loaders[key] = DataLoader(batch_fn, default)
+        return self.loaders[key]
+
+    def sessions(self):
+        """Session of every catalog database, the default one first"""
+        return [shard_session(bind_key) for bind_key in self.router.bind_keys()]
+
+    def partition(self, type_name, key_column, keys):
+        """
+        [(session, keys)] splitting `keys` by the catalog database holding the rows
+
+        Categories and subcategories are read from the default database, which
+        keeps the authoritative taxonomy. Product rows follow their product id
+        or, when loaded by subcategory, the shard that subcategory is routed to.
+        """
+        if not self.router.enabled or type_name in ('Category', 'SubCategory'):
+            return [(db.session, list(keys))]
+        if key_column == 'subcategory_id' and self._subcategory_shards is None:
+            self._subcategory_shards = self.router.subcategory_shards()
+
+        groups = {}
+        for key in keys:
+            if key_column == 'subcategory_id':
+                shard = self._subcategory_shards.get(key)
+                bind_key = BIND_PREFIX + shard if shard else None
+            else:
+                try:
+                    bind_key = self.router.bind_for_id(key)
+                except LookupError:
+                    continue  # No database holds the id, so neither does any row
+            groups.setdefault(bind_key, []).append(key)
+        return [(shard_session(bind_key), group) for bind_key, group in groups.items()]
+
+
+def load_related(ctx, type_name, columns, key_column, keys, many=False, limit=None, latest=False):
+    """
+    Batch-load rows of `type_name` whose `key_column` is in `keys`
+
+    Returns {key: row} (or {key: [rows]} when `many`). One IN query per call
+    for keys not already cached; `limit` caps rows per key with a window
+    function so that still takes a single query.
+    """
+    node_type = TYPES[type_name]
+    model = node_type.model
+    columns = tuple(sorted(set(columns) | {'id', key_column}))
+
+    def stmt(keys):
+        key = getattr(model, key_column)
+        selected = [getattr(model, column) for column in columns]
+        criteria = [key.in_(keys)]
+        if latest:
+            criteria.append(is_latest_price(model))
+
+        if many and limit:
+            rank = func.row_number().over(partition_by=key, order_by=node_type.order_by).label('rank')
+            ranked = select(*selected, rank).where(*criteria).subquery()
+            return (
+                select(*[ranked.c[column] for column in columns])
+                .where(ranked.c.rank <= limit)
+                .order_by(ranked.c[key_column], ranked.c.rank)
+            )
+        return select(*selected).where(*criteria).order_by(*node_type.order_by)
+
+    def batch(chunk):
+
+        found = {}
+        for session, part in ctx.partition(type_name, key_column, chunk):
+            for row in session.execute(stmt(part)).mappings():
+                row = dict(row)
+                if many:
+                    found.setdefault(row[key_column], []).append(row)
+                else:
+                    found[row[key_column]] = row
+        return found
+
+    loader = ctx.loader((type_name, columns, key_column, many, limit, latest), batch,
+                        default=list if many else None)
+    return loader.load_many(keys)
+
+
+def _grouped_count(ctx, name, stmt_for_keys, keys, partition):
+    """{key: count} from `stmt_for_keys`, summed over the sessions `partition(chunk)` returns"""
+    def batch(chunk):
+        counts = {}
+        for session, part in partition(chunk):
+            for key, count in session.execute(stmt_for_keys(part)):
+                counts[key] = counts.get(key, 0) + count
+        return counts
+    return ctx.loader(name, batch, default=0).load_many(keys)
+
+
+def _subcategory_slugs(rows, ctx):
+    return [row['name'].lower().replace(' ', '-') for row in rows]
+
+
+def _subcategory_product_counts(rows, ctx):
+    counts = _grouped_count(ctx, 'subcategory_product_count', lambda chunk: (
+        select(Product.subcategory_id, func.count(Product.id))
+        .where(Product.subcategory_id.in_(chunk))
+        .group_by(Product.subcategory_id)
+    ), [row['id'] for row in rows], lambda chunk: ctx.partition('Product', 'subcategory_id', chunk))
+    return [counts[row['id']] for row in rows]
+
+
+def _category_product_counts(rows, ctx):
+    # A category's subcategories may be routed to different shards, so every database is counted
+    counts = _grouped_count(ctx, 'category_product_count', lambda chunk: (
+        select(SubCategory.category_id, func.count(Product.id))
+        .join(Product, Product.subcategory_id == SubCategory.id)
+        .where(SubCategory.category_id.in_(chunk))
+        .group_by(SubCategory.category_id)
+    ), [row['id'] for row in rows], lambda chunk: [(session, chunk) for session in ctx.sessions()])
+    return [counts[row['id']] for row in rows]
+
+
+def _product_subcategories(rows, ctx):
+    return load_related(ctx, 'SubCategory', ('name', 'category_id'), 'id',
+                        [row['subcategory_id'] for row in rows])
+
+
+def _product_subcategory_names(rows, ctx):
+    subcategories = _product_subcategories(rows, ctx)
+    return [(subcategories.get(row['subcategory_id']) or {}).get('name') for row in rows]
+
+
+def _product_category_names(rows, ctx):
+    subcategories = _product_subcategories(rows, ctx)
+    categories = load_related(ctx, 'Category', ('name',), 'id',
+                              [subcategory['category_id'] for subcategory in subcategories.values() if subcategory])
+    names = []
+    for row in rows:
+        subcategory = subcategories.get(row['subcategory_id'])
+        category = categories.get(subcategory['category_id']) if subcategory else None
+        names.append(category['name'] if category else None)
+    return names
+
+
+def _product_overall_ratings(rows, ctx):
+    reviews = load_related(ctx, 'AggregatedReview', ('overall_rating',), 'product_id', [row['id'] for row in rows])
+    return [(reviews.get(row['id']) or {}).get('overall_rating') for row in rows]
+
+
+TYPES = {
+    'Category': NodeType(
+        Category,
+        columns=('id', 'name', 'description', 'icon_svg', 'status', 'display_order', 'created_at', 'updated_at'),
+        computed={'total_products': Computed(('id',), _category_product_counts)},
+        relations={'subcategories': Relation('SubCategory', 'id', 'category_id', many=True)},
+        order_by=(Category.display_order, Category.name)
+    ),
+    'SubCategory': NodeType(
+        SubCategory,
+        columns=('id', 'name', 'description', 'category_id', 'status', 'display_order', 'created_at', 'updated_at'),
+        computed={
+            'slug': Computed(('name',), _subcategory_slugs),
+            'product_count': Computed(('id',), _subcategory_product_counts),
+        },
+        relations={
+            'category': Relation('Category', 'category_id', 'id'),
+            'products': Relation('Product', 'id', 'subcategory_id', many=True, default_limit=20),
+        },
+        order_by=(SubCategory.display_order, SubCategory.name),
+        default_fields=('id', 'name', 'description', 'slug', 'category_id', 'status', 'display_order',
+                        'product_count', 'created_at', 'updated_at')
+    ),
+    'Product': NodeType(
+        Product,
+        columns=('id', 'name', 'brand', 'short_description', 'insight_snippet', 'image_url', 'subcategory_id',
+                 'created_at', 'updated_at'),
+        computed={
+            'subcategory_name': Computed(('subcategory_id',), _product_subcategory_names),
+            'category_name': Computed(('subcategory_id',), _product_category_names),
+            'overall_rating': Computed(('id',), _product_overall_ratings),
+        },
+        relations={
+            'subcategory': Relation('SubCategory', 'subcategory_id', 'id'),
+            'aggregated_review': Relation('AggregatedReview', 'id', 'product_id'),
+            'attributes': Relation('ProductAttribute', 'id', 'product_id', many=True),
+            'price_history': Relation('PriceHistory', 'id', 'product_id', many=True, allow_latest=True),
+        },
+        order_by=(Product.name, Product.id),
+        default_fields=Product.SUMMARY_FIELDS
+    ),
+    'AggregatedReview': NodeType(
+        AggregatedReview,
+        columns=tuple(column.key for column in AggregatedReview.__table__.columns),
+        order_by=(AggregatedReview.id,)
+    ),
+    'ProductAttribute': NodeType(
+        ProductAttribute,
+        columns=('id', 'key', 'value', 'product_id', 'created_at', 'updated_at'),
+        order_by=(ProductAttribute.id,)
+    ),
+    'PriceHistory': NodeType(
+        PriceHistory,
+        columns=('id', 'price', 'retailer_name', 'date_recorded', 'product_id', 'created_at', 'updated_at'),
+        order_by=(PriceHistory.date_recorded.desc(), PriceHistory.id.desc())
+    ),
+}
+
+
+class Selection:
+    """A validated node of the query tree"""
+
+    def __init__(self, type_name, fields, relations, args):
+        node_type = TYPES[type_name]
+        self.type_name = type_name
+        self.fields = fields
+        self.relations = relations  # name -> Selection
+        self.args = args
+        self.computed = [field for field in fields if field in node_type.computed]
+        needed = {field for field in fields if field in node_type.columns}
+        needed.update(column for field in self.computed for column in node_type.computed[field].needs)
+        needed.update(node_type.relations[name].local for name in relations)
+        self.columns = tuple(sorted(needed | {'id'}))
+
+
+def _int_arg(args, name, default, minimum=1, maximum=None):
+    value = args.get(name, default)
+    if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+        raise QueryError(f"'{name}' must be an integer >= {minimum}")
+    return min(value, maximum) if maximum else value
+
+
+def parse_selection(type_name, spec, depth=1, relation=None):
+    """Validate one node of the query document against the schema"""
+    if depth > MAX_DEPTH:
+        raise QueryError(f'Query is nested deeper than {MAX_DEPTH} levels')
+    if spec is True:
+        spec = {}
+    if not isinstance(spec, dict):
+        raise QueryError(f'Selection for {type_name} must be an object')
+
+    node_type = TYPES[type_name]
+    available = node_type.columns + tuple(node_type.computed)
+    fields = spec.get('fields', node_type.default_fields)
+    if not isinstance(fields, list) and not isinstance(fields, tuple):
+        raise QueryError(f"'fields' for {type_name} must be a list")
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise QueryError(f"Unknown {type_name} field(s): {', '.join(map(str, unknown))}. "
+                         f"Available: {', '.join(available)}")
+    fields = list(dict.fromkeys(['id', *fields]))
+
+    args = spec.get('args', {})
+    if not isinstance(args, dict):
+        raise QueryError(f"'args' for {type_name} must be an object")
+    if relation is not None:
+        if relation.many:
+            default = relation.default_limit or MAX_LIMIT
+            args = dict(args, limit=_int_arg(args, 'limit', default, maximum=MAX_LIMIT))
+        if args.get('latest') and not relation.allow_latest:
+            raise QueryError(f"'latest' is not supported for {type_name}")
+
+    relations = {}
+    for name, child in spec.items():
+        if name in ('fields', 'args'):
+            continue
+        if name not in node_type.relations:
+            raise QueryError(f"Unknown {type_name} relation '{name}'. "
+                             f"Available: {', '.join(node_type.relations) or 'none'}")
+        child_relation = node_type.relations[name]
+        relations[name] = parse_selection(child_relation.target, child, depth + 1, child_relation)
+    return Selection(type_name, fields, relations, args)
+
+
+def resolve(ctx, selection, rows):
+    """Fill computed fields and relations for every row of one level, batching each across the level"""
+    node_type = TYPES[selection.type_name]
+    for field in selection.computed:
+        for row, value in zip(rows, node_type.computed[field].resolve(rows, ctx)):
+            row[field] = value
+
+    for name, child in selection.relations.items():
+        relation = node_type.relations[name]
+        related = load_related(
+            ctx, relation.target, child.columns, relation.remote,
+            [row[relation.local] for row in rows], many=relation.many,
+            limit=child.args.get('limit'), latest=bool(child.args.get('latest'))
+        )
+        children = []
+        for value in related.values():
+            children.extend(value if relation.many else [value] if value else [])
+        if children:
+            resolve(ctx, child, children)
+        for row in rows:
+            row[('relation', name, id(child))] = related.get(row[relation.local], [] if relation.many else None)
+    return rows
+
+
+def project(selection, row):
+    """Shape a resolved row into the requested output"""
+    if row is None:
+        return None
+    result = {}
+    for field in selection.fields:
+        value = row[field]
+        result[field] = value.isoformat() if isinstance(value, (date, datetime)) else value
+    for name, child in selection.relations.items():
+        value = row[('relation', name, id(child))]
+        result[name] = [project(child, item) for item in value] if isinstance(value, list) else project(child, value)
+    return result
+
+
+def _select_rows(stmt, session=None):
+    return [dict(row) for row in (session or db.session).execute(stmt).mappings()]
+
+
+def _listing_key(row):
+    """GET /api/products order of a products root row"""
+    return (row['listing_rating'] is not None, -(row['listing_rating'] or 0), row['listing_name'], row['id'])
+
+
+def _columns(selection):
+    model = TYPES[selection.type_name].model
+    return [getattr(model, column) for column in selection.columns]
+
+
+def root_categories(ctx, selection):
+    stmt = select(*_columns(selection)).order_by(*TYPES['Category'].order_by)
+    rows = resolve(ctx, selection, _select_rows(stmt))
+    return [project(selection, row) for row in rows]
+
+
+def root_subcategories(ctx, selection):
+    stmt = select(*_columns(selection)).order_by(*TYPES['SubCategory'].order_by)
+    rows = resolve(ctx, selection, _select_rows(stmt))
+    return [project(selection, row) for row in rows]
+
+
+def root_products(ctx, selection):
+    """
+    Same filtering, ordering and pagination as GET /api/products
+
+    On a sharded catalog a subcategory is read from the database holding it,
+    and an unfiltered listing is merged from every database, with the same
+    SHARD_SCATTER_MAX_ROWS depth cap.
+    """
+    args = selection.args
+    page = _int_arg(args, 'page', 1)
+    per_page = _int_arg(args, 'per_page', 20, maximum=MAX_LIMIT)
+    offset = (page - 1) * per_page
+
+    criteria = []
+    sessions = ctx.sessions()
+    if args.get('subcategory'):
+        # Match the slug the same way SubCategory.to_dict() derives it
+        slug = func.lower(func.replace(SubCategory.name, ' ', '-')) == str(args['subcategory']).lower()
+        criteria.append(Product.subcategory_id.in_(select(SubCategory.id).where(slug)))
+        if ctx.router.enabled:
+            names = db.session.execute(select(SubCategory.name).where(slug)).scalars()
+            bind_keys = dict.fromkeys(ctx.router.bind_for_subcategory(name) for name in names) or [None]
+            sessions = [shard_session(bind_key) for bind_key in bind_keys]
+    if len(sessions) > 1 and offset + per_page > current_app.config['SHARD_SCATTER_MAX_ROWS']:
+        raise QueryError(f"Pages past row {current_app.config['SHARD_SCATTER_MAX_ROWS']} of the products "
+                         f"across shards are not available; filter by subcategory")
+
+    total = sum(session.execute(select(func.count(Product.id)).where(*criteria)).scalar() for session in sessions)
+    stmt = (
+        select(*_columns(selection), AggregatedReview.overall_rating.label('listing_rating'),
+               Product.name.label('listing_name'))
+        .outerjoin(AggregatedReview, AggregatedReview.product_id == Product.id)
+        .where(*criteria)
+        .order_by(desc(AggregatedReview.overall_rating.is_(None)), desc(AggregatedReview.overall_rating),
+                  Product.name, Product.id)
+    )
+    if len(sessions) == 1:
+        rows = _select_rows(stmt.limit(per_page).offset(offset), sessions[0])
+    else:
+        # Each database's first offset + per_page rows, merged in listing order
+        streams = [_select_rows(stmt.limit(offset + per_page), session) for session in sessions]
+        rows = list(islice(heapq.merge(*streams, key=_listing_key), offset, offset + per_page))
+    rows = resolve(ctx, selection, rows)
+    return {
+        'items': [project(selection, row) for row in rows],
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'pages': (total + per_page - 1) // per_page,
+    }
+
+
+def root_product(ctx, selection):
+    product_id = _int_arg(selection.args, 'id', None)
+    stmt = select(*_columns(selection)).where(Product.id == product_id)
+    rows = []
+    for session, _ in ctx.partition('Product', 'id', [product_id]):
+        rows = _select_rows(stmt, session)
+    rows = resolve(ctx, selection, rows)
+    return project(selection, rows[0]) if rows else None
+
+
+ROOTS = {
+    'categories': ('Category', root_categories),
+    'subcategories': ('SubCategory', root_subcategories),
+    'products': ('Product', root_products),
+    'product': ('Product', root_product),
+}
+
+
+def execute_query(document):
+    """
+    Execute a query document and return {alias: result}
+
+    Each top-level key is an alias; its `root` (default: the alias itself)
+    is one of ROOTS. The whole tree is checked against the schema before any
+    SQL runs, and one QueryContext is shared so identical lookups across
+    roots are loaded once.
+    """
+    if not isinstance(document, dict) or not document:
+        raise QueryError('Query must be a non-empty object of {alias: selection}')
+    if len(document) > MAX_ROOTS:
+        raise QueryError(f'At most {MAX_ROOTS} root selections per query')
+
+    plan = []
+    for alias, spec in document.items():
+        spec = {} if spec is True else spec
+        root = spec.get('root', alias) if isinstance(spec, dict) else alias
+        if root not in ROOTS:
+            raise QueryError(f"Unknown root '{root}'. Available: {', '.join(ROOTS)}")
+        if isinstance(spec, dict):
+            spec = {key: value for key, value in spec.items() if key != 'root'}
+        type_name, resolver = ROOTS[root]
+        plan.append((alias, resolver, parse_selection(type_name, spec)))
+
+    ctx = QueryContext()
+    return {alias: resolver(ctx, selection) for alias, resolver, selection in plan}
@@ -0,0 +1,171 @@
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, select
+
+from project import db
+from project.models.models import Product, ProductAttribute, PriceHistory, AggregatedReview, ChangeEvent
+
+# Models whose mutations are logged; bookkeeping columns alone do not count as a change
+TRACKED_MODELS = (Product, ProductAttribute, PriceHistory, AggregatedReview)
+IGNORED_FIELDS = frozenset(('created_at', 'updated_at', 'last_updated'))
+
+
+class ChangeNotifier:
+    """Wakes in-process long-pollers and streams as soon as a change is committed"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._generation = 0
+
+    def notify(self):
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+    def wait(self, timeout):
+        """Block until the next commit with changes or `timeout` seconds; True if woken by a commit"""
+        with self._condition:
+            generation = self._generation
+            return self._condition.wait_for(lambda: self._generation != generation, timeout)
+
+
+change_notifier = ChangeNotifier()
+_listeners_installed = False
+
+
+def change_log_enabled():
+    return has_app_context() and current_app.config.get('CHANGE_LOG_ENABLED', False)
+
+
+def log_changes(session, events):
+    """
+    Append change events (dicts of ChangeEvent columns) within the session's transaction
+
+    The events commit or roll back together with the writes they describe.
+    """
+    if not events or not change_log_enabled():
+        return
+    now = datetime.utcnow()
+    session.connection().execute(ChangeEvent.__table__.insert(), [dict(e, created_at=now) for e in events])
+    session.info['changes_logged'] = True
+
+
+def _product_id(instance):
+    return instance.id if isinstance(instance, Product) else instance.product_id
+
+
+def _changed_fields(instance):
+    state = inspect(instance)
+    return [
+        attr.key for attr in state.mapper.column_attrs
+        if attr.key not in IGNORED_FIELDS and state.attrs[attr.key].history.has_changes()
+    ]
+
+
+def _after_flush(session, flush_context):
+    """Turn the flushed ORM state of tracked models into change events"""
+    if not change_log_enabled():
+        return
+    events = []
+    for op, instances in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for instance in instances:
+            if not isinstance(instance, TRACKED_MODELS):
+                continue
+            fields = None
+            if op == 'update':
+                fields = _changed_fields(instance)
+                if not fields:
+                    continue
+            events.append({
+                'entity': instance.__tablename__, 'entity_id': instance.id,
+                'product_id': _product_id(instance), 'op': op,
+                'fields': ','.join(fields) if fields else None,
+            })
+    log_changes(session, events)
+
+
+def _after_commit(session):
+    if session.info.pop('changes_logged', False):
+        change_notifier.notify()
+
+
+def _after_rollback(session):
+    session.info.pop('changes_logged', None)
+
+
+def init_change_log(app):
+    """
+    Log mutations of tracked models to `change_log` on every flush
+
+    The listeners sit on the shared session class, so they are installed
+    once per process and check CHANGE_LOG_ENABLED of the active app.
+    Core statements bypass flush events; writers using them (e.g. the bulk
+    upserter) call log_changes() themselves.
+    """
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    event.listen(db.session, 'after_flush', _after_flush)
+    event.listen(db.session, 'after_commit', _after_commit)
+    event.listen(db.session, 'after_rollback', _after_rollback)
+    _listeners_installed = True
+
+
+def settled_high_water(id_column, created_column, since, settle_seconds, session=None):
+    """
+    Highest id of an insert-ordered column up to which a cursor can read without skipping a row
+
+    Ids are taken when rows are inserted, not when they commit, so with
+    concurrent writers (PostgreSQL) a row can become visible after a
+    higher-numbered one, and a cursor already past it would never see it.
+    Readers therefore stop before the first missing id whose successor was
+    written less than `settle_seconds` ago, as it may still commit; older
+    gaps are rolled-back or deleted rows.
+    """
+    session = session or db.session
+    count, head = session.execute(
+        select(func.count(), func.max(id_column)).where(id_column > since)
+    ).one()
+    if not count or count == head - since:
+        return head or since  # No gaps after the cursor
+    cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+    settled = session.execute(
+        select(func.max(id_column)).where(id_column > since, created_column <= cutoff)
+    ).scalar() or since
+    for row_id in session.execute(
+        select(id_column).where(id_column > settled).order_by(id_column)
+    ).scalars():
+        if row_id != settled + 1:
+            break
+        settled = row_id
+    return settled
+
+
+def settled_seq(since=0, session=None):
+    """Highest change sequence number up to which the log can be read without skipping an event"""
+    return settled_high_water(ChangeEvent.seq, ChangeEvent.created_at, since,
+                              current_app.config['CHANGE_LOG_SETTLE_SECONDS'], session)
+
+
+def fetch_changes(since, limit):
+    """Up to `limit` settled events after sequence number `since`, in sequence order"""
+    head = settled_seq(since)
+    return db.session.execute(
+        select(ChangeEvent).where(ChangeEvent.seq > since, ChangeEvent.seq <= head)
+        .order_by(ChangeEvent.seq).limit(limit)
+    ).scalars().all()
+
+
+def latest_seq(session=None):
+    """Highest change sequence number in `session`'s database (default: db.session)"""
+    return (session or db.session).execute(select(func.max(ChangeEvent.seq))).scalar() or 0
+
+
+def prune_changes(retention_days):
+    """Delete events older than `retention_days`; returns the number removed"""
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    deleted = db.session.execute(ChangeEvent.__table__.delete().where(ChangeEvent.created_at < cutoff)).rowcount
+    db.session.commit()
+    return deleted
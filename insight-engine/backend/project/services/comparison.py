@@ -0,0 +1,120 @@
+from sqlalchemy import func, select
+
+from project import db
+from project.models.models import Product, ProductAttribute, PriceHistory, AggregatedReview, SubCategory
+
+
+def parse_product_ids(raw, limit):
+    """Comma-separated product ids ('3,5,8') in first-seen order; raises ValueError"""
+    ids = []
+    for part in (raw or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if not part.isdigit():
+            raise ValueError(f"Invalid product id '{part}'")
+        if int(part) not in ids:
+            ids.append(int(part))
+    if len(ids) < 2:
+        raise ValueError('Pass at least two product ids, e.g. ids=3,5')
+    if len(ids) > limit:
+        raise ValueError(f'At most {limit} products can be compared at once')
+    return ids
+
+
+def _latest_prices(product_ids):
+    """(product_id, retailer_name, price, date_recorded) of each retailer's most recent row"""
+    ranked = (
+        select(
+            PriceHistory.product_id, PriceHistory.retailer_name, PriceHistory.price, PriceHistory.date_recorded,
+            func.row_number().over(
+                partition_by=(PriceHistory.product_id, PriceHistory.retailer_name),
+                order_by=(PriceHistory.date_recorded.desc(), PriceHistory.id.desc())
+            ).label('recency')
+        )
+        .where(PriceHistory.product_id.in_(product_ids))
+        .subquery()
+    )
+    return db.session.execute(
+        select(ranked.c.product_id, ranked.c.retailer_name, ranked.c.price, ranked.c.date_recorded)
+        .where(ranked.c.recency == 1)
+    ).all()
+
+
+def _row(label_key, label, values, compared=None):
+    """Matrix row; `differs` when products disagree on `compared` (default: the values), missing included"""
+    compared = values if compared is None else compared
+    present = [value for value in compared if value is not None]
+    return {label_key: label, 'values': values, 'differs': len(set(present)) > 1 or len(present) < len(compared)}
+
+
+def compare_products(product_ids):
+    """
+    Aligned comparison matrix of `product_ids`, one batched query per table
+
+    Every row of `attributes`, `ratings` and `prices` has one value per
+    product in `products` order (None where a product has none) and a
+    `differs` flag for "show differences only" views. Attributes are
+    ordered by how many products have them; ratings list the best index
+    per dimension; prices hold each retailer's latest price.
+    """
+    rows = db.session.execute(
+        select(Product.id, Product.name, Product.brand, Product.image_url, Product.subcategory_id, SubCategory.name)
+        .outerjoin(SubCategory, SubCategory.id == Product.subcategory_id)
+        .where(Product.id.in_(product_ids))
+    ).all()
+    found = {row[0]: row for row in rows}
+    ids = [product_id for product_id in product_ids if product_id in found]
+    column = {product_id: i for i, product_id in enumerate(ids)}
+
+    attributes = {}
+    for product_id, key, value in db.session.execute(
+            select(ProductAttribute.product_id, ProductAttribute.key, ProductAttribute.value)
+            .where(ProductAttribute.product_id.in_(ids))):
+        attributes.setdefault(key, [None] * len(ids))[column[product_id]] = value
+
+    reviews = {
+        row[0]: row[1:] for row in db.session.execute(
+            select(AggregatedReview.product_id, AggregatedReview.total_reviews_analyzed,
+                   *[getattr(AggregatedReview, name) for name in AggregatedReview.RATING_DIMENSIONS])
+            .where(AggregatedReview.product_id.in_(ids))
+        )
+    }
+    ratings = []
+    for i, dimension in enumerate(AggregatedReview.RATING_DIMENSIONS, 1):
+        values = [reviews[product_id][i] if product_id in reviews else None for product_id in ids]
+        row = _row('dimension', dimension, values)
+        present = [value for value in values if value is not None]
+        row['best'] = values.index(max(present)) if present else None
+        ratings.append(row)
+
+    prices = {}
+    for product_id, retailer, price, recorded in _latest_prices(ids):
+        prices.setdefault(retailer, [None] * len(ids))[column[product_id]] = {
+            'price': price, 'date_recorded': recorded.isoformat() if recorded else None
+        }
+    lowest = []
+    for i in range(len(ids)):
+        offers = [values[i]['price'] for values in prices.values() if values[i] is not None]
+        lowest.append(min(offers) if offers else None)
+
+    return {
+        'products': [
+            {'id': row[0], 'name': row[1], 'brand': row[2], 'image_url': row[3], 'subcategory_id': row[4],
+             'subcategory_name': row[5],
+             'total_reviews_analyzed': reviews[row[0]][0] if row[0] in reviews else None}
+            for row in (found[product_id] for product_id in ids)
+        ],
+        'missing': [product_id for product_id in product_ids if product_id not in found],
+        'attributes': [
+            _row('key', key, values) for key, values in sorted(
+                attributes.items(), key=lambda item: (-sum(value is not None for value in item[1]), item[0])
+            )
+        ],
+        'ratings': ratings,
+        'prices': [
+            _row('retailer', retailer, values, [offer and offer['price'] for offer in values])
+            for retailer, values in sorted(prices.items())
+        ],
+        'lowest_price': lowest,
+    }
@@ -0,0 +1,286 @@
+import threading
+import time
+from array import array
+from bisect import bisect_right
+
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import desc, select
+
+from project import db
+from project.models.models import Product, ProductAttribute, SubCategory, AggregatedReview
+from project.services.changes import settled_seq
+from project.services.insights import price_bucket_labels
+
+ATTRIBUTE_PREFIX = 'attr.'
+UNRATED = 'unrated'
+# Facets whose values are fixed bands, listed in band order rather than by count
+BAND_FACETS = ('rating', 'price')
+
+
+def slugify(name):
+    """Subcategory slug as accepted by GET /api/products ('AI Tools' -> 'ai-tools')"""
+    return name.lower().replace(' ', '-')
+
+
+def _edge(value):
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+
+def band_keys(edges):
+    """URL-safe keys for the ranges delimited by `edges` ('under-3', '3-4', '4-up')"""
+    keys = [f'under-{_edge(edges[0])}']
+    keys.extend(f'{_edge(low)}-{_edge(high)}' for low, high in zip(edges, edges[1:]))
+    keys.append(f'{_edge(edges[-1])}-up')
+    return keys
+
+
+def rating_band_labels(edges):
+    """Human-readable labels for the rating ranges delimited by `edges`"""
+    labels = [f'Under {_edge(edges[0])}']
+    labels.extend(f'{_edge(low)} - {_edge(high)}' for low, high in zip(edges, edges[1:]))
+    labels.append(f'{_edge(edges[-1])} and up')
+    return labels
+
+
+class FacetIndex:
+    """
+    Precomputed bitmap index over the listing for faceted browsing
+
+    Rows are numbered in listing order (unrated first, then rating desc,
+    name, id) and every facet value owns a bitmap of its rows, held as a
+    Python int. Filtering is OR within a facet and AND across facets;
+    each facet is counted against the filters of the *other* facets, so
+    the counts say how many results picking that value would give.
+    Counting a value is one AND plus int.bit_count(), independent of how
+    many facets are requested.
+    """
+
+    def __init__(self, ids, bitmaps, labels, seq):
+        self.ids = ids
+        self.bitmaps = bitmaps
+        self.labels = labels
+        self.seq = seq
+        self.all = (1 << len(ids)) - 1
+        self.built_at = time.time()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, price_key='MSRP', rating_edges=(3, 4, 4.5), price_edges=(5000, 10000, 15000), max_values=100):
+        """
+        Index brand, subcategory, rating and price bands, and every attribute key
+        with at most `max_values` distinct values (prices are banded, not listed)
+        """
+        seq = settled_seq()
+        rows = db.session.execute(
+            select(Product.id, Product.brand, SubCategory.name, AggregatedReview.overall_rating)
+            .outerjoin(SubCategory, SubCategory.id == Product.subcategory_id)
+            .outerjoin(AggregatedReview, AggregatedReview.product_id == Product.id)
+            .order_by(desc(AggregatedReview.overall_rating.is_(None)), desc(AggregatedReview.overall_rating),
+                      Product.name, Product.id)
+        ).all()
+        count = len(rows)
+        position = {row[0]: i for i, row in enumerate(rows)}
+        postings = {}  # facet -> value -> bytearray bitmap, converted to ints below
+
+        def add(facet, value, row):
+            bitmap = postings.setdefault(facet, {}).get(value)
+            if bitmap is None:
+                bitmap = postings[facet][value] = bytearray((count + 7) // 8)
+            bitmap[row >> 3] |= 1 << (row & 7)
+
+        rating_keys = band_keys(rating_edges)
+        for row, (_, brand, subcategory_name, rating) in enumerate(rows):
+            if brand:
+                add('brand', brand, row)
+            if subcategory_name:
+                add('subcategory', slugify(subcategory_name), row)
+            add('rating', UNRATED if rating is None else rating_keys[bisect_right(rating_edges, rating)], row)
+
+        price_keys = band_keys(price_edges)
+        attributes = {}
+        for product_id, key, value in db.session.execute(
+                select(ProductAttribute.product_id, ProductAttribute.key, ProductAttribute.value)):
+            row = position.get(product_id)
+            if row is None or value is None:
+                continue
+            if key == price_key:
+                try:
+                    add('price', price_keys[bisect_right(price_edges, float(value))], row)
+                except ValueError:
+                    pass
+            else:
+                attributes.setdefault(key, {}).setdefault(value, []).append(row)
+        for key, values in attributes.items():
+            if len(values) <= max_values:
+                for value, value_rows in values.items():
+                    for row in value_rows:
+                        add(ATTRIBUTE_PREFIX + key, value, row)
+
+        bitmaps = {
+            facet: {value: int.from_bytes(bitmap, 'little') for value, bitmap in values.items()}
+            for facet, values in postings.items()
+        }
+        bitmaps.setdefault('brand', {})
+        bitmaps.setdefault('subcategory', {})
+        bitmaps['rating'] = {key: bitmaps.get('rating', {}).get(key, 0) for key in rating_keys + [UNRATED]}
+        bitmaps['price'] = {key: bitmaps.get('price', {}).get(key, 0) for key in price_keys}
+        labels = {
+            'rating': dict(zip(rating_keys + [UNRATED], rating_band_labels(rating_edges) + ['Not yet rated'])),
+            'price': dict(zip(price_keys, price_bucket_labels(price_edges))),
+            'subcategory': {slugify(name): name for name in {row[2] for row in rows if row[2]}},
+        }
+        return cls(array('q', (row[0] for row in rows)), bitmaps, labels, seq)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls.build(price_key=config['FACET_PRICE_KEY'], rating_edges=tuple(config['FACET_RATING_EDGES']),
+                         price_edges=tuple(config['PRICE_BUCKET_EDGES']), max_values=config['FACET_MAX_VALUES'])
+
+    def validate(self, selections):
+        """Raise ValueError for unknown facets and band values"""
+        for facet, values in selections.items():
+            if facet not in self.bitmaps:
+                raise ValueError(f"Unknown facet '{facet}'; available: {', '.join(self.bitmaps)}")
+            if facet in BAND_FACETS:
+                unknown = [value for value in values if value not in self.bitmaps[facet]]
+                if unknown:
+                    raise ValueError(f"Unknown {facet} band '{unknown[0]}'; "
+                                     f"expected one of: {', '.join(self.bitmaps[facet])}")
+
+    def _facet_mask(self, facet, values):
+        bitmaps = self.bitmaps[facet]
+        mask = 0
+        for value in values:
+            mask |= bitmaps.get(value, 0)
+        return mask
+
+    def match(self, selections, exclude=None):
+        """Bitmap of the rows matching every selected facet (except `exclude`)"""
+        mask = self.all
+        for facet, values in selections.items():
+            if facet != exclude:
+                mask &= self._facet_mask(facet, values)
+        return mask
+
+    def counts(self, selections, facets=None, limit=None):
+        """
+        {facet: [{'value', 'label', 'count'}]} for the requested facets
+
+        Band facets list every band in order; the others list values with
+        matches by descending count, cut to `limit` but always keeping the
+        selected values.
+        """
+        result = {}
+        for facet in facets or self.bitmaps:
+            if facet not in self.bitmaps:
+                raise ValueError(f"Unknown facet '{facet}'; available: {', '.join(self.bitmaps)}")
+            base = self.match(selections, exclude=facet)
+            selected = set(selections.get(facet, ()))
+            labels = self.labels.get(facet, {})
+            values = [(value, (base & bitmap).bit_count()) for value, bitmap in self.bitmaps[facet].items()]
+            if facet not in BAND_FACETS:
+                values = sorted((item for item in values if item[1] or item[0] in selected),
+                                key=lambda item: (-item[1], str(item[0])))
+                if limit is not None and len(values) > limit:
+                    values = values[:limit] + [item for item in values[limit:] if item[0] in selected]
+            result[facet] = [
+                {'value': value, 'label': labels.get(value, value), 'count': count, 'selected': value in selected}
+                for value, count in values
+            ]
+        return result
+
+    def ids_in(self, mask, offset, limit):
+        """Product ids of the matching rows offset..offset+limit, in listing order"""
+        bits = bin(mask)[:1:-1]  # Row 0 first
+        if offset >= bits.count('1'):
+            return []
+        # Binary search for the first row after `offset` matches, then scan
+        low, high = 0, len(bits)
+        while low < high:
+            middle = (low + high) // 2
+            if bits.count('1', 0, middle) > offset:
+                high = middle
+            else:
+                low = middle + 1
+        ids, row = [], low - 1
+        while row >= 0 and len(ids) < limit:
+            ids.append(self.ids[row])
+            row = bits.find('1', row + 1)
+        return ids
+
+
+class FacetPagination(Pagination):
+    """Flask-SQLAlchemy pagination over a FacetIndex match, loading each page from `query` by id"""
+
+    def _query_items(self):
+        ids = self._query_args['index'].ids_in(self._query_args['mask'], self._query_offset, self.per_page)
+        if not ids:
+            return []
+        products = {product.id: product for product in self._query_args['query'].filter(Product.id.in_(ids))}
+        return [products[product_id] for product_id in ids if product_id in products]
+
+    def _query_count(self):
+        return self._query_args['mask'].bit_count()
+
+
+def parse_facet_args(args):
+    """
+    Facet selections from GET /api/products query arguments, or None without faceting
+
+    Faceting is on when `facets` is given or any of brand, rating, price or
+    attr.<key> is; `subcategory` then takes part as a facet. Every facet
+    argument may repeat (OR within a facet).
+    """
+    selections = {}
+    for facet in ('brand', 'rating', 'price'):
+        values = [value for value in args.getlist(facet) if value]
+        if values:
+            selections[facet] = values
+    for key in args:
+        if key.startswith(ATTRIBUTE_PREFIX) and len(key) > len(ATTRIBUTE_PREFIX):
+            values = [value for value in args.getlist(key) if value]
+            if values:
+                selections[key] = values
+    if not selections and 'facets' not in args:
+        return None
+    subcategories = [value for value in args.getlist('subcategory') if value]
+    if subcategories:
+        selections['subcategory'] = subcategories
+    return selections
+
+
+_index = None
+_index_checked_at = 0.0
+_index_rebuilt_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_facet_index(config):
+    """
+    The process-wide facet index, built on first use
+
+    At most every FACET_INDEX_REFRESH_SECONDS the change log head is
+    compared with the index; any new catalog change triggers a rebuild, as
+    does CATALOG_SNAPSHOT_REBUILD_SECONDS passing. Requests arriving during
+    a rebuild keep using the current index.
+    """
+    global _index, _index_checked_at, _index_rebuilt_at
+    now = time.monotonic()
+    if _index is not None and now - _index_checked_at < config['FACET_INDEX_REFRESH_SECONDS']:
+        return _index
+    if not _index_lock.acquire(blocking=_index is None):
+        return _index
+    try:
+        if _index is not None and now - _index_checked_at < config['FACET_INDEX_REFRESH_SECONDS']:
+            return _index
+        stale = (_index is None or now - _index_rebuilt_at >= config['CATALOG_SNAPSHOT_REBUILD_SECONDS']
+                 or (config['CHANGE_LOG_ENABLED'] and settled_seq(_index.seq) != _index.seq))
+        if stale:
+            _index = FacetIndex.from_config(config)
+            _index_rebuilt_at = now
+        _index_checked_at = now
+        return _index
+    finally:
+        _index_lock.release()
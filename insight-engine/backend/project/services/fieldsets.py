@@ -0,0 +1,118 @@
+import re
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased, contains_eager, joinedload, load_only, selectinload
+
+from project.models.models import Product, SubCategory, PriceHistory, AggregatedReview
+
+# Summary fields backed directly by a Product column
+COLUMN_FIELDS = frozenset(('name', 'brand', 'short_description', 'insight_snippet', 'image_url',
+                           'subcategory_id', 'created_at', 'updated_at'))
+# include= names and the [variant]s each accepts (None = the plain name)
+INCLUDE_VARIANTS = {
+    'attributes': (None,),
+    'aggregated_review': (None,),
+    'price_history': (None, 'latest'),
+}
+
+_INCLUDE_RE = re.compile(r'^(\w+)(?:\[(\w+)\])?$')
+
+
+class ProductFieldset:
+    """
+    Parsed `fields=` / `include=` parameters for product responses
+
+    Drives both halves of a sparse response: the loader options, so the
+    query fetches only the requested columns and relationships, and the
+    to_dict() arguments, so serialization never touches anything else.
+    """
+
+    def __init__(self, fields=Product.SUMMARY_FIELDS, include=None):
+        self.fields = tuple(fields)
+        self.include = dict(include or {})  # name -> variant (None or e.g. 'latest')
+
+    @classmethod
+    def parse(cls, fields_param=None, include_param=None, default_include=()):
+        """
+        Build a fieldset from raw query parameters; raises ValueError naming the bad value
+
+        An absent or empty `fields` means the full summary. An absent `include`
+        falls back to `default_include`, while an empty `include=` means none.
+        """
+        fields = Product.SUMMARY_FIELDS
+        if fields_param:
+            fields = [field.strip() for field in fields_param.split(',') if field.strip()]
+            unknown = [field for field in fields if field not in Product.SUMMARY_FIELDS]
+            if unknown:
+                raise ValueError(f"Unknown field(s): {', '.join(unknown)}. "
+                                 f"Available: {', '.join(Product.SUMMARY_FIELDS)}")
+            if 'id' not in fields:
+                fields.insert(0, 'id')
+
+        if include_param is None:
+            include = {name: None for name in default_include}
+        else:
+            include = {}
+            for token in (token.strip() for token in include_param.split(',')):
+                if not token:
+                    continue
+                match = _INCLUDE_RE.match(token)
+                if not match or match.group(1) not in INCLUDE_VARIANTS \
+                        or match.group(2) not in INCLUDE_VARIANTS[match.group(1)]:
+                    raise ValueError(f"Unknown include '{token}'. Available: attributes, "
+                                     f"aggregated_review, price_history, price_history[latest]")
+                include[match.group(1)] = match.group(2)
+        return cls(fields, include)
+
+    def to_dict_kwargs(self):
+        """Keyword arguments for Product.to_dict()"""
+        return {'fields': self.fields, 'include': tuple(self.include)}
+
+    def load_options(self, review_joined=False):
+        """
+        Loader options fetching only what this fieldset serializes
+
+        Pass `review_joined=True` when the query already outer-joins
+        AggregatedReview (e.g. to sort by rating) so that join is reused.
+        """
+        columns = [getattr(Product, field) for field in self.fields if field in COLUMN_FIELDS]
+        options = [load_only(*columns) if columns else load_only(Product.id)]
+
+        if 'category_name' in self.fields:
+            options.append(joinedload(Product.subcategory).joinedload(SubCategory.category))
+        elif 'subcategory_name' in self.fields:
+            options.append(joinedload(Product.subcategory))
+
+        review = contains_eager(Product.aggregated_review) if review_joined else joinedload(Product.aggregated_review)
+        if 'aggregated_review' in self.include:
+            options.append(review)
+        elif 'overall_rating' in self.fields:
+            options.append(review.load_only(AggregatedReview.overall_rating))
+
+        if 'attributes' in self.include:
+            options.append(selectinload(Product.attributes))
+        if 'price_history' in self.include:
+            if self.include['price_history'] == 'latest':
+                options.append(selectinload(Product.price_history.and_(is_latest_price(PriceHistory))))
+            else:
+                options.append(selectinload(Product.price_history))
+        return options
+
+
+def is_latest_price(price_history):
+    """
+    Criterion: the row is the most recent price its retailer recorded for its product
+
+    Picks the same rows as the row_number() window in comparison._latest_prices
+    (newest date, then highest id, per product and retailer), as a correlated
+    top-1 lookup, so it can filter a relationship load without ranking the
+    whole table; each lookup is served by the (product, retailer, date) key.
+    """
+    latest = aliased(PriceHistory)
+    return price_history.id == (
+        select(latest.id)
+        .where(latest.product_id == price_history.product_id, latest.retailer_name == price_history.retailer_name)
+        .order_by(latest.date_recorded.desc(), latest.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
@@ -0,0 +1,153 @@
+from sqlalchemy import Float, and_, cast, case, func, literal, not_, select, true, union_all
+
+from project import db
+from project.models.models import Product, ProductAttribute, AggregatedReview
+
+DEFAULT_PRICE_BUCKET_EDGES = (5000, 10000, 15000)
+# Attribute values read as prices: plain decimals such as '1299' or '1299.99'
+NUMERIC_PATTERN = r'^[0-9]+(\.[0-9]+)?$'
+# Group names of attribute breakdowns, apart from the built-in 'brand' and 'price_range'
+ATTRIBUTE_GROUP_PREFIX = 'attr:'
+
+
+def parse_bucket_edges(raw, default=DEFAULT_PRICE_BUCKET_EDGES):
+    """Parse a comma-separated list of bucket edges ('5000,10000') into sorted numbers"""
+    if not raw:
+        return tuple(default)
+    edges = sorted({float(part) for part in str(raw).split(',') if part.strip()})
+    if not edges:
+        raise ValueError('At least one bucket edge is required')
+    return tuple(int(edge) if edge.is_integer() else edge for edge in edges)
+
+
+def price_bucket_labels(edges):
+    """Human-readable labels for the ranges delimited by `edges`"""
+    labels = [f'Under ${edges[0]:,}']
+    for low, high in zip(edges, edges[1:]):
+        labels.append(f'${low:,} - ${high:,}')
+    labels.append(f'Over ${edges[-1]:,}')
+    return labels
+
+
+def numeric_value(column):
+    """
+    `column` cast to a float where it holds a plain decimal number, else NULL
+
+    PostgreSQL raises on casting text such as 'n/a', and SQLite reads it as
+    0, so the value is matched before the cast: with GLOB on SQLite, where
+    a regular expression would call back into Python for every row.
+    """
+    if db.session.get_bind().dialect.name == 'sqlite':
+        glob = column.op('GLOB')
+        is_numeric = and_(glob('[0-9]*'), not_(glob('*[^0-9.]*')), not_(glob('*.*.*')), not_(glob('*.')))
+    else:
+        is_numeric = column.regexp_match(NUMERIC_PATTERN)
+    return case((is_numeric, cast(column, Float)))
+
+
+def price_bucket_case(column, edges):
+    """CASE expression mapping a numeric column onto the labelled price ranges"""
+    labels = price_bucket_labels(edges)
+    return case(
+        *[(column < edge, labels[i]) for i, edge in enumerate(edges)],
+        else_=labels[-1]
+    )
+
+
+def count_by(group_name, value_expr, *criteria, select_from=None, joins=()):
+    """Build a (group, value, count) SELECT grouped on `value_expr`"""
+    stmt = select(
+        literal(group_name).label('grp'),
+        value_expr.label('value'),
+        func.count().label('count')
+    )
+    if select_from is not None:
+        stmt = stmt.select_from(select_from)
+    for target, onclause in joins:
+        stmt = stmt.join(target, onclause)
+    return stmt.where(value_expr.is_not(None), *criteria).group_by(value_expr)
+
+
+def grouped_counts(*statements):
+    """
+    Run several count_by() statements as one UNION ALL round-trip
+
+    Returns {group: {value: count}} with values ordered by descending count.
+    """
+    result = {}
+    rows = db.session.execute(union_all(*statements)).all()
+    for group, value, count in rows:
+        result.setdefault(group, {})[value] = count
+    return {
+        group: dict(sorted(values.items(), key=lambda item: (-item[1], str(item[0]))))
+        for group, values in result.items()
+    }
+
+
+def vertical_insights(subcategory_id=None, price_key='MSRP', bucket_edges=DEFAULT_PRICE_BUCKET_EDGES,
+                      breakdown_keys=(), snippet_limit=10):
+    """
+    Aggregate statistics for one subcategory (or the whole catalog) using SQL aggregates
+
+    One round-trip computes counts and averages, a second computes the brand,
+    price-range and attribute breakdowns, so memory use does not grow with the
+    number of products.
+    """
+    product_filter = Product.subcategory_id == subcategory_id if subcategory_id else true()
+    product_ids = select(Product.id).where(product_filter)
+    price_value = numeric_value(ProductAttribute.value)
+
+    average_price = (
+        select(func.avg(price_value))
+        .where(ProductAttribute.key == price_key, ProductAttribute.product_id.in_(product_ids))
+        .scalar_subquery()
+    )
+    total, reviewed, average_rating, average_price = db.session.execute(
+        select(
+            func.count(Product.id),
+            func.count(AggregatedReview.overall_rating),
+            func.avg(AggregatedReview.overall_rating),
+            average_price
+        )
+        .select_from(Product)
+        .outerjoin(AggregatedReview, AggregatedReview.product_id == Product.id)
+        .where(product_filter)
+    ).one()
+
+    attribute_join = [(Product, Product.id == ProductAttribute.product_id)]
+    statements = [
+        count_by('brand', Product.brand, product_filter, select_from=Product),
+        count_by('price_range', price_bucket_case(price_value, bucket_edges),
+                 ProductAttribute.key == price_key, price_value.is_not(None), product_filter,
+                 select_from=ProductAttribute, joins=attribute_join),
+    ]
+    for key in breakdown_keys:
+        # Prefixed, so a 'brand' or 'price_range' attribute does not merge into the built-in groups
+        statements.append(count_by(ATTRIBUTE_GROUP_PREFIX + key, ProductAttribute.value, ProductAttribute.key == key,
+                                   product_filter, select_from=ProductAttribute, joins=attribute_join))
+    breakdowns = grouped_counts(*statements)
+
+    common_insights = []
+    if snippet_limit:
+        common_insights = db.session.execute(
+            select(Product.insight_snippet)
+            .outerjoin(AggregatedReview, AggregatedReview.product_id == Product.id)
+            .where(product_filter, Product.insight_snippet.is_not(None))
+            .order_by(AggregatedReview.overall_rating.is_(None), AggregatedReview.overall_rating.desc(), Product.id)
+            .limit(snippet_limit)
+        ).scalars().all()
+
+    return {
+        'total_products': total,
+        'products_with_reviews': reviewed,
+        'average_rating': round(average_rating, 2) if average_rating is not None else 0,
+        'brand_breakdown': breakdowns.get('brand', {}),
+        'attribute_breakdown': {key: breakdowns.get(ATTRIBUTE_GROUP_PREFIX + key, {}) for key in breakdown_keys},
+        'price_range_analysis': {
+            'price_key': price_key,
+            'bucket_edges': list(bucket_edges),
+            'average_price': round(average_price, 2) if average_price is not None else 0,
+            'price_ranges': breakdowns.get('price_range', {})
+        },
+        'common_insights': common_insights
+    }
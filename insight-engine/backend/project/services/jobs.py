@@ -0,0 +1,485 @@
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, case, func, or_, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from project import db
+from project.models.models import Job
+from project.monitoring import metrics
+
+logger = logging.getLogger(__name__)
+
+# kind -> callable(job, reporter) returning a JSON-serializable result
+JOB_HANDLERS = {}
+# kind -> queue its jobs are enqueued on
+JOB_QUEUES = {}
+# Due jobs read per claim round, per free thread; the surplus absorbs lost claim races
+CLAIM_OVERSCAN = 4
+
+
+def job_handler(kind, queue='default'):
+    """Register the function that runs jobs of `kind`, queued on `queue` by default"""
+    def register(fn):
+        JOB_HANDLERS[kind] = fn
+        JOB_QUEUES[kind] = queue
+        return fn
+    return register
+
+
+class JobEventBroker:
+    """
+    Fan-out of job progress events to any number of subscribers
+
+    A job publishes each event once into a shared per-job history; every
+    subscriber reads from its own cursor into that history. Publishing costs
+    the same whatever the audience, and late or reconnecting subscribers
+    replay what they missed. Histories of finished jobs expire after `ttl`.
+    """
+
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self._condition = threading.Condition()
+        self._history = {}   # job_id -> [(event, data)]
+        self._finished = {}  # job_id -> monotonic finish time
+
+    def publish(self, job_id, event, data, final=False):
+        with self._condition:
+            self._history.setdefault(job_id, []).append((event, data))
+            if final:
+                self._finished[job_id] = time.monotonic()
+            self._expire()
+            self._condition.notify_all()
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for job_id in [job_id for job_id, finished in self._finished.items() if finished < cutoff]:
+            self._history.pop(job_id, None)
+            self._finished.pop(job_id, None)
+
+    def __contains__(self, job_id):
+        with self._condition:
+            return job_id in self._history
+
+    def read(self, job_id, after, timeout):
+        """
+        Events numbered above `after` (1-based), waiting up to `timeout` for one
+
+        Returns ([(event_id, event, data)], finished).
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: len(self._history.get(job_id, ())) > after or job_id in self._finished, timeout
+            )
+            history = self._history.get(job_id, [])
+            events = [(index + 1, event, data) for index, (event, data) in enumerate(history[after:], after)]
+            return events, job_id in self._finished
+
+    def last_event(self, job_id):
+        """Name of the newest event in a job's history, or None"""
+        with self._condition:
+            history = self._history.get(job_id)
+            return history[-1][0] if history else None
+
+
+job_events = JobEventBroker()
+_local_worker = None
+_local_worker_lock = threading.Lock()
+
+
+class JobReporter:
+    """
+    Progress callback handed to job handlers
+
+    Every call is published to subscribers immediately; the job row, which
+    other processes poll, is written on stage changes and at most once per
+    `persist_seconds` otherwise.
+    """
+
+    def __init__(self, job, persist_seconds=1.0):
+        self.job = job
+        self.persist_seconds = persist_seconds
+        self.progress = {}
+        self._persisted_at = 0.0
+
+    def __call__(self, stage, **counters):
+        stage_changed = stage != self.job.stage
+        self.progress.update(counters)
+        self.job.stage = stage
+        self.job.progress = json.dumps(self.progress)
+        job_events.publish(self.job.id, 'progress', {'status': self.job.status, 'stage': stage,
+                                                     'progress': dict(self.progress)})
+        if stage_changed or time.monotonic() - self._persisted_at >= self.persist_seconds:
+            db.session.commit()
+            self._persisted_at = time.monotonic()
+
+
+def find_active_job(kind, product_id, stale_seconds):
+    """A queued or running job for the same work, ignoring runs abandoned by a crashed worker"""
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_seconds)
+    return Job.query.filter(
+        Job.kind == kind, Job.product_id == product_id,
+        or_(Job.status == 'queued', and_(Job.status == 'running', Job.updated_at >= cutoff))
+    ).order_by(Job.created_at.desc()).first()
+
+
+def enqueue_job(kind, product_id=None, payload=None, queue=None, idempotency_key=None):
+    """
+    Record a job on its queue; returns (job, created)
+
+    With an `idempotency_key`, the job first enqueued under that key is
+    returned instead, whatever its status; without one, an active job for
+    the same kind and product is. A worker in this process (JOB_IN_PROCESS)
+    is woken to claim it at once; others find it on their next poll.
+    """
+    config = current_app.config
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'; known: {', '.join(sorted(JOB_HANDLERS))}")
+    if idempotency_key is not None:
+        job = Job.query.filter_by(idempotency_key=idempotency_key).first()
+    else:
+        job = find_active_job(kind, product_id, config['JOB_STALE_SECONDS'])
+    if job is not None:
+        return job, False
+
+    job = Job(id=uuid.uuid4().hex, kind=kind, product_id=product_id, queue=queue or JOB_QUEUES[kind],
+              payload=json.dumps(payload) if payload is not None else None, idempotency_key=idempotency_key,
+              status='queued', max_attempts=config['JOB_MAX_ATTEMPTS'], run_after=datetime.utcnow())
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        if idempotency_key is None:
+            raise
+        return Job.query.filter_by(idempotency_key=idempotency_key).one(), False  # Lost a race for the key
+
+    metrics.inc('jobs_enqueued_total', {'kind': kind, 'queue': job.queue})
+    if _local_worker is not None:
+        _local_worker.wake()
+    return job, True
+
+
+def _lock_queue(queue):
+    """
+    Serialize claims on a concurrency-limited queue until the transaction ends
+
+    Under READ COMMITTED two workers could both count the queue below its
+    limit and both claim, so PostgreSQL claims take a transaction-scoped
+    advisory lock per queue first. SQLite needs none: the claim UPDATE
+    holds the database write lock while its count subquery runs.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'),
+                           {'key': zlib.crc32(f'jobs_queue:{queue}'.encode('utf-8'))})
+
+
+def claim_jobs(worker_id, queues, limit, config):
+    """
+    Mark up to `limit` due queued jobs as running on `worker_id`; returns their ids
+
+    Every claim is a conditional UPDATE (still queued, and its queue under
+    the JOB_QUEUE_CONCURRENCY limit) committed on its own, so any number of
+    workers can poll the same table without running a job twice or going
+    over a queue's limit.
+    """
+    now = datetime.utcnow()
+    due = select(Job.id, Job.queue).where(Job.status == 'queued', Job.run_after <= now)
+    if queues:
+        due = due.where(Job.queue.in_(queues))
+    candidates = db.session.execute(
+        due.order_by(Job.run_after, Job.created_at).limit(limit * CLAIM_OVERSCAN)
+    ).all()
+
+    cutoff = now - timedelta(seconds=config['JOB_STALE_SECONDS'])
+    limits = config['JOB_QUEUE_CONCURRENCY']
+    running = Job.__table__.alias('running')
+    claimed = []
+    for job_id, queue in candidates:
+        if len(claimed) >= limit:
+            break
+        claim = (
+            update(Job)
+            .where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', worker=worker_id, attempts=Job.attempts + 1, started_at=now, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        if queue in limits:
+            _lock_queue(queue)
+            claim = claim.where(
+                select(func.count()).select_from(running)
+                .where(running.c.queue == queue, running.c.status == 'running', running.c.updated_at >= cutoff)
+                .scalar_subquery() < limits[queue]
+            )
+        won = db.session.execute(claim).rowcount
+        db.session.commit()
+        if won:
+            claimed.append(job_id)
+    db.session.rollback()  # End the read transaction so the next poll sees new jobs
+    return claimed
+
+
+def touch_jobs(job_ids):
+    """Heartbeat: keep running jobs from being taken for abandoned"""
+    db.session.execute(
+        update(Job).where(Job.id.in_(job_ids), Job.status == 'running')
+        .values(updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def requeue_stale_jobs(stale_seconds):
+    """Queue again (or fail, out of attempts) running jobs whose worker stopped heartbeating"""
+    now = datetime.utcnow()
+    retry = Job.attempts < Job.max_attempts
+    stale = (
+        update(Job)
+        .where(Job.status == 'running', Job.updated_at < now - timedelta(seconds=stale_seconds))
+        .values(status=case((retry, 'queued'), else_='failed'), run_after=now, error='Worker stopped responding',
+                finished_at=case((retry, Job.finished_at), else_=now))
+        .execution_options(synchronize_session=False)
+    )
+    count = db.session.execute(stale).rowcount
+    db.session.commit()
+    if count:
+        logger.warning(f'Requeued {count} jobs abandoned by their worker')
+        metrics.inc('jobs_abandoned_total', value=count)
+    return count
+
+
+def retry_delay(attempts, config):
+    """Seconds before retry number `attempts`: doubling from JOB_RETRY_BACKOFF_SECONDS, capped, with jitter"""
+    delay = min(config['JOB_RETRY_BACKOFF_SECONDS'] * 2 ** (attempts - 1), config['JOB_RETRY_MAX_SECONDS'])
+    return delay * random.uniform(0.5, 1.0)  # Jitter spreads retries of jobs that failed together
+
+
+def run_job(app, job_id):
+    """Execute a claimed job in its own app context, recording the outcome or the next retry on the job row"""
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        if job is None or job.status != 'running':
+            return  # Requeued as abandoned before this worker got to it
+        started = time.monotonic()
+        job_events.publish(job_id, 'progress', {'status': 'running', 'stage': job.stage, 'progress': {}})
+        reporter = JobReporter(job, app.config['JOB_PERSIST_SECONDS'])
+        final = None
+        try:
+            result = JOB_HANDLERS[job.kind](job, reporter)
+        except Exception as e:
+            db.session.rollback()
+            job.error = str(e)
+            if job.attempts < job.max_attempts:
+                job.status = 'queued'
+                job.run_after = datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts, app.config))
+                logger.warning(f"Job {job_id} ({job.kind}) failed on attempt {job.attempts} of "
+                               f"{job.max_attempts}, retrying at {job.run_after.isoformat()}: {job.error}")
+            else:
+                logger.exception(f"Job {job_id} ({job.kind}) failed")
+                job.status = 'failed'
+                final = {'status': 'failed', 'stage': job.stage, 'error': job.error}
+        else:
+            job.status = 'succeeded'
+            job.result = json.dumps(result)
+            job.error = None
+            final = {'status': 'succeeded', 'stage': job.stage, 'result': result}
+        if final is not None:
+            job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+        metrics.inc('jobs_total', {'kind': job.kind, 'status': job.status if final else 'retried'})
+        metrics.inc('job_seconds_total', {'kind': job.kind}, time.monotonic() - started)
+        if final is None:
+            # Ends this process's event history: the retry may run in any worker, so
+            # subscribers carry on polling the job row
+            job_events.publish(job_id, 'progress', {'status': 'queued', 'stage': job.stage,
+                                                    'progress': dict(reporter.progress), 'error': job.error},
+                               final=True)
+        else:
+            job_events.publish(job_id, job.status, final, final=True)
+
+
+class Worker:
+    """
+    Runs jobs from the database queue on a thread pool; no broker involved
+
+    Used by `flask worker` and, with JOB_IN_PROCESS, from a daemon thread in
+    each API process. Every round claims as many due jobs as there are idle
+    threads, then sleeps JOB_WORKER_POLL_SECONDS or until woken by a new
+    job or a finished one. Every third of JOB_STALE_SECONDS it heartbeats
+    its running jobs and requeues those other workers abandoned.
+    """
+
+    def __init__(self, app, threads=None, queues=None):
+        self.app = app
+        self.threads = threads or app.config['JOB_WORKERS']
+        self.queues = list(queues or ())
+        self.id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='job')
+        self._running = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self):
+        """Stop claiming jobs; run() returns once the running ones finish"""
+        self._stopping.set()
+        self._wakeup.set()
+
+    def run(self):
+        config = self.app.config
+        checked_at = 0.0
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            claimed = []
+            try:
+                with self.app.app_context():
+                    if time.monotonic() - checked_at >= config['JOB_STALE_SECONDS'] / 3:
+                        with self._lock:
+                            running = list(self._running)
+                        if running:
+                            touch_jobs(running)
+                        requeue_stale_jobs(config['JOB_STALE_SECONDS'])
+                        checked_at = time.monotonic()
+                    with self._lock:
+                        idle = self.threads - len(self._running)
+                    if idle > 0:
+                        claimed = claim_jobs(self.id, self.queues, idle, config)
+            except Exception as e:
+                logger.error(f"Job worker {self.id} failed to poll the queue: {str(e)}")
+            for job_id in claimed:
+                with self._lock:
+                    self._running.add(job_id)
+                self._executor.submit(self._run, job_id)
+            self._wakeup.wait(config['JOB_WORKER_POLL_SECONDS'])
+        self._executor.shutdown(wait=True)
+
+    def _run(self, job_id):
+        try:
+            run_job(self.app, job_id)
+        except Exception as e:
+            logger.error(f"Job {job_id} could not be run: {str(e)}")
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+            self._wakeup.set()
+
+
+def start_local_worker(app):
+    """This process's worker for JOB_IN_PROCESS, started on first use"""
+    global _local_worker
+    with _local_worker_lock:
+        if _local_worker is None:
+            _local_worker = Worker(app)
+            threading.Thread(target=_local_worker.run, name='job-worker', daemon=True).start()
+        return _local_worker
+
+
+def _job_count_gauge(app, status):
+    def count():
+        with app.app_context():
+            return db.session.execute(select(func.count()).select_from(Job).where(Job.status == status)).scalar()
+    return count
+
+
+def init_jobs(app):
+    """Expose queue depth on /metrics and, with JOB_IN_PROCESS, run queued jobs in this process"""
+    metrics.register_gauge('jobs_queued', _job_count_gauge(app, 'queued'))
+    metrics.register_gauge('jobs_running', _job_count_gauge(app, 'running'))
+
+    if app.config['JOB_IN_PROCESS']:
+        @app.before_request
+        def _start_local_worker():
+            # Picks up retries and jobs left queued by a restart without waiting for a new enqueue
+            if _local_worker is None:
+                start_local_worker(app)
+
+
+def _serve_metrics(port):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='worker-metrics', daemon=True).start()
+
+
+def _serve_worker(app, threads, queues, metrics_port):
+    import signal
+
+    worker = Worker(app, threads, queues)
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+    if metrics_port:
+        _serve_metrics(metrics_port)
+    logger.info(f"Job worker {worker.id} started with {worker.threads} threads on "
+                f"{', '.join(worker.queues) or 'all queues'}")
+    worker.run()
+    logger.info(f'Job worker {worker.id} stopped')
+
+
+def _forked_worker(app, threads, queues, metrics_port):
+    # Connections and the log writer thread do not survive fork()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    listener = app.extensions.get('log_listener')
+    if listener is not None:
+        listener.start()
+    _serve_worker(app, threads, queues, metrics_port)
+
+
+def run_workers(app, threads=None, processes=1, queues=None, metrics_port=None):
+    """
+    Run job workers until SIGINT or SIGTERM, letting running jobs finish
+
+    With `processes` > 1 the workers are forked children of this process,
+    each with `threads` threads (and metrics on `metrics_port` + its index).
+    """
+    if processes <= 1:
+        _serve_worker(app, threads, queues, metrics_port)
+        return
+
+    import multiprocessing
+    import signal
+
+    context = multiprocessing.get_context('fork')
+    children = [
+        context.Process(target=_forked_worker, name=f'job-worker-{i}',
+                        args=(app, threads, queues, metrics_port + i if metrics_port else None))
+        for i in range(processes)
+    ]
+    for child in children:
+        child.start()
+
+    def stop(signum, frame):
+        for child in children:
+            if child.is_alive():
+                child.terminate()  # SIGTERM: each child finishes its running jobs
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, lambda signum, frame: None)  # The terminal signals the children directly
+    for child in children:
+        child.join()
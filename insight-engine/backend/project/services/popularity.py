@@ -0,0 +1,176 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import update
+
+from project import db
+from project.models.models import JobCheckpoint, ProductPopularity, TrendingEpoch
+from project.monitoring import metrics
+from project.services.upserts import upsert_insert
+
+logger = logging.getLogger(__name__)
+
+EVENT_KINDS = ('views', 'clicks', 'impressions')
+# Checkpoint the epoch was kept in before it had a table; read once to carry it over
+LEGACY_EPOCH_CHECKPOINT = 'trending_epoch'
+# Scores are rescaled onto a new epoch once new events weigh 2**REBASE_HALF_LIVES
+# times more than at the old one, long before floats lose range
+REBASE_HALF_LIVES = 64
+FLUSH_CHUNK_SIZE = 500
+
+
+def trending_epoch(half_life):
+    """
+    Unix time the stored trending scores are scaled to
+
+    Moved forward, with every score rescaled in the same transaction, once
+    it is REBASE_HALF_LIVES half-lives old. The move is a compare-and-set on
+    the epoch row, so concurrent flushers rescale only once.
+    """
+    now = int(time.time())
+    row = db.session.get(TrendingEpoch, 1)
+    if row is None:
+        legacy = db.session.get(JobCheckpoint, LEGACY_EPOCH_CHECKPOINT)
+        statement = upsert_insert(TrendingEpoch.__table__).values(id=1, epoch=legacy.last_id if legacy else now)
+        db.session.execute(statement.on_conflict_do_nothing())
+        row = db.session.get(TrendingEpoch, 1)
+    epoch = row.epoch
+    if now - epoch < REBASE_HALF_LIVES * half_life:
+        return epoch
+    moved = db.session.execute(
+        update(TrendingEpoch)
+        .where(TrendingEpoch.id == 1, TrendingEpoch.epoch == epoch)
+        .values(epoch=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if moved:
+        db.session.execute(
+            update(ProductPopularity)
+            .values(trending_score=ProductPopularity.trending_score * 2 ** ((epoch - now) / half_life))
+            .execution_options(synchronize_session=False)
+        )
+        return now
+    db.session.expire(row)  # Another process moved it first
+    return db.session.get(TrendingEpoch, 1).epoch
+
+
+class PopularityCounter:
+    """
+    In-memory tally of product engagement, flushed to product_popularity in batches
+
+    `record()` only updates a dict under a lock. A daemon thread, started on
+    first use in each process, adds the tallies to the stored counters with
+    one INSERT .. ON CONFLICT per chunk every POPULARITY_FLUSH_SECONDS, or
+    sooner once POPULARITY_MAX_PENDING products are waiting. An event adds
+    weight * 2^((t - epoch) / half-life) to the trending score: growing
+    with time instead of decaying in place keeps flushes purely additive,
+    so any number of processes can write without reading first.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # product_id -> [views, clicks, impressions, score since _base]
+        self._base = time.time()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._app = None
+
+    def record(self, kind, product_ids):
+        """Count one `kind` event ('views', 'clicks' or 'impressions') for each product"""
+        config = current_app.config
+        if not config['POPULARITY_ENABLED'] or not product_ids:
+            return
+        column = EVENT_KINDS.index(kind)
+        half_life = config['TRENDING_HALF_LIFE_HOURS'] * 3600
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._start(current_app._get_current_object())
+            boost = config['TRENDING_WEIGHTS'].get(kind, 0.0) * 2 ** ((time.time() - self._base) / half_life)
+            for product_id in product_ids:
+                counts = self._pending.get(product_id)
+                if counts is None:
+                    counts = self._pending[product_id] = [0, 0, 0, 0.0]
+                counts[column] += 1
+                counts[3] += boost
+            if len(self._pending) >= config['POPULARITY_MAX_PENDING']:
+                self._wakeup.set()
+
+    def _start(self, app):
+        self._app = app
+        self._thread = threading.Thread(target=self._run, name='insight-popularity', daemon=True)
+        self._thread.start()
+        atexit.register(self._flush_at_exit)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self._app.config['POPULARITY_FLUSH_SECONDS'])
+            self._wakeup.clear()
+            try:
+                with self._app.app_context():
+                    self.flush()
+            except Exception as e:
+                logger.error(f"Popularity flush failed: {str(e)}")
+
+    def _flush_at_exit(self):
+        try:
+            with self._app.app_context():
+                self.flush()
+        except Exception as e:
+            logger.error(f"Popularity flush at exit failed: {str(e)}")
+
+    def flush(self):
+        """Write everything recorded so far; returns the number of products written"""
+        with self._lock:
+            pending, base = self._pending, self._base
+            self._pending, self._base = {}, time.time()
+        if not pending:
+            return 0
+
+        half_life = current_app.config['TRENDING_HALF_LIFE_HOURS'] * 3600
+        try:
+            scale = 2 ** ((base - trending_epoch(half_life)) / half_life)
+            now = datetime.utcnow()
+            rows = [
+                {'product_id': product_id, 'views': views, 'clicks': clicks, 'impressions': impressions,
+                 'trending_score': score * scale, 'last_seen_at': now, 'updated_at': now}
+                for product_id, (views, clicks, impressions, score) in pending.items()
+            ]
+            table = ProductPopularity.__table__
+            stmt = upsert_insert(table)
+            stmt = stmt.on_conflict_do_update(index_elements=[table.c.product_id], set_={
+                'views': table.c.views + stmt.excluded.views,
+                'clicks': table.c.clicks + stmt.excluded.clicks,
+                'impressions': table.c.impressions + stmt.excluded.impressions,
+                'trending_score': table.c.trending_score + stmt.excluded.trending_score,
+                'last_seen_at': stmt.excluded.last_seen_at,
+                'updated_at': stmt.excluded.updated_at,
+            })
+            for start in range(0, len(rows), FLUSH_CHUNK_SIZE):
+                db.session.execute(stmt, rows[start:start + FLUSH_CHUNK_SIZE])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._restore(pending, base, half_life)
+            raise
+
+        for column, kind in enumerate(EVENT_KINDS):
+            metrics.inc('popularity_events_total', {'kind': kind}, sum(counts[column] for counts in pending.values()))
+        return len(rows)
+
+    def _restore(self, pending, base, half_life):
+        """Put a failed batch back, so the next flush retries it"""
+        with self._lock:
+            rescale = 2 ** ((base - self._base) / half_life)
+            for product_id, (views, clicks, impressions, score) in pending.items():
+                counts = self._pending.setdefault(product_id, [0, 0, 0, 0.0])
+                counts[0] += views
+                counts[1] += clicks
+                counts[2] += impressions
+                counts[3] += score * rescale
+
+
+popularity = PopularityCounter()
@@ -0,0 +1,222 @@
+import json
+import logging
+
+from flask import current_app
+from sqlalchemy import select
+
+from project import db
+from project.models.models import PriceHistory, PriceStat, PriceAlert, JobCheckpoint, ChangeEvent
+from project.monitoring import metrics
+from project.services.changes import settled_high_water, settled_seq
+from project.services.jobs import job_handler
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'price_alerts'
+# Change log sequence number up to which price updates have been consumed
+UPDATES_CHECKPOINT_NAME = 'price_alerts_updates'
+JOB_KIND = 'price_alerts_detect'
+
+
+class PriceAlertDetector:
+    """
+    Streaming detector over new and repriced PriceHistory rows
+
+    Rows are consumed in id order past a stored high-water mark, so each run
+    only touches the delta. The mark never passes a missing id until the rows
+    after it are `settle_seconds` old, so a row whose transaction commits
+    after a higher-numbered one is not skipped. An upsert that reprices a
+    stored row keeps its id, so `price` updates of rows already consumed are
+    read from the change log, past a second mark. Per-(product, retailer) state
+    is an exponentially weighted mean/variance in `price_stats`; each new
+    price is compared with the state *before* it is folded in:
+
+    - drop:  price fell at least `drop_pct` below the previous observation,
+             or sits `zscore` standard deviations below the rolling mean
+    - spike: price sits `zscore` standard deviations above the rolling mean
+
+    A backfilled row, recorded before the latest observation, is history
+    rather than a price move: it only lowers `min_price`.
+
+    Stats, alerts and the checkpoint are committed together per batch, so a
+    crash never double-counts or skips rows.
+    """
+
+    def __init__(self, drop_pct=0.1, zscore=3.0, min_observations=3, half_life=14, batch_size=1000,
+                 settle_seconds=30):
+        self.drop_pct = drop_pct
+        self.zscore = zscore
+        self.min_observations = min_observations
+        self.alpha = 1 - 0.5 ** (1.0 / half_life)
+        self.batch_size = batch_size
+        self.settle_seconds = settle_seconds
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            drop_pct=config['PRICE_ALERT_DROP_PCT'],
+            zscore=config['PRICE_ALERT_ZSCORE'],
+            min_observations=config['PRICE_ALERT_MIN_OBSERVATIONS'],
+            half_life=config['PRICE_ALERT_HALF_LIFE'],
+            batch_size=config['PRICE_ALERT_BATCH_SIZE'],
+            settle_seconds=config['PRICE_ALERT_SETTLE_SECONDS']
+        )
+
+    def _checkpoint(self, name, start=0):
+        checkpoint = db.session.get(JobCheckpoint, name)
+        if checkpoint is None:
+            checkpoint = JobCheckpoint(name=name, last_id=start() if callable(start) else start)
+            db.session.add(checkpoint)
+        return checkpoint
+
+    def _repriced_rows(self, checkpoint, last_id):
+        """
+        Rows up to id `last_id` whose price was updated after change `checkpoint`
+
+        Returns (events read, rows) and moves the checkpoint past the events;
+        a row repriced several times in one batch is folded in once.
+        """
+        head = settled_seq(checkpoint.last_id)
+        events = db.session.execute(
+            select(ChangeEvent.seq, ChangeEvent.entity_id, ChangeEvent.fields)
+            .where(ChangeEvent.seq > checkpoint.last_id, ChangeEvent.seq <= head,
+                   ChangeEvent.entity == PriceHistory.__tablename__, ChangeEvent.op == 'update')
+            .order_by(ChangeEvent.seq)
+            .limit(self.batch_size)
+        ).all()
+        if not events:
+            return 0, []
+        checkpoint.last_id = events[-1].seq
+        # Rows past the insert mark are read with their current price once it gets there
+        ids = list(dict.fromkeys(
+            event.entity_id for event in events
+            if event.entity_id <= last_id and 'price' in (event.fields or '').split(',')
+        ))
+        if not ids:
+            return len(events), []
+        rows = {row.id: row for row in db.session.execute(
+            select(PriceHistory.id, PriceHistory.product_id, PriceHistory.retailer_name,
+                   PriceHistory.price, PriceHistory.date_recorded)
+            .where(PriceHistory.id.in_(ids))
+        )}
+        return len(events), [rows[row_id] for row_id in ids if row_id in rows]
+
+    def observe(self, stat, row):
+        """Fold one price row into `stat`; returns alert fields when the price is significant"""
+        if stat.last_date is not None and row.date_recorded < stat.last_date:
+            stat.min_price = min(stat.min_price, row.price)
+            return None
+
+        alert = None
+        if stat.observations >= self.min_observations:
+            std = stat.variance ** 0.5
+            z = (row.price - stat.mean_price) / std if std > 0 else 0.0
+            change = (row.price - stat.last_price) / stat.last_price if stat.last_price else 0.0
+            kind = None
+            if change <= -self.drop_pct or z <= -self.zscore:
+                kind = 'drop'
+            elif z >= self.zscore:
+                kind = 'spike'
+            if kind:
+                alert = {
+                    'kind': kind,
+                    'previous_price': stat.last_price,
+                    'baseline_price': round(stat.mean_price, 2),
+                    'change_pct': round(change * 100, 2),
+                    'zscore': round(z, 3)
+                }
+
+        # Exponentially weighted mean/variance (West's incremental form)
+        delta = row.price - stat.mean_price
+        stat.mean_price += self.alpha * delta
+        stat.variance = (1 - self.alpha) * (stat.variance + self.alpha * delta * delta)
+        stat.observations += 1
+        stat.last_price = row.price
+        stat.min_price = min(stat.min_price, row.price)
+        stat.last_date = row.date_recorded
+        return alert
+
+    def process_batch(self, emit_alerts=True):
+        """
+        Process up to `batch_size` unseen price rows and as many price updates
+
+        Returns (rows and update events processed, alerts created). Updates
+        made before the first run are history, so the update mark starts at
+        the change log's head.
+        """
+        checkpoint = self._checkpoint(CHECKPOINT_NAME)
+        updates_checkpoint = self._checkpoint(UPDATES_CHECKPOINT_NAME, settled_seq)
+        settled = settled_high_water(PriceHistory.id, PriceHistory.created_at, checkpoint.last_id,
+                                     self.settle_seconds)
+        rows = db.session.execute(
+            select(PriceHistory.id, PriceHistory.product_id, PriceHistory.retailer_name,
+                   PriceHistory.price, PriceHistory.date_recorded)
+            .where(PriceHistory.id > checkpoint.last_id, PriceHistory.id <= settled)
+            .order_by(PriceHistory.id)
+            .limit(self.batch_size)
+        ).all()
+        processed = len(rows)
+        if rows:
+            checkpoint.last_id = rows[-1].id
+        events, repriced = self._repriced_rows(updates_checkpoint, checkpoint.last_id)
+        processed += events
+        rows += repriced
+        if not processed:
+            db.session.commit()  # Keeps newly created marks
+            return 0, 0
+
+        # Load state for just the keys in this batch
+        product_ids = {row.product_id for row in rows}
+        stats = {
+            (stat.product_id, stat.retailer_name): stat
+            for stat in db.session.query(PriceStat).filter(PriceStat.product_id.in_(product_ids))
+        }
+
+        alerts = []
+        for row in rows:
+            key = (row.product_id, row.retailer_name)
+            stat = stats.get(key)
+            if stat is None:
+                stat = stats[key] = PriceStat(
+                    product_id=row.product_id, retailer_name=row.retailer_name, observations=1,
+                    mean_price=row.price, variance=0.0, last_price=row.price,
+                    min_price=row.price, last_date=row.date_recorded
+                )
+                db.session.add(stat)
+                continue
+            alert = self.observe(stat, row)
+            if alert and emit_alerts:
+                alerts.append(PriceAlert(
+                    product_id=row.product_id, price_history_id=row.id, retailer_name=row.retailer_name,
+                    price=row.price, date_recorded=row.date_recorded, **alert
+                ))
+
+        db.session.add_all(alerts)
+        db.session.commit()
+
+        for alert in alerts:
+            metrics.inc('price_alerts_total', {'kind': alert.kind})
+        return processed, len(alerts)
+
+    def run(self, emit_alerts=True, max_batches=None):
+        """Process batches until caught up (or `max_batches`); returns (rows processed, alerts created)"""
+        total_rows = total_alerts = batches = 0
+        while max_batches is None or batches < max_batches:
+            processed, created = self.process_batch(emit_alerts)
+            if not processed:
+                break
+            total_rows += processed
+            total_alerts += created
+            batches += 1
+        if total_rows:
+            logger.info('Price alert detector processed %d rows, created %d alerts', total_rows, total_alerts)
+        return total_rows, total_alerts
+
+
+@job_handler(JOB_KIND, queue='maintenance')
+def detect_price_alerts_job(job, report):
+    """Process new price rows as a queued job; payload {"backfill": true} builds statistics without alerting"""
+    options = json.loads(job.payload) if job.payload else {}
+    report('processing_rows')
+    rows, alerts = PriceAlertDetector.from_config(current_app.config).run(emit_alerts=not options.get('backfill'))
+    return {'rows': rows, 'alerts': alerts}
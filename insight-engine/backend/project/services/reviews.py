@@ -0,0 +1,106 @@
+import math
+from datetime import datetime
+
+from flask import current_app
+
+from project import db
+from project.models.models import Product, AggregatedReview
+from project.services.jobs import enqueue_job, job_handler
+
+JOB_KIND = 'review_refresh'
+
+# Subreddits searched per subcategory when REVIEW_REFRESH_SUBREDDITS is not set
+DEFAULT_SUBREDDITS = {
+    'AI Tools': ('artificial', 'MachineLearning', 'datascience', 'programming', 'technology',
+                 'startups', 'ChatGPT', 'OpenAI', 'AI', 'artificialintelligence'),
+    'Luxury Appliances': ('Appliances', 'BuyItForLife', 'HomeImprovement', 'Cooking', 'interiordesign'),
+}
+SUMMARY_POSTS = 3  # Post titles quoted in each sentiment summary
+
+
+def fetch_reddit_posts(query, subreddits, limit, config):
+    """Search `subreddits` for `query`; yields {'title', 'text', 'score', 'url'}"""
+    if not (config['REDDIT_CLIENT_ID'] and config['REDDIT_CLIENT_SECRET']):
+        raise RuntimeError('Reddit API credentials are not configured (see REDDIT_SETUP.md)')
+    import praw
+
+    reddit = praw.Reddit(client_id=config['REDDIT_CLIENT_ID'], client_secret=config['REDDIT_CLIENT_SECRET'],
+                         user_agent=config['REDDIT_USER_AGENT'], check_for_async=False)
+    results = reddit.subreddit('+'.join(subreddits)).search(f'"{query}"', sort='relevance', time_filter='year',
+                                                            limit=limit)
+    for submission in results:
+        yield {'title': submission.title, 'text': submission.selftext or '', 'score': submission.score,
+               'url': f'https://www.reddit.com{submission.permalink}'}
+
+
+def sentiment_polarity(post):
+    """TextBlob polarity of a post's title and body, in [-1, 1]"""
+    from textblob import TextBlob
+    return TextBlob(f"{post['title']}. {post['text']}").sentiment.polarity
+
+
+def aggregate_posts(posts):
+    """
+    Fold scored posts into AggregatedReview values
+
+    Polarity maps linearly onto the 1-5 rating scale; posts are weighted by
+    1 + log(1 + upvotes) so popular threads count more without drowning out
+    the rest.
+    """
+    weights = [1 + math.log1p(max(post['score'], 0)) for post in posts]
+    ratings = [3 + 2 * post['polarity'] for post in posts]
+    ranked = sorted(posts, key=lambda post: post['polarity'])
+    positive = [post['title'] for post in reversed(ranked) if post['polarity'] > 0][:SUMMARY_POSTS]
+    negative = [post['title'] for post in ranked if post['polarity'] < 0][:SUMMARY_POSTS]
+    return {
+        'overall_rating': round(sum(w * r for w, r in zip(weights, ratings)) / sum(weights), 1),
+        'positive_sentiment_summary': '; '.join(positive) or None,
+        'negative_sentiment_summary': '; '.join(negative) or None,
+        'total_reviews_analyzed': len(posts),
+    }
+
+
+@job_handler(JOB_KIND, queue='reviews')
+def refresh_product_reviews(job, report):
+    """
+    Rebuild a product's review aggregate from Reddit
+
+    Reports the stages fetching_posts (posts_fetched), scoring_reviews
+    (reviews_scored of posts_fetched) and updating_aggregate.
+    """
+    config = current_app.config
+    product = db.session.get(Product, job.product_id)
+    if product is None:
+        raise LookupError(f'No product found with ID {job.product_id}')
+    subcategory_name = product.subcategory.name if product.subcategory else None
+    subreddits = config['REVIEW_REFRESH_SUBREDDITS'] or DEFAULT_SUBREDDITS.get(subcategory_name, ('all',))
+    query = product.name if not product.brand or product.brand in product.name else f'{product.brand} {product.name}'
+
+    report('fetching_posts', posts_fetched=0)
+    posts = []
+    for post in fetch_reddit_posts(query, subreddits, config['REVIEW_REFRESH_POST_LIMIT'], config):
+        posts.append(post)
+        report('fetching_posts', posts_fetched=len(posts))
+
+    report('scoring_reviews', reviews_scored=0)
+    for scored, post in enumerate(posts, 1):
+        post['polarity'] = sentiment_polarity(post)
+        report('scoring_reviews', reviews_scored=scored)
+
+    report('updating_aggregate')
+    if not posts:
+        return {'posts_fetched': 0, 'updated': False}
+    values = aggregate_posts(posts)
+    review = product.aggregated_review
+    if review is None:
+        review = product.aggregated_review = AggregatedReview()
+    for column, value in values.items():
+        setattr(review, column, value)
+    review.last_updated = datetime.utcnow()
+    db.session.commit()
+    return dict(values, posts_fetched=len(posts), updated=True)
+
+
+def enqueue_review_refresh(product_id, idempotency_key=None):
+    """Start (or join) the review refresh of one product; returns (job, created)"""
+    return enqueue_job(JOB_KIND, product_id, idempotency_key=idempotency_key)
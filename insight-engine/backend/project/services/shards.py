@@ -0,0 +1,205 @@
+import heapq
+from itertools import islice
+
+from flask import current_app, g
+from flask_sqlalchemy.pagination import Pagination
+from flask_sqlalchemy.query import Query
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from project import db
+from project.models.models import Category, SubCategory, AggregatedReview, Product
+from project.services.facets import slugify
+
+# SQLALCHEMY_BINDS key of each configured shard (see config.py)
+BIND_PREFIX = 'shard_'
+
+
+class ShardRouter:
+    """
+    Maps categories, subcategories and product ids to the database holding them
+
+    Shards are numbered from 1 in CATALOG_SHARDS order, and shard k hands
+    out product ids from k * SHARD_ID_SPAN, so the detail endpoint can
+    route by id alone; the default database (DATABASE_URL) is shard 0.
+    A category or subcategory slug in CATALOG_SHARD_ROUTES lives on that
+    shard, a subcategory of a routed category too, and everything else on
+    the default database, which keeps the authoritative taxonomy.
+    """
+
+    def __init__(self, shards, routes, id_span):
+        self.shards = list(shards)
+        self.routes = dict(routes)
+        self.id_span = id_span
+        unknown = set(self.routes.values()) - set(self.shards)
+        if unknown:
+            raise ValueError(f"CATALOG_SHARD_ROUTES names unknown shards: {', '.join(sorted(unknown))}")
+        self._subcategory_binds = {}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls([name for name, _ in config['CATALOG_SHARDS']], config['CATALOG_SHARD_ROUTES'],
+                   config['SHARD_ID_SPAN'])
+
+    @property
+    def enabled(self):
+        return bool(self.shards)
+
+    def bind_keys(self):
+        """Every catalog database: None for the default one, then each shard's bind key"""
+        return [None] + [BIND_PREFIX + name for name in self.shards]
+
+    def id_start(self, name):
+        """First product id shard `name` hands out"""
+        return (self.shards.index(name) + 1) * self.id_span
+
+    def bind_for_id(self, product_id):
+        """Bind key of the database holding `product_id`; raises LookupError past the last shard"""
+        index = product_id // self.id_span
+        if index == 0:
+            return None
+        if index > len(self.shards):
+            raise LookupError(f'No shard holds product {product_id}')
+        return BIND_PREFIX + self.shards[index - 1]
+
+    def on_shard(self, product_id):
+        """Whether `product_id` lies outside the default database's id range"""
+        return self.enabled and product_id >= self.id_span
+
+    def subcategory_shards(self):
+        """{subcategory id: shard name} for every subcategory routed off the default database"""
+        if not self.enabled:
+            return {}
+        rows = db.session.execute(
+            select(SubCategory.id, SubCategory.name, Category.name)
+            .join(Category, SubCategory.category_id == Category.id)
+        )
+        shards = {}
+        for subcategory_id, subcategory_name, category_name in rows:
+            shard = self.routes.get(slugify(subcategory_name)) or self.routes.get(slugify(category_name))
+            if shard:
+                shards[subcategory_id] = shard
+        return shards
+
+    def bind_for_subcategory(self, subcategory_name):
+        """Bind key of the database holding `subcategory_name`'s products"""
+        if not self.enabled:
+            return None
+        if subcategory_name in self._subcategory_binds:
+            return self._subcategory_binds[subcategory_name]
+        shard = self.routes.get(slugify(subcategory_name))
+        category_name = None
+        if shard is None:
+            category_name = db.session.execute(
+                select(Category.name).join(SubCategory, SubCategory.category_id == Category.id)
+                .where(SubCategory.name == subcategory_name)
+            ).scalar()
+            if category_name is None:
+                return None  # Unknown subcategories are not cached, so new ones route once created
+            shard = self.routes.get(slugify(category_name))
+        bind_key = BIND_PREFIX + shard if shard else None
+        self._subcategory_binds[subcategory_name] = bind_key
+        return bind_key
+
+
+def init_shards(app):
+    """Build the app's shard router and close per-request shard sessions on teardown"""
+    app.extensions['catalog_shards'] = ShardRouter.from_config(app.config)
+    app.teardown_appcontext(_close_shard_sessions)
+
+
+def get_shard_router():
+    return current_app.extensions['catalog_shards']
+
+
+def shard_session(bind_key):
+    """
+    Session on one catalog database, shared for the rest of the app context
+
+    The default database is `db.session`; shards get a plain session bound
+    to their engine, with Flask-SQLAlchemy's Query so `.paginate()` works.
+    """
+    if bind_key is None:
+        return db.session
+    sessions = g.setdefault('shard_sessions', {})
+    session = sessions.get(bind_key)
+    if session is None:
+        session = sessions[bind_key] = Session(bind=db.engines[bind_key], query_cls=Query)
+    return session
+
+
+def catalog_sessions():
+    """{bind key: session} for every catalog database, the default one first"""
+    return {bind_key: shard_session(bind_key) for bind_key in get_shard_router().bind_keys()}
+
+
+def _close_shard_sessions(exception=None):
+    for session in g.pop('shard_sessions', {}).values():
+        session.close()
+
+
+def _listing_key(row):
+    """GET /api/products order of a (product, overall_rating, name, id) row"""
+    return (row[1] is not None, -(row[1] or 0), row[2], row[3])
+
+
+class ScatterPagination(Pagination):
+    """
+    Flask-SQLAlchemy pagination over several shards' listing queries
+
+    Each query must already be in listing order. A page reads the first
+    offset + per_page rows of every shard and merges them, so deep pages
+    cost more than on one database (callers cap the depth with
+    SHARD_SCATTER_MAX_ROWS); the total is the sum of shard counts.
+    """
+
+    def _query_items(self):
+        end = self._query_offset + self.per_page
+        streams = [
+            query.add_columns(AggregatedReview.overall_rating, Product.name, Product.id).limit(end)
+            for query in self._query_args['queries']
+        ]
+        return [row[0] for row in islice(heapq.merge(*streams, key=_listing_key), self._query_offset, end)]
+
+    def _query_count(self):
+        return sum(query.order_by(None).count() for query in self._query_args['queries'])
+
+
+def prepare_shard(name):
+    """
+    Create shard `name`'s tables, start its product ids and copy the taxonomy
+
+    Safe to re-run: the id sequence only moves forward and categories and
+    subcategories are merged by id. Returns the first id the shard hands out.
+    """
+    router = get_shard_router()
+    if name not in router.shards:
+        raise ValueError(f"Unknown shard '{name}'; configured: {', '.join(router.shards) or 'none'}")
+    start = router.id_start(name)
+    engine = db.engines[BIND_PREFIX + name]
+    db.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        if engine.dialect.name == 'sqlite':
+            # AUTOINCREMENT keeps ids above the sqlite_sequence entry, even after deletes
+            current = session.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'products'")).scalar()
+            if current is None:
+                session.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('products', :seq)"),
+                                {'seq': start - 1})
+            elif current < start - 1:
+                session.execute(text("UPDATE sqlite_sequence SET seq = :seq WHERE name = 'products'"),
+                                {'seq': start - 1})
+        elif engine.dialect.name == 'postgresql':
+            session.execute(text(
+                "SELECT setval(pg_get_serial_sequence('products', 'id'), "
+                "GREATEST(:start, (SELECT COALESCE(MAX(id) + 1, 0) FROM products)), false)"
+            ), {'start': start})
+        else:
+            raise ValueError(f'Cannot set the id range of a {engine.dialect.name} shard')
+
+        for model in (Category, SubCategory):
+            columns = model.__table__.columns.keys()
+            for row in db.session.execute(select(model.__table__)).mappings():
+                session.merge(model(**{column: row[column] for column in columns}))
+        session.commit()
+    return start
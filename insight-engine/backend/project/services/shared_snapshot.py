@@ -0,0 +1,203 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+
+from project.models.models import Product
+from project.services.snapshot import SnapshotPagination
+
+MAGIC = b'ICSNAP01'
+PREAMBLE = struct.Struct('<8sI')  # magic, header length
+ALIGN = 8
+
+# Low-cardinality strings stored once in the header and referenced by code
+DICTIONARY_FIELDS = ('brand', 'subcategory_name', 'category_name')
+# Free text stored in a shared UTF-8 heap, addressed by per-row offsets
+TEXT_FIELDS = ('name', 'short_description', 'insight_snippet', 'image_url', 'created_at', 'updated_at')
+
+
+def write_shared_snapshot(snapshot, path):
+    """
+    Serialize a CatalogSnapshot to a memory-mappable file, replacing `path` atomically
+
+    Rows are written in listing order, so the global order is the row
+    number itself; each subcategory gets an int32 array of row numbers.
+    Fixed-width columns are 8-byte aligned so readers can cast them in
+    place. The file is written next to `path` and moved over it with
+    os.replace(): readers holding the old mapping keep a consistent
+    version until they re-map.
+    """
+    records = [snapshot.records[product_id] for product_id in snapshot.order]
+    count = len(records)
+
+    sections = []  # (name, typecode, bytes)
+    sections.append(('id', 'q', array('q', (r.id for r in records)).tobytes()))
+    sections.append(('subcategory_id', 'q', array('q', (r.subcategory_id or 0 for r in records)).tobytes()))
+    sections.append(('overall_rating', 'd', array(
+        'd', (float('nan') if r.overall_rating is None else r.overall_rating for r in records)
+    ).tobytes()))
+
+    dictionaries = {}
+    for field in DICTIONARY_FIELDS:
+        table = {}
+        codes = array('i', (-1 if getattr(r, field) is None else table.setdefault(getattr(r, field), len(table))
+                            for r in records))
+        dictionaries[field] = list(table)
+        sections.append((f'{field}_code', 'i', codes.tobytes()))
+
+    heap = bytearray()
+    for field in TEXT_FIELDS:
+        offsets, nulls = array('q', [0] * (count + 1)), bytearray(count)
+        for row, record in enumerate(records):
+            value = getattr(record, field)
+            offsets[row] = len(heap)
+            if value is None:
+                nulls[row] = 1
+            else:
+                heap += value.encode('utf-8')
+        offsets[count] = len(heap)
+        sections.append((f'{field}_offsets', 'q', offsets.tobytes()))
+        sections.append((f'{field}_nulls', 'B', bytes(nulls)))
+    sections.append(('heap', 'B', bytes(heap)))
+
+    row_of = {record.id: row for row, record in enumerate(records)}
+    subcategories = {}
+    for name, ids in snapshot.by_subcategory.items():
+        subcategories[name or ''] = f'order:{name or ""}'
+        sections.append((subcategories[name or ''], 'i', array('i', (row_of[i] for i in ids)).tobytes()))
+
+    layout, offset = {}, 0
+    for name, typecode, data in sections:
+        layout[name] = [offset, len(data), typecode]
+        offset += len(data) + (-len(data)) % ALIGN
+    header = json.dumps({
+        'version': snapshot.seq, 'built_at': snapshot.built_at, 'count': count,
+        'dictionaries': dictionaries, 'subcategories': subcategories, 'sections': layout,
+    }).encode('utf-8')
+    header += b' ' * ((-(PREAMBLE.size + len(header))) % ALIGN)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as fh:
+        fh.write(PREAMBLE.pack(MAGIC, len(header)))
+        fh.write(header)
+        for _, _, data in sections:
+            fh.write(data)
+            fh.write(b'\0' * ((-len(data)) % ALIGN))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+class MappedRecord:
+    """One row of a MappedCatalogSnapshot; fields are decoded from the mapping on access"""
+    __slots__ = ('_snapshot', '_row')
+
+    def __init__(self, snapshot, row):
+        self._snapshot = snapshot
+        self._row = row
+
+    def to_dict(self, include_details=False, fields=None, include=None):
+        """Same signature as Product.to_dict(); related data is never available here"""
+        fields = Product.SUMMARY_FIELDS if fields is None else fields
+        value = self._snapshot.value
+        return {field: value(field, self._row) for field in fields}
+
+
+class MappedCatalogSnapshot:
+    """
+    Read-only view of a snapshot file, shared by every worker through the page cache
+
+    Columns are typed memoryviews over one read-only mmap, so opening a
+    snapshot copies nothing but the small JSON header, and a page of
+    results decodes only its own rows. Pagination matches CatalogSnapshot.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as fh:
+            self.stat = os.fstat(fh.fileno())
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, header_length = PREAMBLE.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a catalog snapshot file')
+        header = json.loads(bytes(view[PREAMBLE.size:PREAMBLE.size + header_length]))
+        base = PREAMBLE.size + header_length
+
+        self.path = path
+        self.seq = header['version']
+        self.built_at = header['built_at']
+        self.count = header['count']
+        self.dictionaries = header['dictionaries']
+        self.columns = {
+            name: view[base + offset:base + offset + length].cast(typecode)
+            for name, (offset, length, typecode) in header['sections'].items()
+        }
+        self.heap = self.columns['heap']
+        self.by_subcategory = {name: self.columns[section] for name, section in header['subcategories'].items()}
+        self.order = range(self.count)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, row):
+        return MappedRecord(self, row)
+
+    def value(self, field, row):
+        """Decode one summary field of one row"""
+        columns = self.columns
+        if field == 'id':
+            return columns['id'][row]
+        if field == 'subcategory_id':
+            return columns['subcategory_id'][row]
+        if field == 'overall_rating':
+            rating = columns['overall_rating'][row]
+            return None if rating != rating else rating  # NaN encodes NULL
+        if field in DICTIONARY_FIELDS:
+            code = columns[f'{field}_code'][row]
+            return None if code < 0 else self.dictionaries[field][code]
+        if columns[f'{field}_nulls'][row]:
+            return None
+        offsets = columns[f'{field}_offsets']
+        return str(self.heap[offsets[row]:offsets[row + 1]], 'utf-8')
+
+    def paginate(self, subcategory_name=None, page=1, per_page=20):
+        """Page of records in listing order, optionally within one subcategory"""
+        order = self.order if subcategory_name is None else self.by_subcategory.get(subcategory_name, ())
+        return SnapshotPagination(page=page, per_page=per_page, error_out=False, order=order, records=self)
+
+
+_mapped = None
+_mapped_checked_at = None  # Not 0.0: time.monotonic() can be below the interval shortly after boot
+_mapped_lock = threading.Lock()
+
+
+def get_shared_snapshot(config):
+    """
+    The mapped snapshot at CATALOG_SNAPSHOT_SHARED_PATH, or None when there is no usable file
+
+    At most every CATALOG_SNAPSHOT_REFRESH_SECONDS the path is stat()ed; a
+    new file (replaced by the builder) is mapped and swapped in. Requests
+    still holding the previous version finish on it.
+    """
+    global _mapped, _mapped_checked_at
+    now = time.monotonic()
+    if _mapped_checked_at is not None and now - _mapped_checked_at < config['CATALOG_SNAPSHOT_REFRESH_SECONDS']:
+        return _mapped
+    with _mapped_lock:
+        if _mapped_checked_at is not None and now - _mapped_checked_at < config['CATALOG_SNAPSHOT_REFRESH_SECONDS']:
+            return _mapped
+        path = config['CATALOG_SNAPSHOT_SHARED_PATH']
+        try:
+            stat = os.stat(path)
+            if _mapped is None or (stat.st_ino, stat.st_mtime_ns) != (_mapped.stat.st_ino, _mapped.stat.st_mtime_ns):
+                _mapped = MappedCatalogSnapshot(path)
+        except (OSError, ValueError):
+            _mapped = None
+        _mapped_checked_at = now
+    return _mapped
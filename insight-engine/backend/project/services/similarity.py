@@ -0,0 +1,311 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+from sqlalchemy import func, select
+
+from project import db
+from project.models.models import Product, ProductAttribute, PriceHistory, AggregatedReview
+from project.services.analytics import RATING_DIMENSIONS, grouped_mean_std, load_catalog_arrays, zscores
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TAG_KEYS = ('Style Tags', 'Pricing Model')
+TAG_DIM = 64
+TEXT_DIM = 256
+# Relative weight of each feature block before the final row normalization
+FEATURE_WEIGHTS = {'ratings': 1.0, 'price': 0.5, 'tags': 1.0, 'text': 1.0}
+
+_TOKEN_RE = re.compile(r'[a-z0-9]{3,}')
+
+
+def _bucket(token, dim):
+    """Stable hash of a token into one of `dim` feature columns"""
+    return zlib.crc32(token.encode('utf-8')) % dim
+
+
+def _normalize_rows(matrix):
+    """L2-normalize each row in place; all-zero rows stay zero"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def tag_features(subcategory_id, product_ids, tag_keys=DEFAULT_TAG_KEYS):
+    """Multi-hot hashed ProductAttribute tags ('Style Tags' values are split on commas)"""
+    rows = {int(pid): i for i, pid in enumerate(product_ids)}
+    matrix = np.zeros((len(product_ids), TAG_DIM), dtype=np.float32)
+    if not rows or not tag_keys:
+        return matrix
+    stmt = (
+        select(ProductAttribute.product_id, ProductAttribute.key, ProductAttribute.value)
+        .join(Product, Product.id == ProductAttribute.product_id)
+        .where(Product.subcategory_id == subcategory_id, ProductAttribute.key.in_(list(tag_keys)))
+    )
+    for product_id, key, value in db.session.execute(stmt):
+        if product_id not in rows:
+            continue
+        for tag in value.split(','):
+            tag = tag.strip().lower()
+            if tag:
+                matrix[rows[product_id], _bucket(f'{key.lower()}={tag}', TAG_DIM)] = 1.0
+    return matrix
+
+
+def text_features(subcategory_id, product_ids):
+    """Hashed TF-IDF of each product's insight_snippet, with IDF taken over `product_ids`"""
+    rows = {int(pid): i for i, pid in enumerate(product_ids)}
+    counts = np.zeros((len(product_ids), TEXT_DIM), dtype=np.float32)
+    if not rows:
+        return counts
+    stmt = select(Product.id, Product.insight_snippet).where(Product.subcategory_id == subcategory_id)
+    for product_id, snippet in db.session.execute(stmt):
+        if product_id not in rows:
+            continue
+        for token in _TOKEN_RE.findall((snippet or '').lower()):
+            counts[rows[product_id], _bucket(token, TEXT_DIM)] += 1.0
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log((1.0 + len(product_ids)) / (1.0 + document_frequency)) + 1.0
+    return counts * idf.astype(np.float32)
+
+
+def build_feature_matrix(subcategory_id, tag_keys=DEFAULT_TAG_KEYS):
+    """
+    Feature vectors for every product in a subcategory
+
+    Ratings and log-price are standardized within the subcategory (missing
+    values sit at the mean); tags and snippet text are hashed into fixed-width
+    blocks so the column layout never depends on the vocabulary.
+    """
+    arrays = load_catalog_arrays(subcategory_id)
+    product_ids = arrays['product_id']
+    n = len(product_ids)
+    inverse = np.zeros(n, dtype=np.int64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_price = np.where(arrays['price'] > 0, np.log(arrays['price']), np.nan)
+    numeric = np.column_stack([arrays['ratings'], log_price])
+    means, stds, _ = grouped_mean_std(numeric, inverse, 1)
+    numeric = np.nan_to_num(zscores(numeric, inverse, means, stds), nan=0.0).astype(np.float32)
+
+    blocks = {
+        'ratings': numeric[:, :len(RATING_DIMENSIONS)] / np.sqrt(len(RATING_DIMENSIONS)),
+        'price': numeric[:, -1:],
+        'tags': _normalize_rows(tag_features(subcategory_id, product_ids, tag_keys)),
+        'text': _normalize_rows(text_features(subcategory_id, product_ids)),
+    }
+    matrix = np.hstack([blocks[name] * FEATURE_WEIGHTS[name] for name in FEATURE_WEIGHTS]).astype(np.float32)
+    return product_ids, _normalize_rows(matrix)
+
+
+def nearest_neighbours(matrix, k, chunk_cells=4_000_000):
+    """
+    Top-k cosine neighbours for every row of an L2-normalized matrix
+
+    Similarities are computed in row chunks so memory stays bounded at
+    roughly `chunk_cells` floats regardless of catalog size.
+    """
+    n = matrix.shape[0]
+    k = min(k, n - 1)
+    neighbours = np.zeros((n, max(k, 0)), dtype=np.int32)
+    scores = np.zeros((n, max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return neighbours, scores
+
+    step = max(1, min(n, chunk_cells // n))
+    for start in range(0, n, step):
+        stop = min(start + step, n)
+        sims = matrix[start:stop] @ matrix.T
+        sims[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        neighbours[start:stop] = np.take_along_axis(top, order, axis=1)
+        scores[start:stop] = np.take_along_axis(top_scores, order, axis=1)
+    return neighbours, scores
+
+
+def subcategory_signatures():
+    """
+    Cheap change fingerprint per subcategory
+
+    A subcategory is rebuilt when its product count or the latest update to
+    any of its products, reviews, attributes or prices changes.
+    """
+    signatures = {}
+    statements = [
+        select(Product.subcategory_id, func.count(Product.id), func.max(Product.updated_at))
+        .group_by(Product.subcategory_id),
+        select(Product.subcategory_id, func.max(AggregatedReview.updated_at))
+        .join(AggregatedReview, AggregatedReview.product_id == Product.id)
+        .group_by(Product.subcategory_id),
+        select(Product.subcategory_id, func.max(ProductAttribute.updated_at))
+        .join(ProductAttribute, ProductAttribute.product_id == Product.id)
+        .group_by(Product.subcategory_id),
+        select(Product.subcategory_id, func.max(PriceHistory.id), func.max(PriceHistory.updated_at))
+        .join(PriceHistory, PriceHistory.product_id == Product.id)
+        .group_by(Product.subcategory_id),
+    ]
+    for stmt in statements:
+        for subcategory_id, *values in db.session.execute(stmt):
+            signatures.setdefault(subcategory_id, []).extend(str(value) for value in values)
+    return {subcategory_id: '|'.join(values) for subcategory_id, values in signatures.items()}
+
+
+class SimilarityIndex:
+    """
+    In-memory nearest-neighbour table, partitioned by subcategory
+
+    Neighbours are precomputed in batch, so a lookup is a dict hit plus an
+    array slice. Each subcategory block keeps its own change signature, which
+    lets `refresh()` rebuild only the subcategories whose products changed.
+    """
+
+    def __init__(self, max_k=20, tag_keys=DEFAULT_TAG_KEYS):
+        self.max_k = max_k
+        self.tag_keys = tuple(tag_keys)
+        self.blocks = {}      # subcategory_id -> (product_ids, neighbours, scores)
+        self.signatures = {}  # subcategory_id -> signature string
+        self.positions = {}   # product_id -> (subcategory_id, row)
+        self.built_at = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def build_block(self, subcategory_id):
+        """Compute the neighbour table for one subcategory"""
+        product_ids, matrix = build_feature_matrix(subcategory_id, self.tag_keys)
+        neighbours, scores = nearest_neighbours(matrix, self.max_k)
+        return product_ids, neighbours, scores
+
+    def refresh(self, full=False):
+        """Rebuild changed (or, with `full`, all) subcategories; returns the rebuilt ids"""
+        signatures = subcategory_signatures()
+        stale = [
+            subcategory_id for subcategory_id, signature in signatures.items()
+            if full or self.signatures.get(subcategory_id) != signature
+        ]
+        removed = set(self.blocks) - set(signatures)
+        built = {subcategory_id: self.build_block(subcategory_id) for subcategory_id in stale}
+
+        with self._lock:
+            blocks = dict(self.blocks)
+            for subcategory_id in removed:
+                blocks.pop(subcategory_id, None)
+            blocks.update(built)
+            self.blocks = blocks
+            self.signatures = {subcategory_id: signatures[subcategory_id] for subcategory_id in blocks}
+            if built or removed:
+                self.positions = {
+                    int(product_id): (subcategory_id, row)
+                    for subcategory_id, (product_ids, _, _) in blocks.items()
+                    for row, product_id in enumerate(product_ids)
+                }
+            self.built_at = time.time()
+        return stale
+
+    def similar(self, product_id, k=10):
+        """[(product_id, score), ...] for the k nearest products, or None if unindexed"""
+        position = self.positions.get(product_id)
+        if position is None:
+            return None
+        product_ids, neighbours, scores = self.blocks[position[0]]
+        row = position[1]
+        k = min(k, neighbours.shape[1])
+        return [
+            (int(product_ids[j]), float(score))
+            for j, score in zip(neighbours[row, :k], scores[row, :k])
+        ]
+
+    def save(self, path):
+        """Write the index to an .npz file so it can be built offline and loaded at serve time"""
+        arrays = {}
+        for subcategory_id, (product_ids, neighbours, scores) in self.blocks.items():
+            arrays[f'ids_{subcategory_id}'] = product_ids
+            arrays[f'neighbours_{subcategory_id}'] = neighbours
+            arrays[f'scores_{subcategory_id}'] = scores
+        meta = {
+            'max_k': self.max_k,
+            'tag_keys': list(self.tag_keys),
+            'built_at': self.built_at,
+            'signatures': {str(key): value for key, value in self.signatures.items()},
+        }
+        arrays['meta'] = np.array(json.dumps(meta))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Written beside the path and moved into place, so the API never loads a partial file
+        partial = f'{path}.{os.getpid()}.partial.npz'
+        np.savez_compressed(partial, **arrays)
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save()"""
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            index = cls(max_k=meta['max_k'], tag_keys=meta['tag_keys'])
+            signatures = {int(key): value for key, value in meta['signatures'].items()}
+            for subcategory_id in signatures:
+                index.blocks[subcategory_id] = (
+                    data[f'ids_{subcategory_id}'],
+                    data[f'neighbours_{subcategory_id}'],
+                    data[f'scores_{subcategory_id}'],
+                )
+        index.signatures = signatures
+        index.positions = {
+            int(product_id): (subcategory_id, row)
+            for subcategory_id, (product_ids, _, _) in index.blocks.items()
+            for row, product_id in enumerate(product_ids)
+        }
+        index.built_at = meta['built_at']
+        return index
+
+
+_index = None
+_index_mtime = None
+_last_check = None  # Not 0.0: time.monotonic() can be below the interval shortly after boot
+_index_lock = threading.Lock()
+
+
+def get_similarity_index(config):
+    """
+    Process-wide index loaded from SIMILARITY_INDEX_PATH, or None until one is built
+
+    Requests never build the index: `flask similarity build` (with
+    --follow to keep it current) writes it offline, and at most every
+    SIMILARITY_REFRESH_SECONDS a request checks the file and swaps in a
+    newer build. Requests arriving while another one loads it keep reading
+    the current index instead of waiting.
+    """
+    global _index, _index_mtime, _last_check
+    now = time.monotonic()
+    if _last_check is not None and now - _last_check < config['SIMILARITY_REFRESH_SECONDS']:
+        return _index
+    if not _index_lock.acquire(blocking=_index is None):
+        return _index
+    try:
+        if _last_check is not None and time.monotonic() - _last_check < config['SIMILARITY_REFRESH_SECONDS']:
+            return _index
+        path = config['SIMILARITY_INDEX_PATH']
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is not None and mtime != _index_mtime:
+            try:
+                _index = SimilarityIndex.load(path)
+                _index_mtime = mtime
+                logger.info(f'Loaded similarity index for {len(_index)} products from {path}')
+            except Exception as e:
+                logger.error(f'Could not load similarity index from {path}, keeping the current one: {str(e)}')
+        _last_check = time.monotonic()
+        return _index
+    finally:
+        _index_lock.release()
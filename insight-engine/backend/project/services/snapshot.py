@@ -0,0 +1,184 @@
+import sys
+import threading
+import time
+from array import array
+
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import select
+
+from project import db
+from project.models.models import Product, SubCategory, Category, AggregatedReview, ChangeEvent
+from project.services.changes import settled_seq
+
+# Change log entities that alter a listing row (attributes and prices are not listed)
+LISTING_ENTITIES = ('products', 'aggregated_reviews')
+LOAD_CHUNK_SIZE = 500
+
+
+class ProductRecord:
+    """
+    Listing view of one product: exactly the summary fields of Product.to_dict()
+
+    `__slots__` records carry no per-instance dict, timestamps are kept as
+    the ISO strings the API returns, and brand / subcategory / category
+    names are interned so every product shares one copy of each.
+    """
+    __slots__ = Product.SUMMARY_FIELDS
+
+    def __init__(self, row):
+        for field, value in zip(Product.SUMMARY_FIELDS, row):
+            setattr(self, field, value)
+
+    @classmethod
+    def from_row(cls, row):
+        (product_id, name, brand, short_description, insight_snippet, image_url, subcategory_id,
+         subcategory_name, category_name, overall_rating, created_at, updated_at) = row
+        return cls((
+            product_id, name, sys.intern(brand) if brand else brand, short_description, insight_snippet,
+            image_url, subcategory_id, sys.intern(subcategory_name) if subcategory_name else subcategory_name,
+            sys.intern(category_name) if category_name else category_name, overall_rating,
+            created_at.isoformat() if created_at else None, updated_at.isoformat() if updated_at else None
+        ))
+
+    def to_dict(self, include_details=False, fields=None, include=None):
+        """Same signature as Product.to_dict(); related data is never available here"""
+        fields = Product.SUMMARY_FIELDS if fields is None else fields
+        return {field: getattr(self, field) for field in fields}
+
+    def sort_key(self):
+        """Listing order of GET /api/products: unrated first, then rating desc, name, id"""
+        rated = self.overall_rating is not None
+        return (rated, -self.overall_rating if rated else 0.0, self.name, self.id)
+
+
+class SnapshotPagination(Pagination):
+    """Flask-SQLAlchemy pagination over a snapshot id array, so page arguments behave identically"""
+
+    def _query_items(self):
+        ids = self._query_args['order'][self._query_offset:self._query_offset + self.per_page]
+        records = self._query_args['records']
+        return [records[product_id] for product_id in ids]
+
+    def _query_count(self):
+        return len(self._query_args['order'])
+
+
+def _listing_rows(product_ids=None):
+    """Flat rows for ProductRecord.from_row(), optionally limited to some products"""
+    stmt = (
+        select(Product.id, Product.name, Product.brand, Product.short_description, Product.insight_snippet,
+               Product.image_url, Product.subcategory_id, SubCategory.name, Category.name,
+               AggregatedReview.overall_rating, Product.created_at, Product.updated_at)
+        .outerjoin(SubCategory, SubCategory.id == Product.subcategory_id)
+        .outerjoin(Category, Category.id == SubCategory.category_id)
+        .outerjoin(AggregatedReview, AggregatedReview.product_id == Product.id)
+    )
+    if product_ids is None:
+        yield from db.session.execute(stmt)
+        return
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), LOAD_CHUNK_SIZE):
+        yield from db.session.execute(stmt.where(Product.id.in_(product_ids[start:start + LOAD_CHUNK_SIZE])))
+
+
+class CatalogSnapshot:
+    """
+    Immutable, read-optimized copy of the product listing data
+
+    Holds one ProductRecord per product plus the listing order as compact
+    `array('q')` id columns, globally and per subcategory, so filtering,
+    sorting and pagination of GET /api/products are array slices and dict
+    lookups. `apply_changes()` returns a new snapshot with just the products
+    named in the change log since `seq` reloaded; readers keep using the
+    snapshot they hold until they fetch the new one.
+    """
+
+    def __init__(self, records, seq, order=None):
+        self.records = records
+        self.seq = seq
+        if order is None:
+            order = sorted(records.values(), key=ProductRecord.sort_key)
+        self.order = array('q', (record.id for record in order))
+        by_subcategory = {}
+        for record in order:
+            by_subcategory.setdefault(record.subcategory_name, []).append(record.id)
+        self.by_subcategory = {name: array('q', ids) for name, ids in by_subcategory.items()}
+        self.built_at = time.time()
+
+    def __len__(self):
+        return len(self.records)
+
+    @classmethod
+    def build(cls):
+        seq = settled_seq()  # Read first: changes made during the load are re-applied later
+        records = {row[0]: ProductRecord.from_row(row) for row in _listing_rows()}
+        return cls(records, seq)
+
+    def apply_changes(self):
+        """Snapshot with the changes logged since `seq` applied (self when nothing changed)"""
+        head = settled_seq(self.seq)
+        if head <= self.seq:
+            return self
+        changed = set(db.session.execute(
+            select(ChangeEvent.product_id).distinct()
+            .where(ChangeEvent.seq > self.seq, ChangeEvent.seq <= head,
+                   ChangeEvent.entity.in_(LISTING_ENTITIES))
+        ).scalars())
+        if not changed:
+            self.seq = head
+            return self
+
+        records = dict(self.records)
+        for product_id in changed:
+            records.pop(product_id, None)
+        loaded = [ProductRecord.from_row(row) for row in _listing_rows(changed)]
+        records.update((record.id, record) for record in loaded)
+        # Timsort is near-linear on the previous order with a few entries appended
+        order = [self.records[product_id] for product_id in self.order if product_id not in changed] + loaded
+        order.sort(key=ProductRecord.sort_key)
+        return CatalogSnapshot(records, head, order)
+
+    def paginate(self, subcategory_name=None, page=1, per_page=20):
+        """Page of records in listing order, optionally within one subcategory"""
+        order = self.order if subcategory_name is None else self.by_subcategory.get(subcategory_name, array('q'))
+        return SnapshotPagination(page=page, per_page=per_page, error_out=False,
+                                  order=order, records=self.records)
+
+
+_snapshot = None
+_snapshot_checked_at = 0.0
+_snapshot_rebuilt_at = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def get_catalog_snapshot(config):
+    """
+    The process-wide catalog snapshot, built on first use
+
+    At most every CATALOG_SNAPSHOT_REFRESH_SECONDS the change log is checked
+    and changed products are reloaded; a full rebuild every
+    CATALOG_SNAPSHOT_REBUILD_SECONDS picks up what the log does not record
+    (subcategory and category renames). Without the change log every check
+    is a full rebuild. Requests arriving while another one refreshes keep
+    reading the current snapshot instead of waiting.
+    """
+    global _snapshot, _snapshot_checked_at, _snapshot_rebuilt_at
+    now = time.monotonic()
+    if _snapshot is not None and now - _snapshot_checked_at < config['CATALOG_SNAPSHOT_REFRESH_SECONDS']:
+        return _snapshot
+    if not _snapshot_lock.acquire(blocking=_snapshot is None):
+        return _snapshot
+    try:
+        if _snapshot is not None and now - _snapshot_checked_at < config['CATALOG_SNAPSHOT_REFRESH_SECONDS']:
+            return _snapshot
+        rebuild = (_snapshot is None or not config['CHANGE_LOG_ENABLED']
+                   or now - _snapshot_rebuilt_at >= config['CATALOG_SNAPSHOT_REBUILD_SECONDS'])
+        if rebuild:
+            _snapshot = CatalogSnapshot.build()
+            _snapshot_rebuilt_at = now
+        else:
+            _snapshot = _snapshot.apply_changes()
+        _snapshot_checked_at = now
+        return _snapshot
+    finally:
+        _snapshot_lock.release()
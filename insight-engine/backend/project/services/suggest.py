@@ -0,0 +1,231 @@
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+from sqlalchemy import select
+
+from project import db
+from project.models.models import Product, SubCategory, AggregatedReview, ChangeEvent
+from project.services.changes import settled_seq
+from project.services.shards import catalog_sessions
+from project.services.snapshot import LISTING_ENTITIES, LOAD_CHUNK_SIZE
+
+WORD = re.compile(r'[^\W_]+')
+# Results for prefixes up to this long are memoized per index version: they
+# match the most keys and are what every user types first
+MEMO_PREFIX_LENGTH = 3
+MEMO_MAX_ENTRIES = 20000
+# Sorts after any character a normalized key can continue with
+PREFIX_END = '\U0010ffff'
+
+
+def normalize(text):
+    """Case- and accent-insensitive form of `text`, words separated by single spaces"""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ' '.join(WORD.findall(''.join(ch for ch in text if not unicodedata.combining(ch))))
+
+
+def _suffix_keys(text):
+    """`text` normalized from each of its words on, so any word can start a match"""
+    words = normalize(text).split(' ')
+    return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+
+def _product_keys(row):
+    product_id, name, brand = row[0], row[1], row[2]
+    keys = _suffix_keys(name)
+    if brand:
+        keys.add(normalize(f'{brand} {name}'))
+    return [(key, product_id) for key in keys]
+
+
+def _product_rank(row):
+    """Best first: highest rating, then most reviews analyzed, then name"""
+    rating, reviews = row[4], row[5]
+    return (rating is None, -(rating or 0), -(reviews or 0), row[1], row[0])
+
+
+def _suggest_rows(product_ids=None, session=None):
+    """(id, name, brand, subcategory name, overall rating, reviews analyzed) rows"""
+    session = session or db.session
+    stmt = (
+        select(Product.id, Product.name, Product.brand, SubCategory.name,
+               AggregatedReview.overall_rating, AggregatedReview.total_reviews_analyzed)
+        .outerjoin(SubCategory, SubCategory.id == Product.subcategory_id)
+        .outerjoin(AggregatedReview, AggregatedReview.product_id == Product.id)
+    )
+    if product_ids is None:
+        yield from (tuple(row) for row in session.execute(stmt))
+        return
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), LOAD_CHUNK_SIZE):
+        yield from (tuple(row) for row in
+                    session.execute(stmt.where(Product.id.in_(product_ids[start:start + LOAD_CHUNK_SIZE]))))
+
+
+def _prefix_refs(keys, prefix):
+    """Distinct refs of the sorted (key, ref) list whose key starts with `prefix`"""
+    refs = set()
+    for index in range(bisect_left(keys, (prefix,)), len(keys)):
+        key, ref = keys[index]
+        if not key.startswith(prefix):
+            break
+        refs.add(ref)
+    return refs
+
+
+class SuggestIndex:
+    """
+    Immutable prefix index for typeahead over product names, brands and subcategories
+
+    Each name is indexed from every word on ('pro range' finds 'Wolf Pro
+    Range') plus brand-first, as sorted (key, ref) lists: a prefix is a
+    bisect to the first candidate and a scan while keys still match.
+    Products rank by rating, then reviews analyzed, and their keys carry a
+    parallel array('i') of rank positions, so even a one-letter prefix is
+    two bisects and nsmallest() over an int slice. Brands and
+    subcategories rank by product count. `apply_changes()` returns a new
+    index with only the products named in the change log re-keyed.
+    
+    `sessions` maps each catalog database's bind key (None for the
+    default one) to a session, and `seq` holds the change log position
+    of each; with CATALOG_SHARDS one index covers every shard.
+    """
+
+    def __init__(self, products, seq, product_keys=None):
+        self.products = products
+        self.seq = seq
+        if product_keys is None:
+            product_keys = sorted(key for row in products.values() for key in _product_keys(row))
+        self.product_keys = product_keys
+        self.ranked = sorted(products.values(), key=_product_rank)
+        rank_of = {row[0]: rank for rank, row in enumerate(self.ranked)}
+        self._key_strings = [key for key, _ in product_keys]
+        self._key_ranks = array('i', (rank_of[product_id] for _, product_id in product_keys))
+
+        brands, subcategories = {}, {}
+        for row in products.values():
+            if row[2]:
+                brands[row[2]] = brands.get(row[2], 0) + 1
+            if row[3]:
+                subcategories[row[3]] = subcategories.get(row[3], 0) + 1
+        self.brands, self.subcategories = brands, subcategories
+        self.brand_keys = sorted((key, name) for name in brands for key in _suffix_keys(name))
+        self.subcategory_keys = sorted((key, name) for name in subcategories for key in _suffix_keys(name))
+        self._memo = {}
+        self.built_at = time.time()
+
+    def __len__(self):
+        return len(self.products)
+
+    @classmethod
+    def build(cls, sessions=None):
+        sessions = sessions or {None: db.session}
+        # Read first: changes made during the load are re-applied later
+        seq = {bind_key: settled_seq(session=session) for bind_key, session in sessions.items()}
+        return cls({row[0]: row for session in sessions.values() for row in _suggest_rows(session=session)}, seq)
+
+    def apply_changes(self, sessions=None):
+        """Index with the changes logged since `seq` applied (self when nothing changed)"""
+        sessions = sessions or {None: db.session}
+        if set(sessions) != set(self.seq):
+            return SuggestIndex.build(sessions)
+        head = {bind_key: settled_seq(self.seq[bind_key], session) for bind_key, session in sessions.items()}
+        if head == self.seq:
+            return self
+        changed, loaded = set(), []
+        for bind_key, session in sessions.items():
+            if head[bind_key] <= self.seq[bind_key]:
+                continue
+            # Product ids are unique across shards, so each database's changes re-key only its own rows
+            ids = set(session.execute(
+                select(ChangeEvent.product_id).distinct()
+                .where(ChangeEvent.seq > self.seq[bind_key], ChangeEvent.seq <= head[bind_key],
+                       ChangeEvent.entity.in_(LISTING_ENTITIES))
+            ).scalars())
+            changed |= ids
+            loaded.extend(_suggest_rows(ids, session) if ids else ())
+        if not changed:
+            self.seq = head
+            return self
+
+        products = {product_id: row for product_id, row in self.products.items() if product_id not in changed}
+        products.update((row[0], row) for row in loaded)
+        # Timsort is near-linear on the previous keys with a few runs appended
+        keys = [item for item in self.product_keys if item[1] not in changed]
+        keys.extend(key for row in loaded for key in _product_keys(row))
+        keys.sort()
+        return SuggestIndex(products, head, keys)
+
+    def suggest(self, query, limit=8):
+        """{'products': [...], 'brands': [...], 'subcategories': [...]}, best `limit` of each"""
+        prefix = normalize(query)
+        if not prefix:
+            return {'products': [], 'brands': [], 'subcategories': []}
+        memo_key = (prefix, limit)
+        result = self._memo.get(memo_key)
+        if result is not None:
+            return result
+
+        start = bisect_left(self._key_strings, prefix)
+        end = bisect_left(self._key_strings, prefix + PREFIX_END, start)
+        products = [self.ranked[rank] for rank in heapq.nsmallest(limit, set(self._key_ranks[start:end]))]
+        brands = heapq.nsmallest(limit, _prefix_refs(self.brand_keys, prefix),
+                                 key=lambda name: (-self.brands[name], name))
+        subcategories = heapq.nsmallest(limit, _prefix_refs(self.subcategory_keys, prefix),
+                                        key=lambda name: (-self.subcategories[name], name))
+        result = {
+            'products': [
+                {'id': row[0], 'name': row[1], 'brand': row[2], 'subcategory_name': row[3], 'overall_rating': row[4]}
+                for row in products
+            ],
+            'brands': [{'name': name, 'product_count': self.brands[name]} for name in brands],
+            'subcategories': [
+                {'name': name, 'slug': name.lower().replace(' ', '-'), 'product_count': self.subcategories[name]}
+                for name in subcategories
+            ],
+        }
+        if len(prefix) <= MEMO_PREFIX_LENGTH and len(self._memo) < MEMO_MAX_ENTRIES:
+            self._memo[memo_key] = result
+        return result
+
+
+_index = None
+_index_checked_at = 0.0
+_index_rebuilt_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_suggest_index(config):
+    """
+    The process-wide suggest index, built on first use
+
+    Refreshed from the change log at most every SUGGEST_REFRESH_SECONDS and
+    rebuilt every CATALOG_SNAPSHOT_REBUILD_SECONDS (or on every refresh
+    without the change log). Requests arriving during a refresh keep
+    using the current index.
+    """
+    global _index, _index_checked_at, _index_rebuilt_at
+    now = time.monotonic()
+    if _index is not None and now - _index_checked_at < config['SUGGEST_REFRESH_SECONDS']:
+        return _index
+    if not _index_lock.acquire(blocking=_index is None):
+        return _index
+    try:
+        if _index is not None and now - _index_checked_at < config['SUGGEST_REFRESH_SECONDS']:
+            return _index
+        rebuild = (_index is None or not config['CHANGE_LOG_ENABLED']
+                   or now - _index_rebuilt_at >= config['CATALOG_SNAPSHOT_REBUILD_SECONDS'])
+        if rebuild:
+            _index = SuggestIndex.build(catalog_sessions())
+            _index_rebuilt_at = now
+        else:
+            _index = _index.apply_changes(catalog_sessions())
+        _index_checked_at = now
+        return _index
+    finally:
+        _index_lock.release()
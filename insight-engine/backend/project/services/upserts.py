@@ -0,0 +1,346 @@
+from datetime import date, datetime
+
+from sqlalchemy import Float, Integer, UniqueConstraint, func, inspect, or_, select, text, tuple_
+from sqlalchemy.engine import make_url
+
+from project import db
+from project.models.models import Product, ProductAttribute, PriceHistory, AggregatedReview, SubCategory
+from project.monitoring import metrics
+from project.services.changes import log_changes
+
+# Product columns a batch may set (brand + name is the natural key)
+PRODUCT_COLUMNS = ('short_description', 'insight_snippet', 'image_url', 'subcategory_id')
+# AggregatedReview columns a batch may set; bookkeeping columns are maintained here
+REVIEW_COLUMNS = tuple(
+    column.name for column in AggregatedReview.__table__.columns
+    if column.name not in ('id', 'product_id', 'last_updated', 'created_at', 'updated_at')
+)
+PRODUCT_KEYS = frozenset(('brand', 'name', 'subcategory', 'subcategory_id', 'attributes', 'prices', 'review')
+                         + PRODUCT_COLUMNS)
+# Dialects with INSERT ... ON CONFLICT
+UPSERT_DIALECTS = ('postgresql', 'sqlite')
+# Tables whose natural keys were added after release; older databases need `flask catalog add-constraints`
+NATURAL_KEY_TABLES = (Product.__table__, ProductAttribute.__table__, PriceHistory.__table__)
+# Replaced by uq_product_attributes_product_key, whose leading column serves the same lookups
+REDUNDANT_INDEXES = {'product_attributes': ('ix_product_attributes_product_id',)}
+
+
+class UpsertError(ValueError):
+    """A batch item failed validation; the message names the offending item"""
+
+
+def upsert_insert(table):
+    """
+    Dialect-specific INSERT supporting ON CONFLICT, for the default database
+
+    Raises NotImplementedError on dialects other than UPSERT_DIALECTS; features
+    built on it check the configured database at startup (see init_upserts).
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported on the '{dialect}' dialect")
+    return insert(table)
+
+
+def unsupported_dialects(config):
+    """Dialects of the configured databases (default and SQLALCHEMY_BINDS) that cannot run upserts"""
+    urls = [config['SQLALCHEMY_DATABASE_URI']] + [
+        bind['url'] if isinstance(bind, dict) else bind for bind in (config.get('SQLALCHEMY_BINDS') or {}).values()
+    ]
+    return sorted({make_url(url).get_backend_name() for url in urls} - set(UPSERT_DIALECTS))
+
+
+def init_upserts(app):
+    """Refuse to start with the write API enabled on a database it cannot write to"""
+    dialects = unsupported_dialects(app.config)
+    if app.config['WRITE_API_KEYS'] and dialects:
+        raise ValueError(f"Bulk upserts need PostgreSQL or SQLite, not {', '.join(dialects)}; unset WRITE_API_KEYS")
+
+
+def add_natural_keys(session=None):
+    """
+    Add the natural-key unique indexes to a database created before them; returns the names added
+
+    Rows already violating a key are reported rather than merged, since
+    which duplicate to keep is for the operator to decide.
+    """
+    session = session or db.session
+    inspector = inspect(session.connection())
+    added = []
+    for table in NATURAL_KEY_TABLES:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        existing |= {constraint['name'] for constraint in inspector.get_unique_constraints(table.name)}
+        for constraint in table.constraints:
+            if not isinstance(constraint, UniqueConstraint) or constraint.name in existing:
+                continue
+            columns = list(constraint.columns)
+            duplicate = session.execute(
+                select(*columns).group_by(*columns).having(func.count() > 1).limit(1)
+            ).first()
+            if duplicate is not None:
+                session.rollback()
+                raise UpsertError(f"{table.name} has several rows for {dict(duplicate._mapping)}; "
+                                  f"remove the duplicates, then retry")
+            session.execute(text(f"CREATE UNIQUE INDEX {constraint.name} ON {table.name} "
+                                 f"({', '.join(column.name for column in columns)})"))
+            added.append(constraint.name)
+        for name in REDUNDANT_INDEXES.get(table.name, ()):
+            if name in existing:
+                session.execute(text(f'DROP INDEX {name}'))
+    session.commit()
+    return added
+
+
+def _text(value, where, required=False):
+    if value is None and not required:
+        return None
+    if not isinstance(value, str) or (required and not value.strip()):
+        raise UpsertError(f"{where}: expected a {'non-empty ' if required else ''}string")
+    return value.strip() if required else value
+
+
+def _number(value, where, column_type=Float):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise UpsertError(f"{where}: expected a number")
+    return int(value) if column_type is Integer else float(value)
+
+
+def _date(value, where):
+    if value is None:
+        return date.today()
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise UpsertError(f"{where}: expected an ISO date (YYYY-MM-DD)")
+
+
+class CatalogUpserter:
+    """
+    Idempotent bulk writes for products and their attributes, prices and reviews
+
+    Every table is written with `INSERT ... ON CONFLICT DO UPDATE` on its
+    natural key (products: brand + name, attributes: product + key, prices:
+    product + retailer + date, reviews: product). The update carries a
+    `WHERE` clause comparing old and new values, so re-sending unchanged
+    data rewrites nothing and leaves `updated_at` alone; change fingerprints
+    and caches keyed on it stay warm.
+
+    Omitted fields keep their stored values, and attributes not named in a
+    batch are left in place. Each `apply()` call is one transaction.
+    """
+
+    def __init__(self, chunk_size=500):
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(chunk_size=config['UPSERT_CHUNK_SIZE'])
+
+    def upsert_rows(self, table, rows, conflict_columns, update_columns, now, stamp_columns=('updated_at',)):
+        """
+        Upsert `rows` into `table`; returns ({'inserted', 'updated', 'unchanged'} counts, returned rows)
+
+        Rows are merged on their conflict key first (a statement may not touch
+        a row twice) and grouped by the columns they provide, so each group is
+        a multi-row INSERT whose update only sets those columns. Inserted rows
+        are told apart from updated ones by `created_at == now`. Core statements
+        skip the ORM flush hooks, so written rows are added to the change log here.
+        """
+        merged = {}
+        for row in rows:
+            key = tuple(row[column] for column in conflict_columns)
+            merged[key] = dict(merged.get(key, {}), **row)
+
+        groups = {}
+        for row in merged.values():
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+
+        returned = []
+        for columns, group in groups.items():
+            changing = [column for column in columns if column in update_columns]
+            for start in range(0, len(group), self.chunk_size):
+                chunk = [dict(row, created_at=now, **{column: now for column in stamp_columns})
+                         for row in group[start:start + self.chunk_size]]
+                stmt = upsert_insert(table).values(chunk)
+                if changing:
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=list(conflict_columns),
+                        set_=dict({column: stmt.excluded[column] for column in changing},
+                                  **{column: now for column in stamp_columns}),
+                        where=or_(*(table.c[column].is_distinct_from(stmt.excluded[column])
+                                    for column in changing))
+                    )
+                else:
+                    stmt = stmt.on_conflict_do_nothing(index_elements=list(conflict_columns))
+                stmt = stmt.returning(*(table.c[column] for column in conflict_columns), table.c.id,
+                                      table.c.created_at)
+                rows = db.session.execute(stmt).all()
+                log_changes(db.session, [{
+                    'entity': table.name, 'entity_id': row.id,
+                    'product_id': row.product_id if 'product_id' in conflict_columns else row.id,
+                    'op': 'insert' if row.created_at == now else 'update',
+                    'fields': None if row.created_at == now else ','.join(changing),
+                } for row in rows])
+                returned.extend(rows)
+
+        inserted = sum(1 for row in returned if row.created_at == now)
+        counts = {'inserted': inserted, 'updated': len(returned) - inserted,
+                  'unchanged': len(merged) - len(returned)}
+        for outcome, value in counts.items():
+            if value:
+                metrics.inc('catalog_upsert_rows_total', {'table': table.name, 'outcome': outcome}, value)
+        return counts, returned
+
+    def parse_product(self, index, item, subcategories):
+        """Validate one batch item; returns (natural key, product row, attributes, prices, review)"""
+        where = f'products[{index}]'
+        if not isinstance(item, dict):
+            raise UpsertError(f"{where}: expected an object")
+        unknown = sorted(set(item) - PRODUCT_KEYS)
+        if unknown:
+            raise UpsertError(f"{where}: unknown field(s) {', '.join(unknown)}")
+
+        brand = _text(item.get('brand'), f'{where}.brand', required=True)
+        name = _text(item.get('name'), f'{where}.name', required=True)
+        row = {'brand': brand, 'name': name}
+        for column in ('short_description', 'insight_snippet', 'image_url'):
+            if column in item:
+                row[column] = _text(item[column], f'{where}.{column}')
+
+        subcategory = item.get('subcategory', item.get('subcategory_id'))
+        if subcategory is not None:
+            if isinstance(subcategory, bool) or not isinstance(subcategory, (str, int)):
+                raise UpsertError(f"{where}.subcategory: expected a slug, name or id")
+            subcategory_id = subcategories.get(subcategory.lower() if isinstance(subcategory, str) else subcategory)
+            if subcategory_id is None:
+                raise UpsertError(f"{where}: unknown subcategory '{subcategory}'")
+            row['subcategory_id'] = subcategory_id
+
+        attributes = item.get('attributes') or {}
+        if isinstance(attributes, list):
+            try:
+                attributes = {entry['key']: entry['value'] for entry in attributes}
+            except (TypeError, KeyError):
+                raise UpsertError(f"{where}.attributes: expected {{key: value}} or [{{key, value}}]")
+        if not isinstance(attributes, dict):
+            raise UpsertError(f"{where}.attributes: expected {{key: value}} or [{{key, value}}]")
+        for key, value in attributes.items():
+            if value is None or isinstance(value, (dict, list)):
+                raise UpsertError(f"{where}.attributes.{key}: expected a scalar value")
+        attributes = {_text(key, f'{where}.attributes', required=True): str(value)
+                      for key, value in attributes.items()}
+
+        prices = []
+        if not isinstance(item.get('prices') or [], list):
+            raise UpsertError(f"{where}.prices: expected a list")
+        for i, price in enumerate(item.get('prices') or []):
+            price_where = f'{where}.prices[{i}]'
+            if not isinstance(price, dict):
+                raise UpsertError(f"{price_where}: expected an object")
+            value = _number(price.get('price'), f'{price_where}.price')
+            if value is None or value < 0:
+                raise UpsertError(f"{price_where}.price: expected a non-negative number")
+            prices.append({
+                'retailer_name': _text(price.get('retailer_name'), f'{price_where}.retailer_name', required=True),
+                'date_recorded': _date(price.get('date_recorded'), f'{price_where}.date_recorded'),
+                'price': value,
+            })
+
+        review = item.get('review')
+        if review is not None:
+            if not isinstance(review, dict):
+                raise UpsertError(f"{where}.review: expected an object")
+            unknown = sorted(set(review) - set(REVIEW_COLUMNS))
+            if unknown:
+                raise UpsertError(f"{where}.review: unknown field(s) {', '.join(unknown)}")
+            columns = AggregatedReview.__table__.c
+            review = {
+                column: (_number(value, f'{where}.review.{column}', type(columns[column].type))
+                         if isinstance(columns[column].type, (Float, Integer))
+                         else _text(value, f'{where}.review.{column}'))
+                for column, value in review.items()
+            }
+        return (brand, name), row, attributes, prices, review
+
+    def existing_products(self, keys):
+        """Map (brand, name) -> (id, subcategory_id) for the keys already in the catalog"""
+        keys = list(keys)
+        found = {}
+        for start in range(0, len(keys), self.chunk_size):
+            stmt = select(Product.brand, Product.name, Product.id, Product.subcategory_id).where(
+                tuple_(Product.brand, Product.name).in_(keys[start:start + self.chunk_size])
+            )
+            found.update({(brand, name): (product_id, subcategory_id)
+                          for brand, name, product_id, subcategory_id in db.session.execute(stmt)})
+        return found
+
+    def apply(self, items, routed_subcategories=None):
+        """
+        Upsert a batch of product items in one transaction
+
+        Returns per-table {'inserted', 'updated', 'unchanged'} counts; raises
+        UpsertError (before anything is written) when an item is invalid, or
+        names a subcategory in `routed_subcategories` ({id: shard name}),
+        whose products live on another database.
+        """
+        subcategories = {}
+        for subcategory_id, name in db.session.execute(select(SubCategory.id, SubCategory.name)):
+            subcategories.update({subcategory_id: subcategory_id, name.lower(): subcategory_id,
+                                  name.lower().replace(' ', '-'): subcategory_id})
+        parsed = [self.parse_product(index, item, subcategories) for index, item in enumerate(items)]
+        for index, (_, row, *_) in enumerate(parsed):
+            shard = (routed_subcategories or {}).get(row.get('subcategory_id'))
+            if shard is not None:
+                subcategory = items[index].get('subcategory', row['subcategory_id'])
+                raise UpsertError(f"products[{index}]: subcategory '{subcategory}' lives on catalog shard "
+                                  f"'{shard}'; load it into that shard's database")
+
+        try:
+            existing = self.existing_products({key for key, *_ in parsed})
+            for index, (key, row, *_) in enumerate(parsed):
+                if 'subcategory_id' in row:
+                    continue
+                if key not in existing:
+                    raise UpsertError(f"products[{index}]: a subcategory is required to create '{key[0]} {key[1]}'")
+                # The INSERT half of the upsert must satisfy NOT NULL even when it
+                # resolves to an update; the stored value compares as unchanged
+                row['subcategory_id'] = existing[key][1]
+
+            now = datetime.utcnow()
+            result = {}
+            result['products'], returned = self.upsert_rows(
+                Product.__table__, [row for _, row, *_ in parsed], ('brand', 'name'), PRODUCT_COLUMNS, now
+            )
+            ids = {key: product_id for key, (product_id, _) in existing.items()}
+            ids.update({(row.brand, row.name): row.id for row in returned})
+
+            attributes, prices, reviews = [], [], []
+            for key, _, product_attributes, product_prices, review in parsed:
+                product_id = ids[key]
+                attributes.extend({'product_id': product_id, 'key': attribute_key, 'value': value}
+                                  for attribute_key, value in product_attributes.items())
+                prices.extend(dict(price, product_id=product_id) for price in product_prices)
+                if review is not None:
+                    reviews.append(dict(review, product_id=product_id))
+
+            result['attributes'], _ = self.upsert_rows(
+                ProductAttribute.__table__, attributes, ('product_id', 'key'), ('value',), now
+            )
+            result['prices'], _ = self.upsert_rows(
+                PriceHistory.__table__, prices, ('product_id', 'retailer_name', 'date_recorded'), ('price',), now
+            )
+            result['reviews'], _ = self.upsert_rows(
+                AggregatedReview.__table__, reviews, ('product_id',), REVIEW_COLUMNS, now,
+                stamp_columns=('updated_at', 'last_updated')
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return result
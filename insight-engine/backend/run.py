@@ -1,5 +1,4 @@
 from project import create_app, db
-from project.models.models import Category, SubCategory, Product, ProductAttribute, PriceHistory, AggregatedReview
 import click
 
 app = create_app()
@@ -0,0 +1,67 @@
+"""Gap handling of settled_high_water, shared by the change feed, its followers and price alerts"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, create_engine
+from sqlalchemy.orm import Session
+
+from project.services.changes import settled_high_water
+
+SETTLE_SECONDS = 30
+
+rows = Table('rows', MetaData(), Column('id', Integer, primary_key=True), Column('created_at', DateTime))
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    rows.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def insert(session, ids, age_seconds=0):
+    created_at = datetime.utcnow() - timedelta(seconds=age_seconds)
+    session.execute(rows.insert(), [{'id': row_id, 'created_at': created_at} for row_id in ids])
+
+
+def high_water(session, since):
+    return settled_high_water(rows.c.id, rows.c.created_at, since, SETTLE_SECONDS, session)
+
+
+def test_empty_table_keeps_the_cursor(session):
+    assert high_water(session, 0) == 0
+    assert high_water(session, 7) == 7
+
+
+def test_contiguous_ids_are_read_to_the_head(session):
+    insert(session, [1, 2, 3, 4])
+    assert high_water(session, 0) == 4
+    assert high_water(session, 2) == 4
+    assert high_water(session, 4) == 4
+
+
+def test_recent_gap_holds_the_cursor_before_it(session):
+    # id 3 may belong to a transaction that has not committed yet
+    insert(session, [1, 2, 4, 5])
+    assert high_water(session, 0) == 2
+    assert high_water(session, 2) == 2
+
+
+def test_gap_is_skipped_once_the_rows_after_it_settle(session):
+    # id 3 was rolled back or deleted long ago
+    insert(session, [1, 2, 4, 5], age_seconds=SETTLE_SECONDS + 5)
+    assert high_water(session, 0) == 5
+
+
+def test_old_gap_is_skipped_up_to_a_recent_one(session):
+    insert(session, [1, 2, 4, 5], age_seconds=SETTLE_SECONDS + 5)
+    insert(session, [6, 8])
+    assert high_water(session, 0) == 6
+
+
+def test_recent_gap_after_settled_rows(session):
+    insert(session, [1, 2], age_seconds=SETTLE_SECONDS + 5)
+    insert(session, [4])
+    assert high_water(session, 0) == 2
+    assert high_water(session, 1) == 2
@@ -0,0 +1,133 @@
+"""Single-flight read endpoints: concurrent identical requests share one response"""
+import threading
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask, g, request
+
+from project.api import coalescing
+from project.api.coalescing import after_shared, coalesce, encode_shared
+
+FOLLOWERS = 3
+TIMEOUT = 5
+
+
+class CountingEvent(threading.Event):
+    """Event that counts the requests waiting on it"""
+
+    def __init__(self):
+        super().__init__()
+        self.waiters = threading.Semaphore(0)
+
+    def wait(self, timeout=None):
+        self.waiters.release()
+        return super().wait(timeout)
+
+
+@pytest.fixture
+def flights():
+    """A view app plus helpers to hold its leader request until the followers are waiting"""
+    app = Flask(__name__)  # Not in testing mode: a failing view answers 500 instead of raising
+    app.config.update(COALESCE_ENABLED=True, COALESCE_WAIT_SECONDS=TIMEOUT)
+    entered, release = threading.Event(), threading.Event()
+    calls, side_effects = [], []
+
+    @app.route('/items')
+    @coalesce
+    def items():
+        calls.append(request.args.get('q'))
+        after_shared(side_effects.append, request.args.get('q'))
+        if request.args.get('hold'):
+            entered.set()
+            assert release.wait(TIMEOUT)
+        if request.args.get('fail') and len(calls) == 1:
+            raise RuntimeError('leader failed')
+        if request.args.get('stream'):
+            return app.response_class(iter([b'streamed']), headers={'X-Call': str(len(calls))})
+        return {'q': request.args.get('q'), 'call': len(calls)}, 201, {'X-Call': str(len(calls))}
+
+    def run(query_string, followers=FOLLOWERS):
+        """Responses to one held leader and `followers` identical requests started while it runs"""
+        responses = [None] * (followers + 1)
+
+        def get(slot):
+            responses[slot] = app.test_client().get('/items', query_string=query_string)
+
+        leader = threading.Thread(target=get, args=(0,))
+        leader.start()
+        assert entered.wait(TIMEOUT)
+        key = next(iter(coalescing._flights))
+        flight = coalescing._flights[key]
+        flight.done = CountingEvent()
+        threads = [threading.Thread(target=get, args=(slot,)) for slot in range(1, followers + 1)]
+        for thread in threads:
+            thread.start()
+        for _ in threads:
+            assert flight.done.waiters.acquire(timeout=TIMEOUT)
+        release.set()
+        for thread in [leader] + threads:
+            thread.join(TIMEOUT)
+        return responses
+
+    return SimpleNamespace(app=app, run=run, calls=calls, side_effects=side_effects, entered=entered,
+                           release=release)
+
+
+def test_identical_requests_share_the_leaders_response(flights):
+    responses = flights.run({'q': 'a', 'hold': '1'})
+    assert flights.calls == ['a']
+    assert {(r.status_code, r.headers['X-Call'], r.get_data()) for r in responses} == {
+        (201, '1', responses[0].get_data())
+    }
+    assert all(r.get_json() == {'q': 'a', 'call': 1} for r in responses)
+    # Per-request side effects still run once per request
+    assert flights.side_effects == ['a'] * (FOLLOWERS + 1)
+    assert coalescing._flights == {}
+
+
+def test_different_arguments_are_not_shared(flights):
+    client = flights.app.test_client()
+    holder = threading.Thread(target=client.get, args=('/items',), kwargs={'query_string': {'q': 'a', 'hold': '1'}})
+    holder.start()
+    assert flights.entered.wait(TIMEOUT)
+    # Answered while the first request is still running
+    assert client.get('/items', query_string={'q': 'b'}).get_json() == {'q': 'b', 'call': 2}
+    flights.release.set()
+    holder.join(TIMEOUT)
+    assert flights.calls == ['a', 'b']
+
+
+def test_followers_run_the_view_when_the_leader_fails(flights):
+    responses = flights.run({'q': 'a', 'hold': '1', 'fail': '1'})
+    assert responses[0].status_code == 500
+    assert [r.status_code for r in responses[1:]] == [201] * FOLLOWERS
+    assert len(flights.calls) == FOLLOWERS + 1
+
+
+def test_streamed_responses_are_not_shared(flights):
+    responses = flights.run({'q': 'a', 'hold': '1', 'stream': '1'})
+    assert [r.get_data() for r in responses] == [b'streamed'] * (FOLLOWERS + 1)
+    assert len(flights.calls) == FOLLOWERS + 1
+
+
+def test_disabled_coalescing_runs_every_request(flights):
+    flights.app.config['COALESCE_ENABLED'] = False
+    client = flights.app.test_client()
+    assert [client.get('/items', query_string={'q': 'a'}).get_json()['call'] for _ in range(2)] == [1, 2]
+
+
+def test_shared_responses_are_encoded_once_per_encoding(flights):
+    encoded = []
+
+    def encode(data):
+        encoded.append(data)
+        return data.upper()
+
+    with flights.app.test_request_context():
+        assert encode_shared('gzip', b'body', encode) == b'BODY'
+        assert encode_shared('gzip', b'body', encode) == b'BODY'
+        assert len(encoded) == 2  # Not a shared response
+
+        g.shared_flight = coalescing._Flight()
+        results = [encode_shared(encoding, b'body', encode) for encoding in ('gzip', 'br', 'gzip', 'br')]
+        assert results == [b'BODY'] * 4 and len(encoded) == 4
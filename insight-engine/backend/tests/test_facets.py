@@ -0,0 +1,144 @@
+"""FacetIndex filtering, counting and paging against a brute-force scan of the catalog"""
+import pytest
+
+from project import db
+from project.models.models import AggregatedReview, Category, Product, ProductAttribute, SubCategory
+from project.services.facets import FacetIndex, slugify
+
+RATING_EDGES = (3, 4, 4.5)
+PRICE_EDGES = (1100, 1300)
+
+# Unrated products, an unparseable price and a non-price attribute, beside the shared catalog
+FACET_PRODUCTS = [
+    ('Steel kettle', None, {'MSRP': '1250', 'Finish': 'Steel'}),
+    ('Black kettle', 4.7, {'MSRP': '900', 'Finish': 'Black'}),
+    ('Copper kettle', 3.5, {'MSRP': 'n/a', 'Finish': 'Copper'}),
+    ('Plain kettle', None, {}),
+    ('Steel toaster', 4.2, {'MSRP': '1500', 'Finish': 'Steel'}),
+]
+
+
+def band(value, edges, keys):
+    """Which of `keys` covers `value`, comparing edge by edge"""
+    for edge, key in zip(edges, keys):
+        if value < edge:
+            return key
+    return keys[-1]
+
+
+@pytest.fixture(scope='module')
+def catalog(app):
+    """The index and, built from the same rows, each product's facet values in listing order"""
+    with app.app_context():
+        category = db.session.query(Category).filter_by(name='Appliances').one()
+        subcategory = SubCategory(name='Facet Checks', display_order=9, category=category)
+        for name, rating, attributes in FACET_PRODUCTS:
+            product = Product(brand='Facets', name=name, subcategory=subcategory)
+            product.attributes.extend(ProductAttribute(key=key, value=value) for key, value in attributes.items())
+            if rating is not None:
+                product.aggregated_review = AggregatedReview(overall_rating=rating, total_reviews_analyzed=3)
+        db.session.add(subcategory)
+        db.session.commit()
+
+        index = FacetIndex.build(rating_edges=RATING_EDGES, price_edges=PRICE_EDGES)
+        products = []
+        for product in db.session.query(Product).all():
+            rating = product.aggregated_review.overall_rating if product.aggregated_review else None
+            values = {
+                'brand': {product.brand},
+                'subcategory': {slugify(product.subcategory.name)},
+                'rating': {'unrated' if rating is None else band(rating, RATING_EDGES, ['under-3', '3-4', '4-4.5',
+                                                                                        '4.5-up'])},
+            }
+            for attribute in product.attributes:
+                if attribute.key == 'MSRP':
+                    try:
+                        price = float(attribute.value)
+                    except ValueError:
+                        continue
+                    values['price'] = {band(price, PRICE_EDGES, ['under-1100', '1100-1300', '1300-up'])}
+                else:
+                    values.setdefault(f'attr.{attribute.key}', set()).add(attribute.value)
+            rated = rating is not None
+            products.append(((rated, -rating if rated else 0.0, product.name, product.id), product.id, values))
+        products.sort()
+    return index, [(product_id, values) for _, product_id, values in products]
+
+
+def matching(products, selections, exclude=None):
+    """Ids of the products passing every selected facet, OR within a facet, in listing order"""
+    return [
+        product_id for product_id, values in products
+        if all(values.get(facet, set()) & set(selected)
+               for facet, selected in selections.items() if facet != exclude)
+    ]
+
+
+SELECTIONS = [
+    {},
+    {'brand': ['Brand 0']},
+    {'brand': ['Brand 0', 'Brand 2'], 'rating': ['4-4.5', '4.5-up']},
+    {'rating': ['unrated']},
+    {'price': ['under-1100', '1300-up'], 'subcategory': ['technology-1', 'appliances-0', 'facet-checks']},
+    {'attr.Finish': ['Steel', 'Copper']},
+    {'attr.Finish': ['Steel'], 'price': ['1100-1300'], 'rating': ['unrated']},
+    {'brand': ['No such brand']},
+]
+
+
+@pytest.mark.parametrize('selections', SELECTIONS)
+def test_ids_in_pages_through_the_brute_force_match(catalog, selections):
+    index, products = catalog
+    expected = matching(products, selections)
+    mask = index.match(selections)
+    assert mask.bit_count() == len(expected)
+    assert index.ids_in(mask, 0, len(products)) == expected
+    for per_page in (1, 4, 7):
+        pages = [index.ids_in(mask, offset, per_page) for offset in range(0, len(expected) + per_page, per_page)]
+        assert [product_id for page in pages for product_id in page] == expected
+        assert pages[-1] == []
+
+
+@pytest.mark.parametrize('selections', SELECTIONS)
+def test_counts_apply_the_other_facets_filters(catalog, selections):
+    index, products = catalog
+    counts = index.counts(selections)
+    assert set(counts) == set(index.bitmaps)
+    for facet, entries in counts.items():
+        others = matching(products, selections, exclude=facet)
+        values = {product_id: values.get(facet, set()) for product_id, values in products}
+        expected = {value: sum(value in values[product_id] for product_id in others) for value in index.bitmaps[facet]}
+        assert {entry['value']: entry['count'] for entry in entries} == {
+            value: count for value, count in expected.items()
+            if count or facet in ('rating', 'price') or value in selections.get(facet, ())
+        }
+        assert all(entry['selected'] == (entry['value'] in selections.get(facet, ())) for entry in entries)
+        if facet not in ('rating', 'price'):
+            assert [(-entry['count'], entry['value']) for entry in entries] == sorted(
+                (-entry['count'], entry['value']) for entry in entries
+            )
+
+
+def test_bands_are_listed_in_order_with_labels(catalog):
+    index, _ = catalog
+    counts = index.counts({}, ['rating', 'price'])
+    assert [entry['value'] for entry in counts['rating']] == ['under-3', '3-4', '4-4.5', '4.5-up', 'unrated']
+    assert counts['rating'][-1]['label'] == 'Not yet rated'
+    assert [entry['value'] for entry in counts['price']] == ['under-1100', '1100-1300', '1300-up']
+
+
+def test_limit_keeps_selected_values(catalog):
+    index, _ = catalog
+    counts = index.counts({'brand': ['Facets']}, ['brand'], limit=1)
+    assert [entry['value'] for entry in counts['brand']][-1] == 'Facets'
+    assert counts['brand'][-1]['selected']
+
+
+def test_unknown_facets_and_bands_are_rejected(catalog):
+    index, _ = catalog
+    with pytest.raises(ValueError, match="Unknown facet 'colour'"):
+        index.validate({'colour': ['red']})
+    with pytest.raises(ValueError, match="Unknown rating band '5-6'"):
+        index.validate({'rating': ['5-6']})
+    with pytest.raises(ValueError, match="Unknown facet 'colour'"):
+        index.counts({}, ['colour'])
@@ -0,0 +1,50 @@
+"""SQL-aggregated insights: attribute breakdowns and prices read from attribute text"""
+import pytest
+
+from project import db
+from project.models.models import Category, Product, ProductAttribute, SubCategory
+
+# Attribute keys that clash with the built-in groups, and prices that are not plain numbers
+INSIGHT_PRODUCTS = [
+    ('Brand A', {'MSRP': '1200', 'brand': 'Attribute brand', 'price_range': 'Budget'}),
+    ('Brand A', {'MSRP': '1800.50', 'brand': 'Attribute brand'}),
+    ('Brand B', {'MSRP': 'n/a', 'price_range': 'Premium'}),
+    ('Brand B', {'MSRP': '$1,500'}),
+    ('Brand B', {'MSRP': '1.2.3'}),
+]
+
+
+@pytest.fixture(scope='module')
+def subcategory(app):
+    with app.app_context():
+        category = db.session.query(Category).filter_by(name='Appliances').one()
+        subcategory = SubCategory(name='Insight Checks', display_order=9, category=category)
+        for i, (brand, attributes) in enumerate(INSIGHT_PRODUCTS):
+            product = Product(brand=brand, name=f'Insight product {i}', subcategory=subcategory)
+            product.attributes.extend(ProductAttribute(key=key, value=value) for key, value in attributes.items())
+        db.session.add(subcategory)
+        db.session.commit()
+    return 'insight-checks'
+
+
+def insights(client, **params):
+    response = client.get('/api/products/insights', query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['insights']
+
+
+def test_attribute_breakdowns_do_not_merge_into_built_in_groups(client, subcategory):
+    result = insights(client, subcategory=subcategory, breakdown='brand,price_range', buckets='1500')
+    assert result['brand_breakdown'] == {'Brand B': 3, 'Brand A': 2}
+    assert result['attribute_breakdown'] == {
+        'brand': {'Attribute brand': 2},
+        'price_range': {'Budget': 1, 'Premium': 1},
+    }
+    assert result['price_range_analysis']['price_ranges'] == {'Over $1,500': 1, 'Under $1,500': 1}
+
+
+def test_non_numeric_prices_are_left_out(client, subcategory):
+    result = insights(client, subcategory=subcategory, buckets='1000,2000')
+    analysis = result['price_range_analysis']
+    assert analysis['average_price'] == 1500.25
+    assert analysis['price_ranges'] == {'$1,000 - $2,000': 2}
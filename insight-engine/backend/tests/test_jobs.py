@@ -0,0 +1,191 @@
+"""Database job queue: claims, queue concurrency limits, retries and stale-job recovery"""
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from project import db
+from project.models.models import Job
+from project.services import jobs
+from project.services.jobs import claim_jobs, enqueue_job, job_handler, requeue_stale_jobs, retry_delay, run_job
+
+# Claim loops and job runs repeat their statements by design
+pytestmark = pytest.mark.nplusone_allowed
+
+
+@job_handler('test_flaky', queue='test')
+def flaky_job(job, report):
+    """Fails its first `fail` attempts"""
+    report('working')
+    payload = json.loads(job.payload)
+    if job.attempts <= payload['fail']:
+        raise RuntimeError(f'attempt {job.attempts} failed')
+    return {'attempts': job.attempts}
+
+
+@pytest.fixture
+def config(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'JOB_MAX_ATTEMPTS', 3)
+    monkeypatch.setitem(app.config, 'JOB_RETRY_BACKOFF_SECONDS', 10)
+    monkeypatch.setitem(app.config, 'JOB_RETRY_MAX_SECONDS', 25)
+    monkeypatch.setitem(app.config, 'JOB_QUEUE_CONCURRENCY', {'limited': 2})
+    return app.config
+
+
+def enqueue(queue, fail=0):
+    # A key per job: without one, an active job of the same kind and product would be reused
+    job, created = enqueue_job('test_flaky', payload={'fail': fail}, queue=queue, idempotency_key=uuid.uuid4().hex)
+    assert created
+    return job.id
+
+
+def make_due(job_id):
+    db.session.execute(update(Job).where(Job.id == job_id).values(run_after=datetime.utcnow()))
+    db.session.commit()
+
+
+def test_idempotency_key_returns_the_first_job(app, config):
+    with app.app_context():
+        first, created = enqueue_job('test_flaky', payload={'fail': 0}, queue='idempotent', idempotency_key='k-1')
+        again, created_again = enqueue_job('test_flaky', payload={'fail': 0}, queue='idempotent',
+                                           idempotency_key='k-1')
+        assert (created, created_again, again.id) == (True, False, first.id)
+
+        # Even once the job has finished
+        assert claim_jobs('worker', ['idempotent'], 5, config) == [first.id]
+        run_job(app, first.id)
+        db.session.expire_all()
+        reused, created = enqueue_job('test_flaky', idempotency_key='k-1')
+        assert (reused.id, reused.status, created) == (first.id, 'succeeded', False)
+
+        other, created = enqueue_job('test_flaky', payload={'fail': 0}, queue='idempotent', idempotency_key='k-2')
+        assert created and other.id != first.id
+
+
+def test_a_job_is_claimed_once(app, config):
+    with app.app_context():
+        job_id = enqueue('claimed')
+        assert claim_jobs('worker-a', ['claimed'], 5, config) == [job_id]
+        assert claim_jobs('worker-b', ['claimed'], 5, config) == []
+        job = db.session.get(Job, job_id)
+        assert (job.status, job.worker, job.attempts) == ('running', 'worker-a', 1)
+
+
+def test_a_claim_lost_to_another_worker_is_skipped(app, config, monkeypatch):
+    with app.app_context():
+        stolen, kept = enqueue('raced'), enqueue('raced')
+        config['JOB_QUEUE_CONCURRENCY']['raced'] = 5
+
+        def steal_first(queue):
+            # Another worker claims the first candidate between this worker's read and its UPDATE
+            monkeypatch.setattr(jobs, '_lock_queue', lambda queue: None)
+            db.session.execute(update(Job).where(Job.id == stolen).values(status='running', worker='worker-b'))
+        monkeypatch.setattr(jobs, '_lock_queue', steal_first)
+
+        assert claim_jobs('worker-a', ['raced'], 5, config) == [kept]
+        assert db.session.get(Job, stolen).worker == 'worker-b'
+
+
+def test_queue_concurrency_limit_spans_workers(app, config):
+    with app.app_context():
+        job_ids = [enqueue('limited') for _ in range(4)]
+        assert claim_jobs('worker-a', ['limited'], 1, config) == job_ids[:1]
+        assert claim_jobs('worker-b', ['limited'], 5, config) == job_ids[1:2]
+        assert claim_jobs('worker-c', ['limited'], 5, config) == []
+
+        run_job(app, job_ids[0])
+        assert claim_jobs('worker-c', ['limited'], 5, config) == job_ids[2:3]
+
+        # A running job that stopped heartbeating no longer holds a slot
+        stale = datetime.utcnow() - timedelta(seconds=config['JOB_STALE_SECONDS'] + 1)
+        db.session.execute(update(Job).where(Job.id == job_ids[1]).values(updated_at=stale))
+        db.session.commit()
+        assert claim_jobs('worker-c', ['limited'], 5, config) == job_ids[3:]
+
+
+def test_failed_job_retries_with_backoff_until_max_attempts(app, config):
+    with app.app_context():
+        job_id = enqueue('retried', fail=3)
+        delays = []
+        for attempt in range(1, 4):
+            assert claim_jobs('worker', ['retried'], 5, config) == [job_id]
+            before = datetime.utcnow()
+            run_job(app, job_id)
+            job = db.session.get(Job, job_id)
+            db.session.refresh(job)
+            assert (job.attempts, job.error) == (attempt, f'attempt {attempt} failed')
+            if attempt < 3:
+                assert job.status == 'queued' and job.finished_at is None
+                delays.append((job.run_after - before).total_seconds())
+                assert claim_jobs('worker', ['retried'], 5, config) == []  # Not due yet
+                make_due(job_id)
+        assert (job.status, job.finished_at is not None) == ('failed', True)
+
+        # Doubling from 10s with 50-100% jitter
+        assert 5 <= delays[0] <= 10.5 and 10 <= delays[1] <= 20.5
+        assert claim_jobs('worker', ['retried'], 5, config) == []
+
+
+def test_retry_delay_is_capped(config):
+    assert all(12.5 <= retry_delay(10, config) <= 25 for _ in range(20))
+
+
+def test_job_succeeds_on_a_later_attempt(app, config):
+    with app.app_context():
+        job_id = enqueue('recovered', fail=1)
+        claim_jobs('worker', ['recovered'], 5, config)
+        run_job(app, job_id)
+        make_due(job_id)
+        claim_jobs('worker', ['recovered'], 5, config)
+        run_job(app, job_id)
+        job = db.session.get(Job, job_id)
+        db.session.refresh(job)
+        assert (job.status, job.attempts, job.error, json.loads(job.result)) == ('succeeded', 2, None, {'attempts': 2})
+
+
+def test_stale_running_jobs_are_requeued_or_failed(app, config):
+    with app.app_context():
+        retried, exhausted, alive = enqueue('stale'), enqueue('stale'), enqueue('stale')
+        assert claim_jobs('worker', ['stale'], 5, config) == [retried, exhausted, alive]
+        stale = datetime.utcnow() - timedelta(seconds=120)
+        db.session.execute(update(Job).where(Job.id == retried).values(updated_at=stale))
+        db.session.execute(update(Job).where(Job.id == exhausted).values(updated_at=stale, attempts=Job.max_attempts))
+        db.session.commit()
+
+        assert requeue_stale_jobs(60) >= 2
+        db.session.expire_all()
+        assert db.session.get(Job, retried).status == 'queued'
+        assert db.session.get(Job, retried).error == 'Worker stopped responding'
+        assert db.session.get(Job, exhausted).status == 'failed'
+        assert db.session.get(Job, alive).status == 'running'
+
+        # A requeued job is not run by the worker that abandoned it, and is claimable again
+        run_job(app, retried)
+        assert db.session.get(Job, retried).status == 'queued'
+        assert claim_jobs('worker', ['stale'], 5, config) == [retried]
+
+
+def test_open_job_streams_are_capped(app, client, config, monkeypatch):
+    monkeypatch.setitem(config, 'JOB_STREAM_MAX_OPEN', 1)
+    with app.app_context():
+        job_id = enqueue('streamed')
+        claim_jobs('worker', ['streamed'], 5, config)
+        run_job(app, job_id)
+
+    first = client.get(f'/api/jobs/{job_id}/events')
+    assert first.status_code == 200
+    refused = client.get(f'/api/jobs/{job_id}/events')
+    assert (refused.status_code, refused.headers['Retry-After']) == (503, '5')
+    assert client.get(f'/api/jobs/{job_id}').status_code == 200
+
+    # Closing the stream, read to its end or not, frees the slot
+    assert 'event: succeeded' in first.get_data(as_text=True)
+    first.close()
+    second = client.get(f'/api/jobs/{job_id}/events')
+    assert second.status_code == 200
+    second.close()
+    third = client.get(f'/api/jobs/{job_id}/events')
+    assert third.status_code == 200
+    third.close()
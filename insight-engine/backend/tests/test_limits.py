@@ -0,0 +1,149 @@
+"""Token bucket rate limits, 429 responses and load shedding levels"""
+import threading
+
+import pytest
+from flask import Flask
+
+from project.api import limits
+from project.api.limits import DatabaseBuckets, LoadShedder, MemoryBuckets, init_rate_limits
+
+
+class Clock:
+    """Stands in for the `time` module of project.api.limits"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(limits, 'time', clock)
+    return clock
+
+
+@pytest.mark.nplusone_allowed  # The database buckets run one upsert per take
+@pytest.mark.parametrize('buckets', [MemoryBuckets, DatabaseBuckets])
+def test_bucket_spends_its_burst_then_refills_at_the_rate(app, clock, buckets):
+    with app.app_context():
+        bucket = buckets()
+        key = f'test:{buckets.__name__}'
+        assert [bucket.take(key, 2, 3, 1)[0] for _ in range(4)] == [True, True, True, False]
+
+        clock.now += 0.5  # One token back at 2 per second
+        assert bucket.take(key, 2, 3, 1) == (True, 0)
+        assert bucket.take(key, 2, 3, 1) == (False, 0)
+
+        clock.now += 0.25  # Half a token: not enough, and not lost
+        assert bucket.take(key, 2, 3, 1) == (False, 0.5)
+        clock.now += 0.25
+        assert bucket.take(key, 2, 3, 1)[0]
+
+        clock.now += 60  # Refills up to the burst, no further
+        assert bucket.take(key, 2, 3, 2) == (True, 1)
+        assert bucket.take(key, 2, 3, 2) == (False, 1)
+        assert bucket.take(f'{key}:other', 2, 3, 3) == (True, 0)
+
+
+@pytest.fixture
+def limited_app(app, clock):
+    """An app with the limiter hooks, a default and an expensive route, and an exempt one"""
+    limited = Flask(__name__)
+    limited.config.update(app.config)
+    limited.config.update(
+        RATE_LIMIT_ENABLED=True, RATE_LIMIT_STORAGE='memory', RATE_LIMITS={'default': (0.5, 4), 'expensive': (1, 1)},
+        RATE_LIMIT_ROUTE_CLASSES={'heavy': 'expensive', 'health_check': 'exempt'}, RATE_LIMIT_PROXY_COUNT=1,
+        LOAD_SHED_ENABLED=True, SHED_MAX_CONCURRENCY=4,
+    )
+    for endpoint in ('light', 'heavy', 'health_check'):
+        limited.add_url_rule(f'/{endpoint}', endpoint, lambda: {'ok': True})
+    init_rate_limits(limited)
+    return limited
+
+
+def test_exhausted_bucket_answers_429_with_retry_after(limited_app, clock):
+    client = limited_app.test_client()
+    headers = {'X-Forwarded-For': '203.0.113.7'}
+    # per_page=40 costs two default pages: two requests empty the burst of 4
+    responses = [client.get('/light?per_page=40', headers=headers) for _ in range(3)]
+    assert [response.status_code for response in responses] == [200, 200, 429]
+    assert responses[2].headers['Retry-After'] == '4'  # Two tokens at 0.5 per second
+    assert responses[2].get_json()['error'] == 'Too many requests'
+
+    clock.now += 1
+    assert client.get('/light', headers=headers).headers['Retry-After'] == '1'  # 0.5 tokens, one needed
+    clock.now += 1
+    assert client.get('/light', headers=headers).status_code == 200
+
+    # Other clients and exempt routes are not affected
+    assert client.get('/light', headers={'X-Forwarded-For': '203.0.113.8'}).status_code == 200
+    assert all(client.get('/health_check', headers=headers).status_code == 200 for _ in range(10))
+
+
+def test_route_classes_have_their_own_buckets(limited_app, clock):
+    client = limited_app.test_client()
+    assert [client.get('/heavy').status_code for _ in range(2)] == [200, 429]
+    assert client.get('/light').status_code == 200
+
+
+def test_shed_level_turns_away_the_lowest_priorities(limited_app, clock):
+    client = limited_app.test_client()
+    shedder = limited_app.extensions['rate_limits']['shedder']
+    shedder.level = 1
+    response = client.get('/heavy')
+    assert (response.status_code, response.headers['Retry-After']) == (503, '1')
+    assert client.get('/light').status_code == 200
+    assert client.get('/health_check').status_code == 200
+    assert shedder.running == 0  # Admitted requests give their slot back
+
+
+def test_standing_queue_raises_the_shed_level_one_step_per_interval(clock):
+    shedder = LoadShedder(max_concurrency=4, target=0.05, interval=0.5, max_wait=1)
+    expensive, default, write = 0, 1, 2
+
+    shedder._observe(0.2)  # A request queued for 200ms in this window
+    clock.now += 0.5
+    assert shedder.admit(expensive) == 'overload'
+    assert shedder.level == 1 and shedder.last_min == 0.2
+
+    shedder._observe(0.3)
+    clock.now += 0.5
+    assert [shedder.admit(p) for p in (expensive, default)] == ['overload', 'overload']
+    assert shedder.level == 2 == limits.SHED_MAX_LEVEL
+    assert shedder.admit(write) is None  # Writes are never shed by level
+    shedder.release()
+
+    # Windows back under target step the level down one at a time
+    clock.now += 0.5
+    assert shedder.admit(default) is None and shedder.level == 1
+    shedder.release()
+    assert shedder.admit(expensive) == 'overload'
+    clock.now += 0.5
+    assert shedder.admit(expensive) is None and shedder.level == 0
+    shedder.release()
+    assert shedder.running == 0
+
+
+def test_queued_request_gets_the_freed_slot_or_times_out(clock):
+    shedder = LoadShedder(max_concurrency=1, target=0.05, interval=0.5, max_wait=5)
+    assert shedder.admit(1) is None
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(shedder.admit(1)))
+    waiter.start()
+    while not shedder._waiters:
+        threading.Event().wait(0.001)
+    shedder.release()  # The slot passes to the waiting request
+    waiter.join(5)
+    assert results == [None] and shedder.running == 1
+
+    shedder.max_wait = 0.01
+    assert shedder.admit(2) == 'timeout'  # Waited past SHED_MAX_WAIT_MS, whatever its priority
+    assert not shedder._waiters
+    shedder.release()
+    assert shedder.running == 0
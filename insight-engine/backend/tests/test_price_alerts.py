@@ -0,0 +1,63 @@
+"""Price alert detection over inserted and repriced price rows"""
+import pytest
+
+from project import db
+from project.models.models import PriceAlert
+from project.services.price_alerts import PriceAlertDetector
+from project.services.upserts import CatalogUpserter
+
+# Each test runs the detector to completion several times
+pytestmark = pytest.mark.nplusone_allowed
+
+
+def upsert_prices(product_name, prices):
+    item = {'brand': 'Alerts', 'name': product_name, 'subcategory': 'technology-0',
+            'prices': [{'retailer_name': 'Retailer', 'price': price, 'date_recorded': day}
+                       for day, price in prices]}
+    return CatalogUpserter().apply([item])
+
+
+def alerts_for(product_name):
+    return [alert for alert in db.session.query(PriceAlert).all() if alert.product.name == product_name]
+
+
+def test_drop_on_a_new_price_row_raises_an_alert(app):
+    with app.app_context():
+        detector = PriceAlertDetector(min_observations=3, settle_seconds=0)
+        upsert_prices('Inserted', [(f'2024-02-0{day}', 1000.0) for day in range(1, 5)])
+        detector.run()
+
+        upsert_prices('Inserted', [('2024-02-05', 600.0)])
+        detector.run()
+
+        assert [(alert.kind, alert.price, alert.previous_price) for alert in alerts_for('Inserted')] == [
+            ('drop', 600.0, 1000.0)
+        ]
+
+
+def test_repricing_a_stored_row_raises_an_alert(app):
+    with app.app_context():
+        detector = PriceAlertDetector(min_observations=3, settle_seconds=0)
+        upsert_prices('Repriced', [(f'2024-03-0{day}', 1000.0) for day in range(1, 6)])
+        detector.run()
+
+        # Same product, retailer and date: the row is updated in place and keeps its id
+        result = upsert_prices('Repriced', [('2024-03-05', 300.0)])
+        assert result['prices'] == {'inserted': 0, 'updated': 1, 'unchanged': 0}
+        processed, created = detector.run()
+
+        assert (processed, created) == (1, 1)
+        assert [(alert.kind, alert.price) for alert in alerts_for('Repriced')] == [('drop', 300.0)]
+        assert detector.run() == (0, 0)
+
+
+def test_backfilled_price_only_lowers_the_minimum(app):
+    with app.app_context():
+        detector = PriceAlertDetector(min_observations=3, settle_seconds=0)
+        upsert_prices('Backfilled', [(f'2024-04-0{day}', 1000.0) for day in range(2, 7)])
+        detector.run()
+
+        upsert_prices('Backfilled', [('2024-04-01', 100.0)])
+        detector.run()
+
+        assert alerts_for('Backfilled') == []
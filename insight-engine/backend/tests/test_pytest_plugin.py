@@ -0,0 +1,96 @@
+"""The N+1 pytest plugin, run on generated test files in a separate pytest process"""
+import json
+import os
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A parent per row, each with a lazily loaded `children` relationship
+MODELS = '''
+import pytest
+from sqlalchemy import ForeignKey, create_engine
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column, relationship, selectinload
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Parent(Base):
+    __tablename__ = 'parents'
+    id: Mapped[int] = mapped_column(primary_key=True)
+    children: Mapped[list['Child']] = relationship()
+
+
+class Child(Base):
+    __tablename__ = 'children'
+    id: Mapped[int] = mapped_column(primary_key=True)
+    parent_id: Mapped[int] = mapped_column(ForeignKey('parents.id'))
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(Parent(children=[Child(), Child()]) for _ in range({parents}))
+        session.commit()
+        yield session
+'''
+
+LAZY_LOOP = '''
+def test_lazy_loads(session):
+    assert sum(len(parent.children) for parent in session.query(Parent)) == {children}
+'''
+
+
+@pytest.fixture
+def run_plugin(pytester, monkeypatch):
+    """Run pytest with the plugin on a generated test module; returns the outcome"""
+    monkeypatch.setenv('PYTHONPATH', BACKEND_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+
+    def run(body, parents=6, *args):
+        pytester.makepyfile(test_generated=MODELS.format(parents=parents) + body.format(children=2 * parents))
+        return pytester.runpytest_subprocess('-p', 'project.monitoring.pytest_plugin', '-p', 'no:cacheprovider',
+                                             *args)
+    return run
+
+
+def test_per_row_lazy_loads_fail_the_test(run_plugin):
+    result = run_plugin(LAZY_LOOP)
+    result.assert_outcomes(failed=1)
+    result.stdout.fnmatch_lines([
+        '*New N+1 query pattern(s) detected:*',
+        '*6x SELECT children.id AS children_id, children.parent_id AS children_parent_id FROM children WHERE ?*',
+    ])
+
+
+def test_repetition_below_the_threshold_passes(run_plugin):
+    run_plugin(LAZY_LOOP, 4).assert_outcomes(passed=1)
+    run_plugin(LAZY_LOOP, 4, '--nplusone-threshold=4').assert_outcomes(failed=1)
+
+
+def test_eager_loading_passes(run_plugin):
+    run_plugin('''
+def test_selectin_loads(session):
+    parents = session.query(Parent).options(selectinload(Parent.children)).all()
+    assert sum(len(parent.children) for parent in parents) == {children}
+''').assert_outcomes(passed=1)
+
+
+def test_marked_test_passes(run_plugin):
+    run_plugin('\n\n@pytest.mark.nplusone_allowed' + LAZY_LOOP).assert_outcomes(passed=1)
+
+
+def test_baseline_accepts_recorded_patterns_only(run_plugin, pytester):
+    run_plugin(LAZY_LOOP, 6, '--nplusone-update-baseline').assert_outcomes(passed=1)
+    baseline = json.loads((pytester.path / '.nplusone-baseline.json').read_text())
+    assert list(baseline) == ['test_generated.py::test_lazy_loads']
+
+    run_plugin(LAZY_LOOP).assert_outcomes(passed=1)
+    # A different repeated shape in the same test is still new
+    run_plugin(LAZY_LOOP + '''
+    for parent in session.query(Parent):
+        session.get(Child, parent.id, populate_existing=True)
+''').assert_outcomes(failed=1)
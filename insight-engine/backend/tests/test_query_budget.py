@@ -0,0 +1,20 @@
+"""Query budgets for the catalog read endpoints, independent of catalog size"""
+import pytest
+
+from project.monitoring.query_log import record_queries
+
+QUERY_BUDGETS = [
+    ('/api/products/categories', 3),
+    ('/api/products/subcategories', 2),
+    ('/api/products?per_page=20', 3),
+    ('/api/products/1', 4),
+]
+
+
+@pytest.mark.parametrize('path, budget', QUERY_BUDGETS)
+def test_read_endpoint_stays_within_query_budget(client, path, budget):
+    with record_queries() as recorder:
+        response = client.get(path)
+    assert response.status_code == 200
+    statements = '\n'.join(query.statement for query in recorder.queries)
+    assert len(recorder.queries) <= budget, f'{len(recorder.queries)} queries for {path}:\n{statements}'
@@ -0,0 +1,47 @@
+"""Loading the offline similarity index into API processes"""
+import pytest
+
+from project.services import similarity
+from project.services.similarity import SimilarityIndex, get_similarity_index
+
+# The index is built from one feature query per subcategory
+pytestmark = pytest.mark.nplusone_allowed
+
+
+@pytest.fixture
+def index_path(app, tmp_path):
+    path = str(tmp_path / 'similarity_index.npz')
+    with app.app_context():
+        index = SimilarityIndex(max_k=5)
+        index.refresh(full=True)
+        index.save(path)
+    return path
+
+
+@pytest.fixture
+def fresh_process(monkeypatch):
+    """Module state of a process that has not looked for an index yet"""
+    monkeypatch.setattr(similarity, '_index', None)
+    monkeypatch.setattr(similarity, '_index_mtime', None)
+    monkeypatch.setattr(similarity, '_last_check', None)
+
+
+def test_first_request_after_boot_loads_the_index(index_path, fresh_process, monkeypatch):
+    # time.monotonic() counts from boot: a few seconds in, it is below SIMILARITY_REFRESH_SECONDS
+    monkeypatch.setattr(similarity.time, 'monotonic', lambda: 3.0)
+    config = {'SIMILARITY_INDEX_PATH': index_path, 'SIMILARITY_REFRESH_SECONDS': 300}
+    index = get_similarity_index(config)
+    assert index is not None and len(index) > 0
+    assert get_similarity_index(config) is index
+
+
+def test_missing_index_is_checked_again_after_the_interval(index_path, fresh_process, monkeypatch, tmp_path):
+    now = [3.0]
+    monkeypatch.setattr(similarity.time, 'monotonic', lambda: now[0])
+    config = {'SIMILARITY_INDEX_PATH': str(tmp_path / 'missing.npz'), 'SIMILARITY_REFRESH_SECONDS': 300}
+    assert get_similarity_index(config) is None
+    config['SIMILARITY_INDEX_PATH'] = index_path
+    now[0] = 100.0
+    assert get_similarity_index(config) is None  # Within the interval
+    now[0] = 400.0
+    assert get_similarity_index(config) is not None
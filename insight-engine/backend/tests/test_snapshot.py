@@ -0,0 +1,145 @@
+"""Catalog snapshots list products exactly as the database listing of GET /api/products does"""
+import pytest
+
+from project import db
+from project.models.models import AggregatedReview, Category, Product, SubCategory
+from project.services import shared_snapshot
+from project.services.shared_snapshot import MappedCatalogSnapshot, get_shared_snapshot, write_shared_snapshot
+from project.services.snapshot import CatalogSnapshot
+
+# Every page of every listing is read once per source
+pytestmark = pytest.mark.nplusone_allowed
+
+# Unrated products, rating ties and names shared across brands exercise every key of the listing order
+PARITY_PRODUCTS = [('Zeta', None), ('Alpha', None), ('Alpha', None), ('Beta', 4.5), ('Alpha', 4.5),
+                   ('Alpha', 4.5), ('Gamma', 2.0), ('Beta', 2.0), ('Delta', 5.0)]
+
+
+@pytest.fixture(scope='module')
+def parity_subcategory(app):
+    with app.app_context():
+        category = db.session.query(Category).filter_by(name='Technology').one()
+        subcategory = SubCategory(name='Snapshot Parity', display_order=9, category=category)
+        for i, (name, rating) in enumerate(PARITY_PRODUCTS):
+            product = Product(brand=f'Parity {i}', name=name, subcategory=subcategory, short_description=f'Item {i}')
+            if rating is not None:
+                product.aggregated_review = AggregatedReview(overall_rating=rating, total_reviews_analyzed=5)
+        db.session.add(subcategory)
+        db.session.commit()
+    return 'snapshot-parity'
+
+
+@pytest.fixture
+def snapshot_config(app, monkeypatch):
+    # Rebuilt on every request, so each listing reflects the database it is compared with
+    monkeypatch.setitem(app.config, 'CATALOG_SNAPSHOT_REFRESH_SECONDS', 0)
+    monkeypatch.setitem(app.config, 'CATALOG_SNAPSHOT_REBUILD_SECONDS', 0)
+    monkeypatch.setitem(app.config, 'CATALOG_SNAPSHOT_SHARED_PATH', '')
+    return app.config
+
+
+def listing(client, **params):
+    """Every product of a listing, page by page, as the API returns them"""
+    products, page = [], 1
+    while True:
+        response = client.get('/api/products', query_string=dict(params, page=page, per_page=7))
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        products.extend(body['products'])
+        if not body['pagination']['has_next']:
+            return body['pagination']['total'], products
+        page += 1
+
+
+def listings_by_source(app, client, config, monkeypatch, tmp_path, **params):
+    monkeypatch.setitem(config, 'CATALOG_SNAPSHOT_ENABLED', False)
+    database = listing(client, **params)
+
+    monkeypatch.setitem(config, 'CATALOG_SNAPSHOT_ENABLED', True)
+    in_process = listing(client, **params)
+
+    path = str(tmp_path / 'catalog.snap')
+    with app.app_context():
+        write_shared_snapshot(CatalogSnapshot.build(), path)
+    monkeypatch.setitem(config, 'CATALOG_SNAPSHOT_SHARED_PATH', path)
+    shared = listing(client, **params)
+    return database, in_process, shared
+
+
+@pytest.mark.parametrize('params', [{}, {'subcategory': 'snapshot-parity'}, {'subcategory': 'appliances-2'},
+                                    {'subcategory': 'no-such-subcategory'}])
+def test_snapshots_match_the_database_listing(app, client, snapshot_config, monkeypatch, tmp_path,
+                                              parity_subcategory, params):
+    database, in_process, shared = listings_by_source(app, client, snapshot_config, monkeypatch, tmp_path, **params)
+    assert in_process == database
+    assert shared == database
+
+
+def test_parity_listing_order(app, client, snapshot_config, monkeypatch, parity_subcategory):
+    monkeypatch.setitem(snapshot_config, 'CATALOG_SNAPSHOT_ENABLED', True)
+    _, products = listing(client, subcategory=parity_subcategory)
+    # Unrated first, then rating descending, name, and id among equal names
+    assert [(p['name'], p['overall_rating']) for p in products] == [
+        ('Alpha', None), ('Alpha', None), ('Zeta', None), ('Delta', 5.0), ('Alpha', 4.5), ('Alpha', 4.5),
+        ('Beta', 4.5), ('Beta', 2.0), ('Gamma', 2.0)
+    ]
+    alphas = [p['id'] for p in products if p['name'] == 'Alpha']
+    assert alphas[:2] == sorted(alphas[:2]) and alphas[2:] == sorted(alphas[2:])
+
+
+def test_applied_changes_keep_the_database_order(app, parity_subcategory):
+    with app.app_context():
+        snapshot = CatalogSnapshot.build()
+        products = db.session.query(Product).filter(Product.brand.like('Parity %')).order_by(Product.id).all()
+        products[0].name = 'Aardvark'
+        products[1].aggregated_review = AggregatedReview(overall_rating=4.5, total_reviews_analyzed=1)
+        products[3].aggregated_review.overall_rating = None
+        db.session.commit()
+
+        updated = snapshot.apply_changes()
+        assert updated.seq > snapshot.seq
+        rebuilt = CatalogSnapshot.build()
+        for name in (None, 'Snapshot Parity'):
+            page = updated.paginate(name, 1, 100)
+            expected = rebuilt.paginate(name, 1, 100)
+            assert [r.to_dict() for r in page.items] == [r.to_dict() for r in expected.items]
+            assert page.total == expected.total
+
+        # The database listing agrees with the rebuilt snapshot
+        ids = [product_id for (product_id,) in (
+            db.session.query(Product.id).outerjoin(AggregatedReview)
+            .filter(Product.subcategory.has(name='Snapshot Parity'))
+            .order_by(AggregatedReview.overall_rating.is_(None).desc(), AggregatedReview.overall_rating.desc(),
+                      Product.name, Product.id)
+        )]
+        assert list(updated.by_subcategory['Snapshot Parity']) == ids
+
+
+def test_mapped_snapshot_reads_back_every_record(app, tmp_path, parity_subcategory):
+    with app.app_context():
+        snapshot = CatalogSnapshot.build()
+    path = str(tmp_path / 'catalog.snap')
+    write_shared_snapshot(snapshot, path)
+    mapped = MappedCatalogSnapshot(path)
+    assert mapped.seq == snapshot.seq and len(mapped) == len(snapshot)
+    assert [mapped[row].to_dict() for row in mapped.order] == [
+        snapshot.records[product_id].to_dict() for product_id in snapshot.order
+    ]
+    assert {name: list(rows) for name, rows in mapped.by_subcategory.items()} == {
+        name or '': [list(snapshot.order).index(product_id) for product_id in ids]
+        for name, ids in snapshot.by_subcategory.items()
+    }
+
+
+def test_first_request_after_boot_maps_the_shared_snapshot(app, tmp_path, monkeypatch):
+    path = str(tmp_path / 'catalog.snap')
+    with app.app_context():
+        write_shared_snapshot(CatalogSnapshot.build(), path)
+    monkeypatch.setattr(shared_snapshot, '_mapped', None)
+    monkeypatch.setattr(shared_snapshot, '_mapped_checked_at', None)
+    # time.monotonic() counts from boot: a second in, it is below CATALOG_SNAPSHOT_REFRESH_SECONDS
+    monkeypatch.setattr(shared_snapshot.time, 'monotonic', lambda: 1.0)
+    config = {'CATALOG_SNAPSHOT_SHARED_PATH': path, 'CATALOG_SNAPSHOT_REFRESH_SECONDS': 2}
+    mapped = get_shared_snapshot(config)
+    assert mapped is not None and mapped.path == path
+    assert get_shared_snapshot(config) is mapped
@@ -0,0 +1,8 @@
+"""App startup stays free of the heavy ingestion/NLP dependencies"""
+from benchmarks.startup import FORBIDDEN_AT_STARTUP, measure_once
+
+
+def test_create_app_imports_no_heavy_modules():
+    _, modules = measure_once(importtime=True)
+    loaded = sorted({name.split('.')[0] for name in modules} & set(FORBIDDEN_AT_STARTUP))
+    assert not loaded, f"imported at startup: {', '.join(loaded)}"
@@ -0,0 +1,54 @@
+"""Access log levels and log sampling"""
+import atexit
+import logging
+import time
+
+import pytest
+from flask import Flask
+
+from project.monitoring.structured_logging import SamplingFilter, init_logging
+
+
+def record(name, level, **extra):
+    record = logging.LogRecord(name, level, __file__, 0, 'message', (), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_sampling_keeps_errors_and_flagged_records():
+    sampler = SamplingFilter({'app.access': 0.0})
+    assert not sampler.filter(record('app.access', logging.INFO))
+    assert not sampler.filter(record('app.access', logging.WARNING))
+    assert sampler.filter(record('app.access', logging.WARNING, _always_keep=True))
+    assert sampler.filter(record('app.access', logging.ERROR))
+    assert sampler.filter(record('app.other', logging.INFO))
+
+
+@pytest.fixture
+def logged_app(app, tmp_path):
+    """An app with the logging hooks and every access record sampled out unless kept"""
+    logged = Flask('access_check')
+    logged.config.update(app.config)
+    logged.config.update(LOG_DIR=str(tmp_path), LOG_SAMPLING='access_check.access=0', LOG_SLOW_REQUEST_MS=50)
+    logged.add_url_rule('/ok', 'ok', lambda: 'ok')
+    logged.add_url_rule('/slow', 'slow', lambda: time.sleep(0.06) or 'slow')
+    logged.add_url_rule('/missing', 'missing', lambda: ('missing', 404))
+    logged.add_url_rule('/broken', 'broken', lambda: ('broken', 503))
+    listener = init_logging(logged)
+    yield logged
+    listener.stop()
+    atexit.unregister(listener.stop)
+
+
+def test_server_errors_and_slow_requests_survive_sampling(logged_app, caplog):
+    kept = []
+    handler = logged_app.logger.handlers[-1]
+    handler.enqueue = kept.append  # Records that passed the handler's filters
+    client = logged_app.test_client()
+    with caplog.at_level(logging.INFO, logger='access_check.access'):
+        for path in ('/ok', '/slow', '/missing', '/broken'):
+            client.get(path)
+    levels = {r.getMessage(): r.levelname for r in caplog.records if r.name == 'access_check.access'}
+    assert levels == {'GET /ok 200': 'INFO', 'GET /slow 200': 'WARNING', 'GET /missing 404': 'INFO',
+                      'GET /broken 503': 'ERROR'}
+    assert sorted(r.getMessage() for r in kept) == ['GET /broken 503', 'GET /slow 200']
@@ -0,0 +1,156 @@
+"""Bulk upserts: POST /api/products/bulk and CatalogUpserter"""
+import pytest
+
+from project import db
+from project.models.models import Product, SubCategory
+from project.services.upserts import CatalogUpserter, UpsertError
+
+API_KEY = 'test-write-key'
+HEADERS = {'Authorization': f'Bearer {API_KEY}'}
+
+
+@pytest.fixture
+def write_client(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'WRITE_API_KEYS', [API_KEY])
+    return client
+
+
+def product_item(name, **fields):
+    item = {'brand': 'Upserts', 'name': name, 'subcategory': 'appliances-1', 'short_description': 'First',
+            'attributes': {'MSRP': '2000', 'Finish': 'Steel'},
+            'prices': [{'retailer_name': 'Shop', 'price': 1999.0, 'date_recorded': '2024-05-01'}],
+            'review': {'overall_rating': 4.2, 'total_reviews_analyzed': 20}}
+    item.update(fields)
+    return item
+
+
+def stored(app, name):
+    with app.app_context():
+        return db.session.query(Product).filter_by(brand='Upserts', name=name).one_or_none()
+
+
+def test_write_api_is_disabled_without_keys(client):
+    response = client.post('/api/products/bulk', json={'products': [product_item('Disabled')]}, headers=HEADERS)
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize('headers', [{}, {'Authorization': 'Bearer wrong'}, {'X-API-Key': 'wrong'}])
+def test_bulk_requires_a_valid_key(write_client, headers):
+    response = write_client.post('/api/products/bulk', json={'products': [product_item('Unauthorized')]},
+                                 headers=headers)
+    assert response.status_code == 401
+    assert response.headers['WWW-Authenticate'] == 'Bearer'
+
+
+def test_bulk_accepts_the_x_api_key_header(write_client):
+    response = write_client.post('/api/products/bulk', json={'products': [product_item('Header key')]},
+                                 headers={'X-API-Key': API_KEY})
+    assert response.status_code == 200
+
+
+@pytest.mark.nplusone_allowed  # One change log insert per table and batch, over several batches
+def test_bulk_counts_inserted_updated_and_unchanged_rows(app, write_client):
+    def send(item):
+        response = write_client.post('/api/products/bulk', json={'products': [item]}, headers=HEADERS)
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()['result']
+
+    created = send(product_item('Counted'))
+    assert created['products'] == {'inserted': 1, 'updated': 0, 'unchanged': 0}
+    assert created['attributes'] == {'inserted': 2, 'updated': 0, 'unchanged': 0}
+    assert created['prices'] == {'inserted': 1, 'updated': 0, 'unchanged': 0}
+    assert created['reviews'] == {'inserted': 1, 'updated': 0, 'unchanged': 0}
+    first_updated_at = stored(app, 'Counted').updated_at
+
+    # Replaying the same item rewrites nothing
+    replayed = send(product_item('Counted'))
+    assert all(counts == {'inserted': 0, 'updated': 0, 'unchanged': counts['unchanged']}
+               for counts in replayed.values())
+    assert replayed['attributes']['unchanged'] == 2
+    assert stored(app, 'Counted').updated_at == first_updated_at
+
+    changed = send(product_item(
+        'Counted', short_description='Second', attributes={'MSRP': '2100', 'Finish': 'Steel'},
+        prices=[{'retailer_name': 'Shop', 'price': 1899.0, 'date_recorded': '2024-05-01'},
+                {'retailer_name': 'Shop', 'price': 1850.0, 'date_recorded': '2024-05-02'}]
+    ))
+    assert changed['products'] == {'inserted': 0, 'updated': 1, 'unchanged': 0}
+    assert changed['attributes'] == {'inserted': 0, 'updated': 1, 'unchanged': 1}
+    assert changed['prices'] == {'inserted': 1, 'updated': 1, 'unchanged': 0}
+    assert changed['reviews'] == {'inserted': 0, 'updated': 0, 'unchanged': 1}
+
+    product = stored(app, 'Counted')
+    assert product.short_description == 'Second'
+    assert product.updated_at > first_updated_at
+
+
+@pytest.mark.nplusone_allowed  # One change log insert per table and batch, over several batches
+def test_update_from_null_is_a_change(app):
+    # `NULL != 'a.png'` is NULL rather than true: only IS DISTINCT FROM sees changes to or from NULL
+    with app.app_context():
+        upserter = CatalogUpserter()
+        assert upserter.apply([product_item('Nullable')])['products']['inserted'] == 1
+        assert upserter.apply([product_item('Nullable', image_url='a.png')])['products']['updated'] == 1
+        assert upserter.apply([product_item('Nullable', image_url=None)])['products']['updated'] == 1
+        assert upserter.apply([product_item('Nullable', image_url=None)])['products']['unchanged'] == 1
+        assert db.session.query(Product.image_url).filter_by(name='Nullable').scalar() is None
+
+
+@pytest.mark.nplusone_allowed  # One change log insert per table and batch, over several batches
+def test_omitted_fields_keep_their_values(app):
+    with app.app_context():
+        upserter = CatalogUpserter()
+        upserter.apply([product_item('Partial', image_url='kept.png')])
+        result = upserter.apply([{'brand': 'Upserts', 'name': 'Partial', 'attributes': {'Colour': 'Red'}}])
+        assert result['products'] == {'inserted': 0, 'updated': 0, 'unchanged': 1}
+        product = db.session.query(Product).filter_by(name='Partial').one()
+        assert product.image_url == 'kept.png'
+        assert {attribute.key for attribute in product.attributes} == {'MSRP', 'Finish', 'Colour'}
+
+
+@pytest.mark.parametrize('item, message', [
+    ({'name': 'No brand', 'subcategory': 'appliances-1'}, 'products[1].brand: expected a non-empty string'),
+    (product_item('Unknown field', colour='red'), 'products[1]: unknown field(s) colour'),
+    (product_item('Unknown subcategory', subcategory='nope'), "products[1]: unknown subcategory 'nope'"),
+    (product_item('Bad subcategory', subcategory=[1]), 'products[1].subcategory: expected a slug, name or id'),
+    (product_item('Boolean subcategory', subcategory=True), 'products[1].subcategory: expected a slug, name or id'),
+    (product_item('Bad price', prices=[{'retailer_name': 'Shop', 'price': '10'}]),
+     'products[1].prices[0].price: expected a number'),
+    (product_item('Negative price', prices=[{'retailer_name': 'Shop', 'price': -1}]),
+     'products[1].prices[0].price: expected a non-negative number'),
+    (product_item('Bad date', prices=[{'retailer_name': 'Shop', 'price': 1, 'date_recorded': '05/01/2024'}]),
+     'products[1].prices[0].date_recorded: expected an ISO date (YYYY-MM-DD)'),
+    (product_item('Bad attribute', attributes={'MSRP': None}), 'products[1].attributes.MSRP: expected a scalar value'),
+    (product_item('Bad review', review={'stars': 5}), 'products[1].review: unknown field(s) stars'),
+    ({'brand': 'Upserts', 'name': 'New without subcategory'},
+     "products[1]: a subcategory is required to create 'Upserts New without subcategory'"),
+])
+def test_invalid_item_rejects_the_whole_batch(app, write_client, item, message):
+    batch = [product_item('Valid neighbour'), item]
+    response = write_client.post('/api/products/bulk', json={'products': batch}, headers=HEADERS)
+    assert response.status_code == 400
+    assert response.get_json()['message'] == message
+    assert stored(app, 'Valid neighbour') is None
+
+
+@pytest.mark.parametrize('body', [{}, {'products': []}, {'products': 'x'}, None])
+def test_bulk_rejects_a_body_without_products(write_client, body):
+    response = write_client.post('/api/products/bulk', json=body, headers=HEADERS)
+    assert response.status_code == 400
+
+
+def test_bulk_rejects_oversized_batches(app, write_client, monkeypatch):
+    monkeypatch.setitem(app.config, 'BULK_MAX_PRODUCTS', 2)
+    batch = [product_item(f'Oversized {i}') for i in range(3)]
+    response = write_client.post('/api/products/bulk', json={'products': batch}, headers=HEADERS)
+    assert response.status_code == 413
+
+
+def test_items_in_a_routed_subcategory_are_rejected(app):
+    with app.app_context():
+        subcategory_id = db.session.query(SubCategory.id).filter_by(name='Technology 2').scalar()
+        item = product_item('Routed', subcategory='technology-2')
+        with pytest.raises(UpsertError, match="subcategory 'technology-2' lives on catalog shard 'tech'"):
+            CatalogUpserter().apply([product_item('Routed neighbour'), item],
+                                    routed_subcategories={subcategory_id: 'tech'})
+        assert db.session.query(Product).filter(Product.name.in_(['Routed', 'Routed neighbour'])).count() == 0
@@ -130,10 +130,15 @@ const CategorySlider = () => {
     const fetchCategories = async () => {
       try {
         setLoading(true);
-        const response = await apiService.getCategories();
+        const { categories } = await apiService.query({
+          categories: {
+            fields: ['name', 'description', 'icon_svg', 'status'],
+            subcategories: { fields: ['name', 'status', 'product_count'] }
+          }
+        });
         
         // Transform backend data to match original CategorySlider format
-        const transformedCategories = response.categories.map(category => {
+        const transformedCategories = categories.map(category => {
           // Get gradient color based on category name
           const gradients = {
             'Technology': 'from-blue-500 to-purple-600',
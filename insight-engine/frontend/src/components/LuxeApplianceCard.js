@@ -65,7 +65,7 @@ const LuxeApplianceCard = ({ appliance, onRefresh }) => {
       }
       
       // Show success message
-      alert(`Reviews refreshed! Found ${result.total_reviews} reviews in ${result.search_time}s`);
+      alert(`Reviews refreshed! Analyzed ${result.posts_fetched} Reddit posts`);
       
     } catch (error) {
       console.error('Error refreshing reviews:', error);
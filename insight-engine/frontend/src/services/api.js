@@ -57,6 +57,27 @@ class ApiService {
     }
   }
 
+  /**
+   * Compare products side by side; attributes, ratings and latest prices come back
+   * aligned as rows with one value per product
+   * @param {number[]} ids - Product IDs, in column order
+   */
+  async compareProducts(ids) {
+    try {
+      const response = await fetch(`${API_BASE_URL}/products/compare?ids=${ids.join(',')}`);
+      const data = await response.json();
+
+      if (response.ok) {
+        return data;
+      } else {
+        throw new Error(data.message || data.error || 'Failed to compare products');
+      }
+    } catch (error) {
+      console.error('Error comparing products:', error);
+      throw error;
+    }
+  }
+
   /**
    * Get all available categories with subcategories
    */
@@ -95,6 +116,51 @@ class ApiService {
     }
   }
 
+  /**
+   * Fetch several resources in one round-trip
+   * @param {Object} selections - {alias: selection}, e.g.
+   *   { categories: { subcategories: { fields: ['name', 'slug', 'product_count'] } },
+   *     aiTools: { root: 'products', args: { subcategory: 'ai-tools' }, fields: ['name', 'overall_rating'] } }
+   * @returns {Object} {alias: result}
+   */
+  async query(selections) {
+    try {
+      const response = await fetch(`${API_BASE_URL}/query`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(selections)
+      });
+      const data = await response.json();
+
+      if (response.ok) {
+        return data.data;
+      } else {
+        throw new Error(data.message || data.error || 'Failed to run query');
+      }
+    } catch (error) {
+      console.error('Error running query:', error);
+      throw error;
+    }
+  }
+
+  /**
+   * Get one page of a subcategory's products with their attributes, in one batched query
+   * @param {string} subcategory - Subcategory slug (e.g., 'ai-tools', 'luxury-appliances')
+   * @returns {Object} {items, page, pages, per_page, total}
+   */
+  async getProductsWithAttributes(subcategory) {
+    const { products } = await this.query({
+      products: {
+        root: 'products',
+        args: { subcategory },
+        fields: ['id', 'name', 'brand', 'short_description', 'insight_snippet', 'overall_rating',
+                 'subcategory_name', 'created_at', 'updated_at'],
+        attributes: { fields: ['key', 'value'] }
+      }
+    });
+    return products;
+  }
+
   // Legacy compatibility methods - these maintain the old API for existing components
   
   /**
@@ -103,10 +169,10 @@ class ApiService {
    */
   async getAITools() {
     try {
-      const response = await this.getProducts('ai-tools');
+      const response = await this.getProductsWithAttributes('ai-tools');
       // Transform the response to match the old format expected by frontend
       // Return just the array, not wrapped in success/data object
-      return response.products.map(product => ({
+      return response.items.map(product => ({
         id: product.id,
         name: product.name,
         website: product.brand, // Using brand as website for now
@@ -165,10 +231,10 @@ class ApiService {
    */
   async getLuxeAppliances() {
     try {
-      const response = await this.getProducts('luxury-appliances');
+      const response = await this.getProductsWithAttributes('luxury-appliances');
       
       // Return just the array, not wrapped in success/data object
-      return response.products.map(product => ({
+      return response.items.map(product => ({
         id: product.id,
         name: product.name,
         brand: product.brand,
@@ -257,9 +323,52 @@ class ApiService {
     return { success: false, error: 'Feature not yet implemented' };
   }
 
-  async refreshReviews(productId) {
-    console.warn('Refresh reviews not yet implemented in new backend');
-    return { success: false, error: 'Feature not yet implemented' };
+  /**
+   * Refresh a product's Reddit reviews in the background
+   * @param {number} productId - Product ID
+   * @param {Function} onProgress - Called with {status, stage, progress} as the refresh advances
+   * @returns {Object} The job result once the refresh has finished
+   */
+  async refreshReviews(productId, onProgress = () => {}) {
+    try {
+      const response = await fetch(`${API_BASE_URL}/products/${productId}/reviews/refresh`, { method: 'POST' });
+      const data = await response.json();
+
+      if (!response.ok) {
+        throw new Error(data.message || data.error || 'Failed to start review refresh');
+      }
+      return await this.followJob(data.job.id, onProgress);
+    } catch (error) {
+      console.error('Error refreshing reviews:', error);
+      throw error;
+    }
+  }
+
+  /**
+   * Follow a background job's server-sent events until it finishes
+   * @param {string} jobId - Job ID returned when the job was started
+   * @param {Function} onProgress - Called with every progress event
+   * @returns {Promise<Object>} Resolves with the job result, rejects with its error
+   */
+  followJob(jobId, onProgress = () => {}) {
+    return new Promise((resolve, reject) => {
+      const source = new EventSource(`${API_BASE_URL}/jobs/${jobId}/events`);
+      source.addEventListener('progress', (event) => onProgress(JSON.parse(event.data)));
+      source.addEventListener('succeeded', (event) => {
+        source.close();
+        resolve(JSON.parse(event.data).result);
+      });
+      source.addEventListener('failed', (event) => {
+        source.close();
+        reject(new Error(JSON.parse(event.data).error));
+      });
+      // Dropped connections reconnect on their own; a refused one (e.g. 404) closes the source
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+          reject(new Error('Lost connection to job progress'));
+        }
+      };
+    });
   }
 
   async getLuxeReviews(productId) {
@@ -274,9 +383,8 @@ class ApiService {
     }
   }
 
-  async refreshLuxeReviews(productId) {
-    console.warn('Refresh luxury reviews not yet implemented in new backend');
-    return { success: false, error: 'Feature not yet implemented' };
+  async refreshLuxeReviews(productId, onProgress = () => {}) {
+    return this.refreshReviews(productId, onProgress);
   }
 
   async getDesignInsights() {